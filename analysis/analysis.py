@@ -9,7 +9,13 @@ This module is too long, but that's okay for now -- we're shortly going to refac
 import statistics
 import math
 import csv
+import datetime
+import json
+import os
+import struct
+import sys
 import unittest
+from array import array
 from ast import literal_eval
 from pathlib import Path
 from statistics import stdev
@@ -34,6 +40,153 @@ def load_data_csv(csv_path: Path):
             out_data.append(row)
     return out_data
 
+# Arrays of the fixed-size column types of an .rcol file, and their typecodes
+RCOL_TYPECODES = {
+    'int': 'q',
+    'datetime': 'q',
+    'float': 'd',
+    'bool': 'b',
+}
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+# Converters from exported values to Python, by column type (see _decode_value)
+EXPORT_DECODERS = {
+    'int': int,
+    'float': float,
+    'bool': lambda value: value in (1, 'True'),
+    'json': json.loads,
+    'int_list': json.loads,
+    'uuid': lambda value: value or None,
+    'str': str,
+}
+
+
+def _decode_value(column_type, value):
+    """
+    Converts one value of an exported column, as read from an .rcol file (str for the
+    text types, int for datetimes) or a CSV file (always str), to its Python type
+    """
+    if column_type == 'datetime':
+        if isinstance(value, int):
+            return EPOCH + datetime.timedelta(microseconds=value)
+        return datetime.datetime.fromisoformat(value)
+    return EXPORT_DECODERS[column_type](value)
+
+
+def _read_array(typecode, data):
+    """ Reads a little-endian array from bytes """
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _decode_rcol_column(column_type, row_count, data):
+    """
+    Decodes one column of an .rcol file (the format is described in the backend's
+    apps/readings/export.py)
+    :return: list of the column's values
+    """
+    if column_type in RCOL_TYPECODES:
+        values = _read_array(RCOL_TYPECODES[column_type], data).tolist()
+        if column_type == 'float':
+            return values
+        return [_decode_value(column_type, value) for value in values]
+
+    offsets_size = (row_count + 1) * 8
+    offsets = _read_array('q', data[:offsets_size])
+    if column_type == 'int_list':
+        values = _read_array('i', data[offsets_size:]).tolist()
+        return [values[start:end] for start, end in zip(offsets, offsets[1:])]
+    text = data[offsets_size:]
+    return [
+        _decode_value(column_type, text[start:end].decode('utf-8'))
+        for start, end in zip(offsets, offsets[1:])
+    ]
+
+
+def _read_rcol_header(rcol_file, rcol_path):
+    """
+    Reads the header of an .rcol file, leaving the file at the start of its first column
+    :return: dict, the header
+    """
+    if rcol_file.read(5) != b'RCOL\x01':
+        raise ValueError(f'{rcol_path} is not an .rcol file')
+    header_size = struct.unpack('<I', rcol_file.read(4))[0]
+    return json.loads(rcol_file.read(header_size))
+
+
+def load_rcol(rcol_path: Path, columns=None):
+    """
+    Reads one part of an exported table from an .rcol file, a column at a time (the
+    header gives the size of each column, so the columns not asked for are skipped)
+    :param Path rcol_path: path to the .rcol file
+    :param columns: iterable of the names of the columns to read (by default, all of them)
+    :return: Dict[str, list], the values of each column, in the order of the file
+    """
+    out_columns = {}
+    with open(str(rcol_path), 'rb') as rcol_file:
+        header = _read_rcol_header(rcol_file, rcol_path)
+        wanted = None if columns is None else set(columns)
+        for column in header['columns']:
+            if wanted is None or column['name'] in wanted:
+                out_columns[column['name']] = _decode_rcol_column(
+                    column['type'], header['rows'], rcol_file.read(column['size'])
+                )
+            else:
+                rcol_file.seek(column['size'], os.SEEK_CUR)
+    return out_columns
+
+
+def iter_export(export_path: Path, table, file_format='rcol', columns=None):
+    """
+    Yields the rows of a table exported from the Rereading app by its export_reading_data
+    command, reading one part of it at a time
+    :param Path export_path: path to the directory of the export
+    :param str table: 'segment_data', 'segment_responses' or 'document_responses'
+    :param str file_format: which files of the export to read, 'rcol' or 'csv'
+    :param columns: iterable of the names of the columns to read (by default, all of them)
+    :return: Iterator[dict], one per row, with values of the types the export's manifest lists
+    """
+    export_path = Path(export_path)
+    with open(str(export_path / 'manifest.json')) as manifest_file:
+        manifest = json.load(manifest_file)
+    entry = manifest['tables'][table]
+    column_types = dict(entry['columns'])
+    if columns is not None:
+        columns = list(columns)
+        unknown = [name for name in columns if name not in column_types]
+        if unknown:
+            raise ValueError(f'{table} has no columns {", ".join(unknown)}')
+
+    for part in entry['parts']:
+        part_path = export_path / table / f'{part}.{file_format}'
+        if file_format == 'rcol':
+            part_columns = load_rcol(part_path, columns)
+            for row in zip(*part_columns.values()):
+                yield dict(zip(part_columns, row))
+        else:
+            with open(str(part_path), newline='', encoding='utf-8') as csv_file:
+                for row in csv.DictReader(csv_file):
+                    yield {
+                        name: _decode_value(column_types[name], value)
+                        for name, value in row.items()
+                        if columns is None or name in columns
+                    }
+
+
+def load_export(export_path: Path, table, file_format='rcol', columns=None):
+    """
+    Loads a table exported from the Rereading app by its export_reading_data command,
+    e.g. load_export(Path('export'), 'segment_data', columns=['id', 'view_time'])
+    (iter_export() reads the same rows without holding all of them at once)
+    :return: List[dict], one per row, with values of the types the export's manifest lists
+    """
+    return list(iter_export(export_path, table, file_format, columns))
+
+
 def clean_resp_strings(dataset):
     """
     Removes punctuation from responses in dataset and makes all characters lowercase.
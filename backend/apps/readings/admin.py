@@ -1,9 +1,20 @@
 """
 This file controls the administrative interface for the
 Rereading project's "readings" app.
+
+The student data tables grow by a row for every segment a student reads, so their admin
+pages only ever load one page of rows, with the related objects their columns show
+joined in (list_select_related), instead of loading every row or making a query per row.
 """
 
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, IntegerField
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+
+from .counters import aggregate_per_parent
 from .models import (
     Student,
     Document,
@@ -18,6 +29,88 @@ from .models import (
 )
 
 
+################################################################################
+# Pagination for large tables
+################################################################################
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator that, on PostgreSQL, takes the number of rows of an unfiltered list from
+    the planner's statistics instead of counting them: an exact count reads the whole table
+    """
+    # Below this many rows (or with no statistics yet), counting is cheap enough
+    estimate_above = 10_000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if connection.vendor == 'postgresql' and query is not None and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [self.object_list.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row is not None and row[0] > self.estimate_above:
+                return int(row[0])
+        return super().count
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    An inline formset holding one page of the related objects;
+    PaginatedTabularInline.get_formset() sets the page size and number
+    """
+    per_page = 20
+    page_param = 'page'
+    page_number = 1
+
+    def get_queryset(self):
+        # pylint: disable=attribute-defined-outside-init
+        if not hasattr(self, 'page'):
+            paginator = Paginator(super().get_queryset(), self.per_page)
+            self.page = paginator.get_page(self.page_number)
+            self._queryset = self.page.object_list
+        return self._queryset
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """
+    A read-only inline that shows per_page related objects at a time, with links to the
+    other pages (?<model name>_page=), joining in the related objects named in
+    list_select_related. Subclasses list the fields to show in fields.
+    """
+    formset = PaginatedInlineFormSet
+    template = 'admin/readings/edit_inline/paginated_tabular.html'
+    per_page = 20
+    list_select_related = ()
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.fields
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        page_param = f'{self.model._meta.model_name}_page'
+        return type(formset.__name__, (formset,), {
+            'per_page': self.per_page,
+            'page_param': page_param,
+            'page_number': request.GET.get(page_param, 1),
+        })
+
+    def has_add_permission(self, request, obj):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 ################################################################################
 # Document admin view
 ################################################################################
@@ -46,18 +139,26 @@ class SegmentQuestionInline(admin.TabularInline):
 
 class SegmentAdmin(admin.ModelAdmin):
     model = Segment
+    list_select_related = ('document',)
     inlines = [SegmentQuestionInline]
 
 
 ################################################################################
 # Questions admin views
 ################################################################################
-class SegmentQuestionResponseInline(admin.TabularInline):
+class SegmentQuestionResponseInline(PaginatedTabularInline):
+    """ The responses to a segment question, or of a segment's data """
     model = SegmentQuestionResponse
+    fields = ('question', 'student_segment_data', 'response', 'evidence', 'submission_time')
+    list_select_related = ('question__segment', 'student_segment_data')
 
 
-class DocumentQuestionResponseInline(admin.TabularInline):
+class DocumentQuestionResponseInline(PaginatedTabularInline):
+    """ The responses to a document question, or of a reading """
     model = DocumentQuestionResponse
+    fields = ('question', 'student_reading_data', 'response', 'response_segment', 'evidence',
+              'submission_time')
+    list_select_related = ('question', 'student_reading_data__student')
 
 
 class DocumentQuestionAdmin(admin.ModelAdmin):
@@ -66,27 +167,83 @@ class DocumentQuestionAdmin(admin.ModelAdmin):
 
 
 class SegmentQuestionAdmin(admin.ModelAdmin):
+    """ Segment questions, picking the segment by id rather than from every segment """
     model = SegmentQuestionResponse
     list_display = ('segment', 'sequence', 'text',)
+    list_select_related = ('segment__document',)
+    raw_id_fields = ('segment',)
     inlines = [SegmentQuestionResponseInline]
 
 
 ################################################################################
 # Student data admin view
 ################################################################################
-class StudentSegmentDataInline(admin.TabularInline):
+class StudentSegmentDataInline(PaginatedTabularInline):
+    """ The segment data of a reading """
     model = StudentSegmentData
+    fields = ('segment', 'is_rereading', 'view_time', 'submission_time')
+    list_select_related = ('segment__document',)
 
 
 class StudentReadingDataAdmin(admin.ModelAdmin):
+    """
+    Readings, listed with their stored counts (see counters.py) and a count of their
+    document responses
+    """
     model = StudentReadingData
-    inlines = [StudentSegmentDataInline]
+    list_display = ('id', 'student', 'document', 'segment_data_count', 'view_time',
+                    'response_count', 'last_updated_time')
+    list_select_related = ('student', 'document')
+    list_filter = ('document',)
+    raw_id_fields = ('student', 'document')
+    readonly_fields = ('segment_data_count', 'total_view_time')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    inlines = [StudentSegmentDataInline, DocumentQuestionResponseInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(response_count=aggregate_per_parent(
+            DocumentQuestionResponse.objects.all(), 'student_reading_data', Count('pk'),
+            IntegerField(),
+        ))
+
+    def view_time(self, obj):
+        """ The total view time, in seconds """
+        return obj.get_total_view_time()
+    view_time.short_description = 'view time (s)'
+    view_time.admin_order_field = 'total_view_time'
+
+    def response_count(self, obj):
+        """ The number of document responses """
+        return obj.response_count
+    response_count.short_description = 'document responses'
+    response_count.admin_order_field = 'response_count'
 
 
 class StudentSegmentDataAdmin(admin.ModelAdmin):
+    """ Segment data, listed with a count of their responses """
     model = StudentSegmentData
+    list_display = ('id', 'segment', 'reading_data', 'is_rereading', 'view_time',
+                    'response_count', 'submission_time')
+    list_select_related = ('segment__document', 'reading_data__student')
+    list_filter = ('is_rereading',)
+    raw_id_fields = ('segment', 'reading_data')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [SegmentQuestionResponseInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(response_count=aggregate_per_parent(
+            SegmentQuestionResponse.objects.all(), 'student_segment_data', Count('pk'),
+            IntegerField(),
+        ))
+
+    def response_count(self, obj):
+        """ The number of responses to the segment's questions """
+        return obj.response_count
+    response_count.short_description = 'responses'
+    response_count.admin_order_field = 'response_count'
+
 
 admin.site.register(Student)
 admin.site.register(Writeup)
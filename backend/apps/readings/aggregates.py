@@ -0,0 +1,638 @@
+"""
+
+aggregates.py - running analysis aggregates, maintained as reading data is submitted
+
+StudentReadingDataSerializer.update() calls the record_* functions below for every
+StudentSegmentData and response it saves, and RereadingAnalysis reads the resulting
+aggregate tables instead of rescanning every row ever submitted.
+
+rebuild() recomputes everything from scratch (see the rebuild_aggregates command).
+
+Any other write to the raw data -- an edit or delete in the admin, say, or a row made
+in the shell -- is applied by the receivers below (connected in apps.py): they take the
+old row back out of the aggregates and add the new one, in the same transaction. The
+serializer saves its rows inside recording_submission(), which the receivers ignore.
+With settings.ANALYSIS_USE_AGGREGATES off they do nothing, so run rebuild_aggregates
+before turning it back on. The counts stay exact; where the analyses order questions or
+break ties by when rows were first recorded, only rebuild() restores that order after
+rows are deleted.
+
+"""
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .analysis_helpers import (
+    RELEVANT_WORDS,
+    content_words,
+    document_labels,
+    heat_map_buckets,
+    heat_map_section,
+    tokenize_response,
+)
+from .analysis_queries import median
+from .analysis_cache import get_analysis_cache
+from .models import (
+    DocumentQuestionResponse,
+    SegmentQuestionResponse,
+    SegmentQuestionWordCount,
+    StudentSegmentData,
+)
+
+RELEVANT_WORDS_KIND = SegmentQuestionWordCount.RELEVANT
+ALL_WORDS_KIND = SegmentQuestionWordCount.ALL
+
+
+def _get_model(model_name):
+    """ Looks up a model of this app """
+    return django_apps.get_model('readings', model_name)
+
+
+def _increment(model, lookups_and_increments):
+    """
+    Adds to the counter fields of a set of aggregate rows, creating the rows if needed.
+    The additions are done with F() expressions, so concurrent writers don't lose updates.
+    Taking amounts back out of a row that doesn't exist (e.g. deleted along with its
+    question) does nothing.
+
+    :param model: aggregate model class
+    :param lookups_and_increments: iterable of (lookup dict, {field: amount}) pairs
+    """
+    for lookup, increments in lookups_and_increments:
+        increments = {field: amount for field, amount in increments.items() if amount}
+        if any(amount > 0 for amount in increments.values()):
+            model.objects.get_or_create(**lookup)
+        if not increments:
+            continue
+        model.objects.filter(**lookup).update(
+            **{field: F(field) + amount for field, amount in increments.items()}
+        )
+
+
+def _increment_counts(model, lookup, key_field, counts):
+    """
+    Adds a Counter to the count rows matching lookup, one row per key of the Counter.
+    Missing rows are inserted first (in first-seen order, so that ties in the top words
+    keep breaking the same way as Counter.most_common), then the counts are added
+    with one UPDATE per distinct amount.
+
+    :param model: a model with a count field, e.g. SegmentQuestionWordCount
+    :param lookup: dict identifying the group the rows belong to (e.g. question and kind)
+    :param key_field: str, the field the Counter's keys go in (e.g. 'word')
+    :param counts: Counter mapping keys to how many times they were seen
+                   (negative for keys that were taken back)
+    """
+    counts = {key: amount for key, amount in counts.items() if amount}
+    if not counts:
+        return
+
+    model.objects.bulk_create(
+        [model(**{key_field: key}, **lookup) for key, amount in counts.items() if amount > 0],
+        ignore_conflicts=True,
+    )
+    keys_by_amount = defaultdict(list)
+    for key, amount in counts.items():
+        keys_by_amount[amount].append(key)
+    for amount, keys in keys_by_amount.items():
+        model.objects.filter(**{f'{key_field}__in': keys}, **lookup).update(
+            count=F('count') + amount
+        )
+
+
+def record_segment_data(segment_data_list, sign=1):
+    """
+    Adds newly saved StudentSegmentData to the per-reading and per-segment aggregates,
+    and its scroll positions to the heat map buckets
+
+    :param segment_data_list: iterable of StudentSegmentData
+    :param sign: 1 to add the rows, -1 to take them back out (e.g. once deleted)
+    """
+    segment_data_list = list(segment_data_list)
+    reading_times = defaultdict(Counter)
+    segment_counts = defaultdict(Counter)
+    for segment_data in segment_data_list:
+        segment_counts[segment_data.segment_id]['read_count'] += sign
+        if segment_data.is_rereading:
+            reading_times[segment_data.reading_data_id]['rereading_view_time'] += \
+                sign * segment_data.view_time
+            if segment_data.view_time > 1.0:
+                segment_counts[segment_data.segment_id]['reread_count'] += sign
+        else:
+            reading_times[segment_data.reading_data_id]['reading_view_time'] += \
+                sign * segment_data.view_time
+
+    _increment(
+        _get_model('ReadingAggregate'),
+        (({'reading_data_id': reading_id}, times) for reading_id, times in reading_times.items())
+    )
+    _increment(
+        _get_model('SegmentAggregate'),
+        (({'segment_id': segment_id}, counts) for segment_id, counts in segment_counts.items())
+    )
+    if sign < 0:
+        # a reading without segment data has no view time to count in the median
+        _get_model('ReadingAggregate').objects.filter(reading_data_id__in=reading_times).exclude(
+            reading_data_id__in=StudentSegmentData.objects.filter(
+                reading_data_id__in=reading_times,
+            ).values('reading_data_id'),
+        ).delete()
+
+    bucket_size = settings.ANALYSIS_HEAT_MAP_BUCKET_SIZE
+    buckets = defaultdict(Counter)
+    for segment_data in segment_data_list:
+        for bucket, count in heat_map_buckets(segment_data.get_parsed_scroll_data(),
+                                              bucket_size).items():
+            buckets[segment_data.segment_id, segment_data.is_rereading][bucket] += sign * count
+    for (segment_id, is_rereading), bucket_counts in buckets.items():
+        _increment_counts(
+            _get_model('HeatMapBucket'),
+            {'segment_id': segment_id, 'is_rereading': is_rereading, 'bucket_size': bucket_size},
+            'bucket',
+            bucket_counts,
+        )
+
+
+def record_segment_responses(responses, sign=1):
+    """
+    Adds newly saved SegmentQuestionResponses to the per-question aggregates
+
+    :param responses: iterable of SegmentQuestionResponse
+    :param sign: 1 to add the responses, -1 to take them back out (e.g. once deleted)
+    """
+    word_count_model = _get_model('SegmentQuestionWordCount')
+    response_counts = defaultdict(Counter)
+    relevant_words = defaultdict(Counter)
+    all_words = defaultdict(Counter)
+    for response in responses:
+        question_id = response.question_id
+        has_relevant_words, response_relevant_words, response_words = \
+            tokenize_response(response.response)
+        response_counts[question_id]['response_count'] += sign
+        if has_relevant_words:
+            response_counts[question_id]['relevant_response_count'] += sign
+        for word in response_relevant_words:
+            relevant_words[question_id][word] += sign
+        for word in response_words:
+            all_words[question_id][word] += sign
+
+    _increment(
+        _get_model('SegmentQuestionAggregate'),
+        (({'question_id': question_id}, counts)
+         for question_id, counts in response_counts.items())
+    )
+    for question_id in response_counts:
+        _increment_counts(
+            word_count_model,
+            {'question_id': question_id, 'kind': RELEVANT_WORDS_KIND},
+            'word',
+            relevant_words[question_id],
+        )
+        _increment_counts(
+            word_count_model,
+            {'question_id': question_id, 'kind': ALL_WORDS_KIND},
+            'word',
+            all_words[question_id],
+        )
+
+
+def record_document_responses(responses, updated_responses=(), sign=1):
+    """
+    Adds newly saved DocumentQuestionResponses to the per-question word counts
+
+    :param responses: iterable of DocumentQuestionResponse
+    :param updated_responses: iterable of (old, updated) DocumentQuestionResponse pairs,
+                              for responses that were resubmitted with a new text
+    :param sign: 1 to add responses, -1 to take them back out (e.g. once deleted)
+    """
+    all_words = defaultdict(Counter)
+    for response in responses:
+        for word in content_words(response.response):
+            all_words[response.question_id][word] += sign
+    for old_response, response in updated_responses:
+        all_words[response.question_id].update(content_words(response.response))
+        all_words[old_response.question_id].subtract(content_words(old_response.response))
+
+    for question_id, word_counts in all_words.items():
+        _increment_counts(
+            _get_model('DocumentQuestionWordCount'),
+            {'question_id': question_id},
+            'word',
+            word_counts,
+        )
+
+
+def rebuild():
+    """
+    Throws away all of the aggregates and recomputes them from the raw reading data.
+    Responses are replayed in pk order, as they were originally submitted.
+    """
+    student_segment_data = _get_model('StudentSegmentData')
+    reading_aggregate = _get_model('ReadingAggregate')
+    segment_aggregate = _get_model('SegmentAggregate')
+    question_aggregate = _get_model('SegmentQuestionAggregate')
+    segment_word_count = _get_model('SegmentQuestionWordCount')
+    document_word_count = _get_model('DocumentQuestionWordCount')
+
+    for model in (reading_aggregate, segment_aggregate, question_aggregate,
+                  segment_word_count, document_word_count):
+        model.objects.all().delete()
+
+    reading_aggregate.objects.bulk_create(
+        reading_aggregate(
+            reading_data_id=totals['reading_data_id'],
+            reading_view_time=totals['reading_view_time'] or 0,
+            rereading_view_time=totals['rereading_view_time'] or 0,
+        )
+        for totals in student_segment_data.objects.order_by('reading_data_id')
+        .values('reading_data_id')
+        .annotate(
+            reading_view_time=Sum('view_time', filter=Q(is_rereading=False)),
+            rereading_view_time=Sum('view_time', filter=Q(is_rereading=True)),
+        )
+    )
+
+    segment_aggregate.objects.bulk_create(
+        segment_aggregate(segment_id=segment_id, read_count=read_count,
+                          reread_count=reread_count)
+        for segment_id, read_count, reread_count, _ in student_segment_data.objects
+        .values_list('segment_id')
+        .annotate(
+            read_count=Count('id'),
+            reread_count=Count('id', filter=Q(is_rereading=True, view_time__gt=1.0)),
+            first_id=Min('id'),
+        )
+        .order_by('first_id')
+    )
+
+    response_counts = defaultdict(Counter)
+    relevant_words = defaultdict(Counter)
+    all_words = defaultdict(Counter)
+    for question_id, response in _get_model('SegmentQuestionResponse').objects \
+            .order_by('pk').values_list('question_id', 'response'):
+        has_relevant_words, response_relevant_words, response_words = \
+            tokenize_response(response)
+        response_counts[question_id]['response_count'] += 1
+        if has_relevant_words:
+            response_counts[question_id]['relevant_response_count'] += 1
+        relevant_words[question_id].update(response_relevant_words)
+        all_words[question_id].update(response_words)
+
+    question_aggregate.objects.bulk_create(
+        question_aggregate(question_id=question_id, **counts)
+        for question_id, counts in response_counts.items()
+    )
+    segment_word_count.objects.bulk_create(
+        segment_word_count(question_id=question_id, kind=kind, word=word, count=count)
+        for kind, counters in ((RELEVANT_WORDS_KIND, relevant_words),
+                               (ALL_WORDS_KIND, all_words))
+        for question_id, word_counts in counters.items()
+        for word, count in word_counts.items()
+    )
+
+    document_words = defaultdict(Counter)
+    for question_id, response in _get_model('DocumentQuestionResponse').objects \
+            .order_by('pk').values_list('question_id', 'response'):
+        document_words[question_id].update(content_words(response))
+    document_word_count.objects.bulk_create(
+        document_word_count(question_id=question_id, word=word, count=count)
+        for question_id, word_counts in document_words.items()
+        for word, count in word_counts.items()
+    )
+
+    rebuild_heat_maps()
+
+
+def rebuild_heat_maps():
+    """
+    Throws away the heat map buckets and recounts them from the raw scroll data, in
+    sections of settings.ANALYSIS_HEAT_MAP_BUCKET_SIZE pixels, in one transaction
+    """
+    bucket_size = settings.ANALYSIS_HEAT_MAP_BUCKET_SIZE
+    heat_map_bucket = _get_model('HeatMapBucket')
+
+    buckets = defaultdict(Counter)
+    for segment_id, is_rereading, scroll_data in _get_model('StudentSegmentData') \
+            .objects.order_by('pk').values_list('segment_id', 'is_rereading', 'scroll_data') \
+            .iterator():
+        buckets[segment_id, is_rereading].update(heat_map_buckets(scroll_data, bucket_size))
+    with transaction.atomic():
+        heat_map_bucket.objects.all().delete()
+        heat_map_bucket.objects.bulk_create(
+            (
+                heat_map_bucket(segment_id=segment_id, is_rereading=is_rereading,
+                                bucket_size=bucket_size, bucket=bucket, count=count)
+                for (segment_id, is_rereading), bucket_counts in buckets.items()
+                for bucket, count in bucket_counts.items()
+            ),
+            batch_size=1000,
+        )
+
+
+################################################################################
+# Keeping the aggregates in sync with other writes
+################################################################################
+_submission = threading.local()
+
+
+@contextmanager
+def recording_submission():
+    """
+    Marks the raw data saved in this block as part of a submission that the caller adds
+    to the aggregates itself, with the record_* functions, so the receivers below
+    don't rebuild them
+    """
+    _submission.active = True
+    try:
+        yield
+    finally:
+        _submission.active = False
+
+
+def is_recording_submission():
+    """ :return: bool, whether this thread is inside recording_submission() """
+    return getattr(_submission, 'active', False)
+
+
+# The rows as they were before the saves in progress, by (model, pk)
+_saved_rows = threading.local()
+
+
+def _is_tracked_write(raw):
+    """ Whether a write to the raw data should be applied to the aggregates here """
+    return settings.ANALYSIS_USE_AGGREGATES and not raw and not is_recording_submission()
+
+
+def _record(model, instance, sign):
+    """ Adds a row of the raw data to the aggregates (sign 1) or takes it back out (-1) """
+    if model is StudentSegmentData:
+        record_segment_data([instance], sign)
+    elif model is SegmentQuestionResponse:
+        record_segment_responses([instance], sign)
+    else:
+        record_document_responses([instance], sign=sign)
+
+
+def _clear_analysis_cache():
+    """ Drops the analysis results computed from the old data """
+    get_analysis_cache().clear()
+
+
+@receiver(pre_save, sender=StudentSegmentData)
+@receiver(pre_save, sender=SegmentQuestionResponse)
+@receiver(pre_save, sender=DocumentQuestionResponse)
+def raw_data_saving(sender, instance, raw=False, **kwargs):  # pylint: disable=unused-argument
+    """ Keeps the row an edit is about to overwrite, so that it can be taken back out """
+    if not _is_tracked_write(raw) or instance.pk is None:
+        return
+    old_row = sender.objects.filter(pk=instance.pk).first()
+    if old_row is not None:
+        if not hasattr(_saved_rows, 'rows'):
+            _saved_rows.rows = {}
+        _saved_rows.rows[sender, instance.pk] = old_row
+
+
+@receiver([post_save, post_delete], sender=StudentSegmentData)
+@receiver([post_save, post_delete], sender=SegmentQuestionResponse)
+@receiver([post_save, post_delete], sender=DocumentQuestionResponse)
+def raw_data_changed(sender, instance, raw=False, **kwargs):
+    """
+    Applies a write to the reading data outside a submission to the aggregates: an edited
+    row is taken out as it was and added back as it is now, and a deleted row is taken
+    out (deleting a reading deletes its segment data and responses, which lands here too).
+    Once the transaction commits, the cached analysis results are dropped (only once,
+    however many rows it writes).
+    """
+    if not _is_tracked_write(raw):
+        return
+    if kwargs['signal'] is post_delete:
+        _record(sender, instance, -1)
+    else:
+        old_row = getattr(_saved_rows, 'rows', {}).pop((sender, instance.pk), None)
+        if old_row is not None:
+            _record(sender, old_row, -1)
+        _record(sender, instance, 1)
+    # connection.run_on_commit holds (savepoint ids, callback) pairs
+    if all(callback is not _clear_analysis_cache for _, callback in connection.run_on_commit):
+        transaction.on_commit(_clear_analysis_cache)
+
+
+################################################################################
+# Analyses computed from the aggregates
+# Each of these returns exactly what the RereadingAnalysis method of the same
+# name computes by scanning the raw data.
+################################################################################
+def total_and_median_view_time():
+    """
+    :return: a tuple containing (total view time, median view time per student)
+    """
+    reading_totals = _get_model('ReadingAggregate').objects.annotate(
+        reading_total=F('reading_view_time') + F('rereading_view_time'),
+    )
+    total_time = reading_totals.aggregate(total=Sum('reading_total'))['total'] or 0
+    median_view_time = median(reading_totals, 'reading_total') or 0
+    return round(total_time), round(median_view_time)
+
+
+def mean_reading_vs_rereading_time(reading_count):
+    """
+    :param reading_count: int, number of readings to average over
+    :return a tuple with (mean reading time, mean rereading time)
+    """
+    if reading_count == 0:
+        return 0.0, 0.0
+    totals = _get_model('ReadingAggregate').objects.aggregate(
+        reading_time=Sum('reading_view_time'),
+        rereading_time=Sum('rereading_view_time'),
+    )
+    reading_time = totals['reading_time'] or 0
+    rereading_time = totals['rereading_time'] or 0
+    return round(reading_time / reading_count), round(rereading_time / reading_count)
+
+
+def compute_reread_counts(reading_count):
+    """
+    :param reading_count: int, number of readings to average over
+    :return: list of [segment sequence, rereads per reading]
+    """
+    reread_counts = (
+        _get_model('SegmentAggregate').objects
+        .filter(reread_count__gt=0)
+        .order_by('segment__sequence')
+        .values_list('segment__sequence')
+        .annotate(total_reread_count=Sum('reread_count'))
+    )
+    return [
+        [sequence, round(reread_count / reading_count, 2)]
+        for sequence, reread_count in reread_counts
+    ]
+
+
+def _question_aggregates():
+    """
+    (question text, response count, relevant response count) for each answered question,
+    in the order the questions were first answered (which is the order their rows were created)
+    """
+    return (
+        _get_model('SegmentQuestionAggregate').objects
+        .filter(response_count__gt=0)
+        .order_by('id')
+        .values_list('question__text', 'response_count', 'relevant_response_count')
+    )
+
+
+def relevant_words_by_question():
+    """
+    :return: list of (question text, count) tuples
+    """
+    question_context_count_map = {}
+    for question, response_count, relevant_response_count in _question_aggregates():
+        question_context_count_map[question] = (
+            question_context_count_map.get(question, 0)
+            + response_count + relevant_response_count
+        )
+    return list(question_context_count_map.items())
+
+
+def percent_using_relevant_words_by_question(reading_count):
+    """
+    :param reading_count: int, number of readings to average over
+    :return: [RELEVANT_WORDS, list of (question text, fraction) tuples]
+    """
+    return [
+        RELEVANT_WORDS,
+        [
+            (question, relevant_response_count / reading_count)
+            for question, _, relevant_response_count in _question_aggregates()
+        ],
+    ]
+
+
+def relevant_words_percent_display_question(reading_count, results_to_show=None):
+    """
+    :param reading_count: int, number of readings to average over
+    :param results_to_show: int, how many of each question's most frequent words to include,
+                            or None for all of them
+    :return: list of [question text, percent, relevant response count, word frequencies]
+    """
+    word_count_model = _get_model('SegmentQuestionWordCount')
+    relevant_word_counts = defaultdict(dict)
+    for question_id, word, count in (
+            word_count_model.objects
+            .filter(kind=RELEVANT_WORDS_KIND, count__gt=0)
+            .order_by('question_id', '-count', 'id')
+            .values_list('question_id', 'word', 'count')):
+        if results_to_show is None or len(relevant_word_counts[question_id]) < results_to_show:
+            relevant_word_counts[question_id][word] = count
+
+    relevant_response_counts = dict(
+        _get_model('SegmentQuestionAggregate').objects
+        .values_list('question_id', 'relevant_response_count')
+    )
+    percent_question_count_map = {}
+    for question, _, relevant_response_count in _question_aggregates():
+        percent_question_count_map[question] = "{:.2%}".format(
+            round(relevant_response_count / reading_count, 2)
+        )
+
+    return_list = []
+    for question_id, question in (_get_model('SegmentQuestion').objects
+                                  .order_by('pk').values_list('id', 'text')):
+        return_list.append([
+            question,
+            percent_question_count_map.get(question, "{:.2%}".format(0)),
+            relevant_response_counts.get(question_id, 0),
+            relevant_word_counts[question_id],
+        ])
+    return return_list
+
+
+def _top_words(word_counts, results_to_show=5):
+    """ The most used words in a word count queryset, as a comma-separated string """
+    return ', '.join(
+        word_counts.filter(count__gt=0)
+        .order_by('-count', 'id').values_list('word', flat=True)[:results_to_show]
+    )
+
+
+def most_common_words_by_question():
+    """
+    :return: list of [segment num, question num, question text, top words]
+    """
+    word_count_model = _get_model('SegmentQuestionWordCount')
+    top_words = []
+
+    for question_id, question_num, question_text in (
+            _get_model('DocumentQuestion').objects
+            .order_by('pk').values_list('id', 'sequence', 'text')):
+        word_counts = _get_model('DocumentQuestionWordCount').objects.filter(
+            question_id=question_id,
+        )
+        top_words.append(['Global', question_num, question_text, _top_words(word_counts)])
+
+    for question_id, segment_num, question_num, question_text in (
+            _get_model('SegmentQuestion').objects
+            .order_by('pk').values_list('id', 'segment__sequence', 'sequence', 'text')):
+        word_counts = word_count_model.objects.filter(
+            question_id=question_id,
+            kind=ALL_WORDS_KIND,
+        )
+        top_words.append([segment_num, question_num, question_text, _top_words(word_counts)])
+
+    return top_words
+
+
+def heat_map_buckets_are_current(bucket_size):
+    """
+    Whether the heat map buckets were all counted in sections of bucket_size pixels;
+    if not, the bucket size was changed since they were rebuilt.
+    """
+    return not _get_model('HeatMapBucket').objects.exclude(bucket_size=bucket_size).exists()
+
+
+def get_all_heat_maps(bucket_size):
+    """
+    :param bucket_size: int, height of the heat map sections in pixels
+    :return: dict mapping '<document> <segment sequence>' to
+             {'reading': {section: count}, 'rereading': {section: count}}
+    """
+    # segments that were read, in the order they were first read
+    segments = list(
+        _get_model('SegmentAggregate').objects
+        .filter(read_count__gt=0)
+        .order_by('id')
+        .values_list('segment_id', 'segment__document_id', 'segment__sequence')
+    )
+    documents = list(
+        _get_model('Document').objects
+        .filter(pk__in={document_id for _, document_id, _ in segments})
+        .order_by('pk').values_list('id', 'title')
+    )
+    labels = dict(zip((document_id for document_id, _ in documents), document_labels(documents)))
+
+    heat_map = {}
+    segment_heat_maps = {}
+    for segment_id, document_id, sequence in segments:
+        segment_identifier = labels[document_id] + " " + str(sequence)
+        if segment_identifier not in heat_map:
+            heat_map[segment_identifier] = {"reading": {}, "rereading": {}}
+        segment_heat_maps[segment_id] = heat_map[segment_identifier]
+
+    for segment_id, is_rereading, bucket, count in (
+            _get_model('HeatMapBucket').objects
+            .filter(bucket_size=bucket_size, count__gt=0)
+            .order_by('id')
+            .values_list('segment_id', 'is_rereading', 'bucket', 'count')):
+        segment_heat_map = segment_heat_maps.get(segment_id)
+        if segment_heat_map is None:
+            continue  # the segment's reading data has been deleted since
+        sections = segment_heat_map["rereading" if is_rereading else "reading"]
+        section_identifier = heat_map_section(bucket, bucket_size)
+        sections[section_identifier] = sections.get(section_identifier, 0) + count
+    return heat_map
@@ -4,9 +4,10 @@ Analysis.py - analyses for dhmit/rereading wired into the webapp
 
 """
 import statistics
-import string
-from collections import Counter, OrderedDict
-from operator import itemgetter
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.functional import cached_property
 
 from .models import (
     StudentReadingData,
@@ -16,93 +17,158 @@ from .models import (
     DocumentQuestionResponse,
     SegmentQuestionResponse,
     Segment)
-from .analysis_helpers import string_contains_words
-
-# all relevant words used for two functions
-RELEVANT_WORDS = ["stereotypes", "bias", "assumptions", "assume", "narrator", "memory",
-                  "forget", "Twyla", "Maggie", "Roberta", "black", "white", "prejudice",
-                  "mothers", "segregation", "hate", "hatred", "love", "love-hate",
-                  "remember", "children", "recall", "kick", "truth", "dance", "sick",
-                  "fade", "old", "Mary", "sandy", "race", "racial", "racism",
-                  "colorblind", "disabled", "marginalized", "poor", "rich", "wealthy",
-                  "middle-class", "working-class", "consumers", "shopping", "read",
-                  "misread", "reread", "reconsider", "confuse", "wrong", "mistaken",
-                  "regret", "mute", "voiceless", "women", "age", "bird", "time", "scene",
-                  "setting", "Hendrix ", "universal", "binary", "deconstruct",
-                  "question", "wrong", "right", "incorrect", "false", "claims", "true",
-                  "truth", "unknown", "ambiguous", "unclear"]
-
-STOPWORDS = ['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're",
-             "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he',
-             'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's",
-             'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which',
-             'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are',
-             'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does',
-             'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until',
-             'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into',
-             'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down',
-             'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here',
-             'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more',
-             'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so',
-             'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should',
-             "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't",
-             'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn',
-             "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn',
-             "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn',
-             "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"]
+from .analysis_helpers import (
+    RELEVANT_WORDS,
+    count_heat_map_buckets,
+    document_labels,
+    heat_map_section,
+)
+from .analysis_snapshot import AnalysisSnapshot
+from . import aggregates, analysis_queries
 
 
 class RereadingAnalysis:
     """
     This class loads all StudentReadingData objects from the db,
     and implements analysis methods on these responses.
+
+    The rows themselves are read once, into a columnar AnalysisSnapshot (see
+    analysis_snapshot.py), a table at a time, the first time an analysis needs them;
+    every method below runs against those arrays rather than against model instances.
+
+    The view time metrics are plain sums, group-bys and counts, so by default they are
+    computed in the database instead (see analysis_queries.py), and only fall back to
+    the Python loops when use_sql is False or the segment data has already been read.
+
+    With use_aggregates (which defaults to settings.ANALYSIS_USE_AGGREGATES), the metrics
+    that have running aggregates (see aggregates.py) read those instead of any raw rows.
+
+    The analysis can be restricted to one document (document_id) and to the readings active
+    in a time window: since keeps readings last updated at or after it, until keeps readings
+    started before it. These become WHERE clauses on the indexed StudentReadingData columns,
+    so a restricted analysis only reads its slice of the data. The running aggregates cover
+    everything ever recorded, so they are not used for restricted analyses.
     """
 
-    def __init__(self):
-        self.readings = StudentReadingData.objects.all()\
-            .prefetch_related('student',
-                              'document')
-        self.segments = StudentSegmentData.objects.all()\
-            .prefetch_related('reading_data__document',
-                              'segment')
-        self.responses = SegmentQuestionResponse.objects.all()\
-            .prefetch_related('student_segment_data__segment',
-                              'question')
-        self.doc_questions = DocumentQuestion.objects.all()
-        self.doc_questions_response = DocumentQuestionResponse.objects.all()
-        self.segment_questions = SegmentQuestion.objects.all()\
-            .prefetch_related('segment')
+    def __init__(self, document_id=None, since=None,  # pylint: disable=R0913
+                 until=None, use_sql=True, use_aggregates=None):
+        self.document_id = document_id
+        self.since = since
+        self.until = until
+        self.use_sql = use_sql
+        if use_aggregates is None:
+            use_aggregates = settings.ANALYSIS_USE_AGGREGATES
+        self.use_aggregates = use_aggregates and not self.is_restricted
+
+        self.readings = StudentReadingData.objects.filter(
+            **self._reading_lookups()
+        ).order_by('pk')
+        self.segments = StudentSegmentData.objects.filter(
+            **self._reading_lookups('reading_data__')
+        ).order_by('pk')
+        self.responses = SegmentQuestionResponse.objects.filter(
+            **self._reading_lookups('student_segment_data__reading_data__')
+        ).order_by('pk')
+        self.doc_questions_response = DocumentQuestionResponse.objects.filter(
+            **self._reading_lookups('student_reading_data__')
+        ).order_by('pk')
+        self.doc_questions = DocumentQuestion.objects.order_by('pk')
+        self.segment_questions = SegmentQuestion.objects.order_by('pk')
+        self.document_segments = Segment.objects.all()
+        if document_id is not None:
+            self.doc_questions = self.doc_questions.filter(document_id=document_id)
+            self.segment_questions = self.segment_questions.filter(
+                segment__document_id=document_id
+            )
+            self.document_segments = self.document_segments.filter(document_id=document_id)
+
+        # Columnar snapshot of the readings, segment data and responses; each of its tables
+        # is only read the first time a metric uses it
+        self.snapshot = AnalysisSnapshot(
+            readings=self.readings,
+            segments=self.segments,
+            responses=self.responses,
+            doc_responses=self.doc_questions_response,
+            segment_questions=self.segment_questions,
+            doc_questions=self.doc_questions,
+        )
+
+    @property
+    def is_restricted(self):
+        """ Whether this analysis covers less than all of the readings """
+        return any(value is not None for value in (self.document_id, self.since, self.until))
+
+    def _reading_lookups(self, prefix=''):
+        """
+        The document and time window filters, as queryset lookups on StudentReadingData
+        :param prefix: str, path from the queried model to StudentReadingData, e.g.
+                       'reading_data__'
+        :return: dict of lookups
+        """
+        lookups = {}
+        if self.document_id is not None:
+            lookups[prefix + 'document_id'] = self.document_id
+        if self.since is not None:
+            lookups[prefix + 'last_updated_time__gte'] = self.since
+        if self.until is not None:
+            lookups[prefix + 'start_time__lt'] = self.until
+        return lookups
+
+    def get_init_kwargs(self):
+        """
+        The arguments to build an equivalent RereadingAnalysis with (e.g. in another process)
+        :return: dict
+        """
+        return {
+            'document_id': self.document_id,
+            'since': self.since,
+            'until': self.until,
+            'use_sql': self.use_sql,
+            'use_aggregates': self.use_aggregates,
+        }
+
+    def _use_sql(self):
+        """
+        Whether to push an aggregate down into the database: once the segment data is in
+        memory, another round trip costs more than a pass over its arrays.
+        """
+        return self.use_sql and not self.snapshot.is_loaded('segment_data')
+
+    @cached_property
+    def reading_count(self):
+        """
+        Number of readings, without reading them if they haven't been already
+        :return: int
+        """
+        if self.snapshot.is_loaded('readings'):
+            return self.snapshot.reading_count
+        return self.readings.count()
 
     def total_and_median_view_time(self):
         """
         This function totals the overall view times and calculates the median view time per student
         :return: a tuple containing (total view time, median view time per student)
         """
+        if self.use_aggregates:
+            return aggregates.total_and_median_view_time()
+
+        if self._use_sql():
+            return analysis_queries.total_and_median_view_time(self.segments)
+
+        segment_data = self.snapshot.segment_data
         total_time = 0  # track the total reading time while looking at segment times
-        ret_dict = {}
-        in_dict = []  # prevent calling ret_dict.keys() repeatedly
-        for segment in self.segments:
-            # prime two variable to reduce calls to database
-            view_time = segment.view_time
-
-            reading_data = segment.reading_data
-            # add the segment view times to a dictionary entry for each student reading session
-            if reading_data not in in_dict:
-                ret_dict[reading_data] = [view_time]
-                in_dict.append(reading_data)
-            else:
-                ret_dict[reading_data].append(view_time)
+        reading_totals = {}
+        # add the segment view times to a running total for each student reading session
+        for reading_id, view_time in zip(segment_data.reading_ids, segment_data.view_times):
+            reading_totals[reading_id] = reading_totals.get(reading_id, 0) + view_time
             total_time += view_time
-        student_total_view_time = []
+
         # do not cycle through something that doesn't exist
-        if not ret_dict.values():
+        if not reading_totals:
             median_view_time = 0
         else:
-            for item in ret_dict.values():
-                # total the segment view times for each student
-                student_total_view_time.append(sum(item))
-            # find the mean of the total reading time for each student
-            median_view_time = statistics.median(student_total_view_time)
+            # find the median of the total reading time for each student
+            median_view_time = statistics.median(reading_totals.values())
         ret_tuple = (round(total_time), round(median_view_time))
         return ret_tuple
 
@@ -112,25 +178,29 @@ class RereadingAnalysis:
         return a dictionary containing the number of times students had to reread the text
         :return: int, number of times segment with sequence segment_number is reread
         """
+        if self.use_aggregates:
+            return aggregates.compute_reread_counts(self.reading_count)
+
+        if self._use_sql():
+            return analysis_queries.compute_reread_counts(self.segments, self.reading_count)
+
+        snapshot = self.snapshot
         segment_dictionary = {}
         segment_list = []
 
-        # For all segment objects
-        for segments in self.segments:
-            # Increment reread count in dictionary if the entry already in dictionary
-            if (segments.segment.sequence in segment_dictionary and segments.view_time > 1.0 and
-                    segments.is_rereading):
-                segment_dictionary[segments.segment.sequence] += 1
-            # Add entry to dictionary if entry does not already exist
-            elif (segments.segment.sequence not in segment_dictionary and segments.view_time > 1.0
-                  and segments.is_rereading):
-                segment_dictionary[segments.segment.sequence] = 1
+        # Count the rereads (longer than a second) of each segment sequence
+        segment_data = snapshot.segment_data
+        for sequence, view_time, is_rereading in zip(segment_data.segment_sequences,
+                                                     segment_data.view_times,
+                                                     segment_data.is_rereading):
+            if is_rereading and view_time > 1.0:
+                segment_dictionary[sequence] = segment_dictionary.get(sequence, 0) + 1
 
         # Turns dictionary data into a list of lists
         keys_list = list(segment_dictionary.keys())
         keys_list.sort()
         for key in keys_list:
-            segment_list.append([key, round(segment_dictionary[key] / len(self.readings), 2)])
+            segment_list.append([key, round(segment_dictionary[key] / snapshot.reading_count, 2)])
 
         return segment_list
 
@@ -141,61 +211,63 @@ class RereadingAnalysis:
             is sorted by question
             :return the return type explained in the function description
         """
+        if self.use_aggregates:
+            return aggregates.relevant_words_by_question()
+
+        snapshot = self.snapshot
+        text_stats = snapshot.text_stats
 
         question_context_count_map = {}
-        for response in self.responses:
-            question = response.question.text
-            question_context_count_map[question] = question_context_count_map.get(question, 0) + 1
-            if string_contains_words(response.response, RELEVANT_WORDS):
-                question_context_count_map[question] += 1
+        for question_index in text_stats.question_order:
+            question = snapshot.segment_questions.texts[question_index]
+            question_context_count_map[question] = (
+                question_context_count_map.get(question, 0)
+                + text_stats.response_counts[question_index]
+                + text_stats.relevant_response_counts[question_index]
+            )
         question_count_tup = list(question_context_count_map.items())
         return question_count_tup
 
-    def relevant_words_percent_display_question(self):
+    def relevant_words_percent_display_question(self, results_to_show=None):
         """
             Return a list of list which contains the question, the percentage, the count of total
             relevant words that a student used for the question, and a list of tuple inside each
             sublist with the words and the counts
+            :param results_to_show: how many of each question's most frequent words to include,
+                                    defaults to settings.ANALYSIS_RELEVANT_WORDS_TO_SHOW
+                                    (None for all of them)
             :return:the return type explained in the function description
         """
+        if results_to_show is None:
+            results_to_show = settings.ANALYSIS_RELEVANT_WORDS_TO_SHOW
+
+        if self.use_aggregates:
+            return aggregates.relevant_words_percent_display_question(self.reading_count,
+                                                                      results_to_show)
+
         # this is the combination + of the relevant words percentage and frequency function with
-        # word frequency display. Need to resolve the duplicated code fragment later
-
-        question_context_count_map = {} # show the relevant word usage with word frequency per
-        # question
-        question_count_map = {}
-        for question in SegmentQuestion.objects.all():
-            question_context_count_map[question] = {}
-
-        for segment in self.responses:
-            question = segment.question
-            single_response = segment.response
-            for word in single_response.split():
-                if word in RELEVANT_WORDS:
-                    question_context_count_map[question][word] = \
-                        question_context_count_map[question].get(word, 0) + 1
-                    question_context_count_map[question] = OrderedDict(sorted(
-                        question_context_count_map[question].items(), key=itemgetter(1),
-                        reverse=True))
-
-            if string_contains_words(single_response, RELEVANT_WORDS):
-                question_count_map[question] = question_count_map.get(question, 0) + 1
-            else:
-                question_count_map[question] = question_count_map.get(question, 0)
+        # word frequency display, both read from the shared pass over the responses
+        snapshot = self.snapshot
+        question_texts = snapshot.segment_questions.texts
+        text_stats = snapshot.text_stats
 
-        total_student_count = len(self.readings)
+        total_student_count = snapshot.reading_count
         percent_question_count_map = {}
-        for question in question_count_map:
+        for question_index in text_stats.question_order:
             percent = "{:.2%}".format(round(
-                (question_count_map[question] / total_student_count), 2))
-            percent_question_count_map[question.text] = percent
+                (text_stats.relevant_response_counts[question_index] / total_student_count), 2))
+            percent_question_count_map[question_texts[question_index]] = percent
         return_list = []
-        for question in question_context_count_map:
+        for question_index, question_text in enumerate(question_texts):
+            # sort each question's words (most frequent first) only once, here
+            word_frequencies = dict(
+                text_stats.relevant_word_counts[question_index].most_common(results_to_show)
+            )
             question_row = [
-                question.text,
-                percent_question_count_map[question.text],
-                question_count_map[question],
-                question_context_count_map[question],
+                question_text,
+                percent_question_count_map.get(question_text, "{:.2%}".format(0)),
+                text_stats.relevant_response_counts[question_index],
+                word_frequencies,
             ]
             return_list.append(question_row)
         return return_list
@@ -205,12 +277,19 @@ class RereadingAnalysis:
         Compares mean view times of reading segments vs rereading segments
         :return a tuple with (mean reading time, mean rereading time)
         """
+        if self.use_aggregates:
+            return aggregates.mean_reading_vs_rereading_time(self.reading_count)
+
+        if self._use_sql():
+            return analysis_queries.mean_reading_vs_rereading_time(self.segments,
+                                                                   self.reading_count)
+
+        snapshot = self.snapshot
+        segment_data = snapshot.segment_data
         reading_time = 0
         rereading_time = 0
         # cycle through every segment
-        for segment in self.segments:
-            view_time = segment.view_time
-            is_rereading = segment.is_rereading
+        for view_time, is_rereading in zip(segment_data.view_times, segment_data.is_rereading):
             # if rereading, add to total rereading time
             if is_rereading:
                 rereading_time += view_time
@@ -218,7 +297,7 @@ class RereadingAnalysis:
             else:
                 reading_time += view_time
 
-        num_students = len(self.readings)
+        num_students = snapshot.reading_count
 
         # divide by total number of readings
         if num_students != 0:
@@ -236,8 +315,7 @@ class RereadingAnalysis:
         student_names = []
 
         # go through all data in readings to get name of each user and add to set student_names
-        for reading in self.readings:
-            name = reading.student.name
+        for name in self.snapshot.student_names:
             if not name:
                 student_names.append('Anonymous')  # count one per anonymous student
             name = name.lower()
@@ -251,25 +329,20 @@ class RereadingAnalysis:
         words in that question
         :return the return type explained in the function description
         """
-        question_count_map = {}
-        for segment in self.responses:
-            question = segment.question
-            if string_contains_words(segment.response, RELEVANT_WORDS):
-                question_count_map[question] = question_count_map.get(question, 0) + 1
-            else:
-                question_count_map[question] = question_count_map.get(question, 0)
+        if self.use_aggregates:
+            return aggregates.percent_using_relevant_words_by_question(self.reading_count)
 
-        total_student_count = len(self.readings)
+        snapshot = self.snapshot
+        text_stats = snapshot.text_stats
+        total_student_count = snapshot.reading_count
         percent_question_count_map = []
-        for question in question_count_map:
+        for question_index in text_stats.question_order:
             percent_question_count_map.append(
-                (question.text, question_count_map[question] /
-                 total_student_count)
+                (snapshot.segment_questions.texts[question_index],
+                 text_stats.relevant_response_counts[question_index] / total_student_count)
             )
         return [RELEVANT_WORDS, percent_question_count_map]
 
-
-
     def get_all_heat_maps(self):
         """
         This function shows a heat map for each segment. It will show how long in total was spent
@@ -277,33 +350,49 @@ class RereadingAnalysis:
         :return: a dictionary of dictionaries which correspond to the view times of section of
         segments
         """
+        bucket_size = settings.ANALYSIS_HEAT_MAP_BUCKET_SIZE
+        if self.use_aggregates:
+            if not aggregates.heat_map_buckets_are_current(bucket_size):
+                # the bucket size was changed since the buckets were counted
+                aggregates.rebuild_heat_maps()
+            return aggregates.get_all_heat_maps(bucket_size)
+
+        snapshot = self.snapshot
+        segment_data = snapshot.segment_data
+
+        # segments are told apart by (document, sequence); the document title only
+        # goes into the label, together with the document id if another document shares it
+        labels = document_labels(list(zip(segment_data.document_ids.keys,
+                                          snapshot.document_titles)))
+
         heat_map = {}
-        for segment in self.segments:
-            segment_identifier = segment.reading_data.document.title + " " + \
-                                 str(segment.segment.sequence)
-            if segment_identifier not in heat_map:
-                heat_map[segment_identifier] = {"reading": {}, "rereading": {}}
-            for scroll_position in segment.get_parsed_scroll_data():
-                if scroll_position < 0:
-                    continue
-                section_number = int(scroll_position) // 500
-                section_identifier = str(section_number * 500) + " — " + \
-                                     str((section_number + 1) * 500)
-                is_rereading = "rereading" if segment.is_rereading else "reading"
-                if section_identifier not in heat_map[segment_identifier][is_rereading]:
-                    heat_map[segment_identifier][is_rereading][section_identifier] = 1
-                else:
-                    heat_map[segment_identifier][is_rereading][section_identifier] += 1
+        segment_heat_maps = {}
+        group_scroll_data = defaultdict(list)
+        for document_index, sequence, is_rereading, scroll_data in zip(
+                segment_data.document_indices, segment_data.segment_sequences,
+                segment_data.is_rereading, snapshot.scroll_data):
+            segment_key = (document_index, sequence)
+            if segment_key not in segment_heat_maps:
+                segment_identifier = labels[document_index] + " " + str(sequence)
+                segment_heat_maps[segment_key] = {"reading": {}, "rereading": {}}
+                heat_map[segment_identifier] = segment_heat_maps[segment_key]
+            reading_key = "rereading" if is_rereading else "reading"
+            group_scroll_data[segment_key, reading_key].append(scroll_data)
+
+        # count each group's positions in one go, rather than row by row
+        for (segment_key, reading_key), scroll_data_list in group_scroll_data.items():
+            sections = segment_heat_maps[segment_key][reading_key]
+            for bucket, count in count_heat_map_buckets(scroll_data_list, bucket_size).items():
+                sections[heat_map_section(bucket, bucket_size)] = count
         return heat_map
 
-    @staticmethod
-    def get_number_of_segments():
+    def get_number_of_segments(self):
         """
-        Returns the number of segments.
+        Returns the number of segments (of the analysed document, if there is one).
 
         :return: int (number of segments)
         """
-        return len(Segment.objects.all())
+        return self.document_segments.count()
 
     def all_responses(self):
         """
@@ -312,46 +401,31 @@ class RereadingAnalysis:
 
         :return: List of lists
         """
+        snapshot = self.snapshot
+        question_sequences = snapshot.segment_questions.sequences
+        question_indices = snapshot.segment_responses.question_indices
+        segment_sequences = snapshot.segment_responses.segment_sequences
 
-        responses = []
         responses_dict = {}
 
-        for response in (
-                self.responses.order_by(
-                    'student_segment_data__segment__sequence',
-                    'question__sequence',
-                )
-        ):
-            segment_num = response.student_segment_data.segment.sequence
-            question = response.question
-            question_num = question.sequence
-
-            question_text = question.text
-            student_response = response.response
-            evidence = response.parse_evidence()
-
+        # order rows by segment sequence, then question sequence
+        rows = sorted(
+            range(len(snapshot.segment_responses.texts)),
+            key=lambda row: (segment_sequences[row], question_sequences[question_indices[row]]),
+        )
+        for row in rows:
+            question_index = question_indices[row]
+            question_text = snapshot.segment_questions.texts[question_index]
             response_list = [
-                segment_num,
-                question_num,
-                question_text,
-                student_response,
-                evidence,
+                segment_sequences[row],
+                question_sequences[question_index],
+                snapshot.segment_responses.texts[row],
+                snapshot.segment_responses.evidence[row],
             ]
-
-            responses.append(response_list)
-
-        for response in responses:
-            response_list = [
-                response[0],
-                response[1],
-                response[3],
-                response[4],
-            ]
-            if response[2] in responses_dict:
-                responses_dict[response[2]].append(response_list)
+            if question_text in responses_dict:
+                responses_dict[question_text].append(response_list)
             else:
-                responses_dict[response[2]] = []
-                responses_dict[response[2]].append(response_list)
+                responses_dict[question_text] = [response_list]
 
         collated_responses = []
         for question in responses_dict:
@@ -369,6 +443,21 @@ class RereadingAnalysis:
 
         return collated_responses
 
+    @staticmethod
+    def _top_words(word_counts, results_to_show=5):
+        """
+        Returns the most common words of a Counter of response words (stopwords and punctuation
+        already excluded), joined into a single comma-separated string
+
+        :param word_counts: Counter
+        :param results_to_show: int, how many words to return
+        :return: str
+        """
+        # Find the most common words for the question, and turn them into a string
+        # for it to display properly in the frontend
+        most_common_words = word_counts.most_common(results_to_show)
+        return ', '.join(word for word, _ in most_common_words)
+
     def get_top_words_for_question(self, question):
         """
         Returns the top 3 most common words used to answer a question
@@ -377,41 +466,20 @@ class RereadingAnalysis:
         :param question: Question object
         :return: List of tuples in the form (response, frequency)
         """
+        snapshot = self.snapshot
 
-        # Keep track of frequency of each response
-        responses_frequency = Counter()
-
-        # Get all responses to the given question, based on whether its a doc or segment question
-
+        # Get the word counts of the given question, based on whether its a doc or segment question
         if isinstance(question, SegmentQuestion):
-            # for res in self.responses:
-            #     print(res.question.id == question.id)
-            responses = filter(lambda x: x.question.id == question.id, self.responses)
+            question_ids = snapshot.segment_questions.ids
+            word_counts = snapshot.text_stats.word_counts
         else:
-            responses = filter(lambda x: x.question.id == question.id, self.doc_questions_response)
-
-        # Iterate through and count all of the words in the responses
-        for student_response in responses:
-            student_answer_words = student_response.response.lower().split()
-            filtered_words = filter(lambda x: x not in STOPWORDS and x not in string.punctuation,
-                                    student_answer_words)
-            for word in filtered_words:
-                # If you wanted to, you can remove some of the punctuation attached to words here
-                responses_frequency[word] += 1
-
-        # Find the most common words for the question
-        results_to_show = 5
-        most_common_words = responses_frequency.most_common(results_to_show)
-
-        # Turn the words into a string for it to display properly in the frontend
-        words = ''
-        for frequency_pair in most_common_words:
-            word = frequency_pair[0]
-            words += word + ', '
-
-        # Strip the trailing whitespace and comma from the string of words
-        words = words[:-2]
-        return words
+            question_ids = snapshot.doc_questions.ids
+            word_counts = snapshot.text_stats.doc_word_counts
+
+        question_index = question_ids.index.get(question.id)
+        if question_index is None:
+            return ''
+        return self._top_words(word_counts[question_index])
 
     def most_common_words_by_question(self):
         """
@@ -421,22 +489,28 @@ class RereadingAnalysis:
         :return: List of lists, where each inner list is a question. Lists are of the form
         [segment_num, question_num, question_text, responses]
         """
+        if self.use_aggregates:
+            return aggregates.most_common_words_by_question()
+
+        snapshot = self.snapshot
+        text_stats = snapshot.text_stats
+
         # Initialize a list of lists to keep track of the top responses
         top_words = list()
 
         # Iterate through the questions to find the top response for each, and store it
-        for question in self.doc_questions:
-            top_question_words = self.get_top_words_for_question(question)
-            question_text = question.text
-            question_num = question.sequence
+        for question_index, word_counts in enumerate(text_stats.doc_word_counts):
+            top_question_words = self._top_words(word_counts)
+            question_text = snapshot.doc_questions.texts[question_index]
+            question_num = snapshot.doc_questions.sequences[question_index]
             data_list = ['Global', question_num, question_text, top_question_words]
             top_words.append(data_list)
 
-        for question in self.segment_questions:
-            top_question_words = self.get_top_words_for_question(question)
-            question_text = question.text
-            segment_num = question.segment.sequence
-            question_num = question.sequence
+        for question_index, word_counts in enumerate(text_stats.word_counts):
+            top_question_words = self._top_words(word_counts)
+            question_text = snapshot.segment_questions.texts[question_index]
+            segment_num = snapshot.segment_questions.segment_sequences[question_index]
+            question_num = snapshot.segment_questions.sequences[question_index]
             data_list = [segment_num, question_num, question_text, top_question_words]
             top_words.append(data_list)
 
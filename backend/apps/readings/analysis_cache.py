@@ -0,0 +1,118 @@
+"""
+
+analysis_cache.py - versioned cache for computed /api/analysis/ results
+
+Results are stored in the 'analysis' cache (see CACHES in config/settings) together with
+the data version they were computed from. The data version is read from the database,
+so it changes as soon as any process writes new reading data (reading_view creates a
+StudentReadingData, add_response bumps its last_updated_time), without the gunicorn
+workers having to coordinate.
+
+When the cached result is out of date we serve it anyway (stale-while-revalidate) and
+recompute it on a background thread; only a cold cache makes a request wait.
+
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Count, Max
+
+from .models import StudentReadingData
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_ALIAS = 'analysis'
+RESULT_KEY = 'analysis:result:{}'
+REFRESH_LOCK_KEY = 'analysis:refreshing:{}'
+
+# How long (seconds) a background recomputation may hold its lock before another
+# process is allowed to start one, in case the first one died
+REFRESH_LOCK_TIMEOUT = 300
+
+
+def get_analysis_cache():
+    """ The Django cache backend holding analysis results """
+    return caches[ANALYSIS_CACHE_ALIAS]
+
+
+def get_data_version():
+    """
+    Returns a value that changes whenever readings are added or updated:
+    the number of StudentReadingData rows and their latest last_updated_time.
+
+    :return: str
+    """
+    version = StudentReadingData.objects.aggregate(
+        reading_count=Count('id'),
+        last_updated=Max('last_updated_time'),
+    )
+    last_updated = version['last_updated'].isoformat() if version['last_updated'] else ''
+    return f"{version['reading_count']}:{last_updated}"
+
+
+def _refresh(name, version, compute):
+    """
+    Recomputes an analysis result and stores it under the given data version
+
+    :param name: str, which result this is (part of the cache key)
+    :param version: str, the data version compute() will see
+    :param compute: callable returning the (picklable) result
+    :return: the result
+    """
+    result = compute()
+    get_analysis_cache().set(
+        RESULT_KEY.format(name),
+        {'version': version, 'result': result},
+        timeout=None,
+    )
+    return result
+
+
+def _refresh_in_background(name, version, compute):
+    """
+    Starts a thread that recomputes the result, unless some process already is
+    """
+    cache = get_analysis_cache()
+    lock_key = REFRESH_LOCK_KEY.format(name)
+    if not cache.add(lock_key, version, timeout=REFRESH_LOCK_TIMEOUT):
+        return
+
+    def refresh():
+        try:
+            _refresh(name, version, compute)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Background refresh of analysis %s failed', name)
+        finally:
+            cache.delete(lock_key)
+            # this thread got its own db connection; don't leave it open
+            connection.close()
+
+    threading.Thread(target=refresh, name=f'analysis-refresh-{name}', daemon=True).start()
+
+
+def get_cached_analysis(name, compute):
+    """
+    Returns the result of compute(), reusing the cached one if the data hasn't changed since.
+
+    If the data has changed, the previous result is returned straight away and a background
+    thread recomputes it (unless settings.ANALYSIS_CACHE_REFRESH_IN_BACKGROUND is off, in
+    which case we recompute before returning).
+
+    :param name: str, identifies this result in the cache
+    :param compute: callable returning the (picklable) result
+    :return: the result
+    """
+    version = get_data_version()
+    cached = get_analysis_cache().get(RESULT_KEY.format(name))
+
+    if cached is not None:
+        if cached['version'] == version:
+            return cached['result']
+        if settings.ANALYSIS_CACHE_REFRESH_IN_BACKGROUND:
+            _refresh_in_background(name, version, compute)
+            return cached['result']
+
+    return _refresh(name, version, compute)
@@ -5,9 +5,53 @@ analysis_helpers.py - helper functions for rereading analyses
 """
 
 import math
+import re
+import string
+from collections import Counter
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
 from config.settings.base import PROJECT_ROOT
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: without it, the heat maps are counted in Python
+    np = None
+
+# all relevant words used for two functions
+RELEVANT_WORDS = ["stereotypes", "bias", "assumptions", "assume", "narrator", "memory",
+                  "forget", "Twyla", "Maggie", "Roberta", "black", "white", "prejudice",
+                  "mothers", "segregation", "hate", "hatred", "love", "love-hate",
+                  "remember", "children", "recall", "kick", "truth", "dance", "sick",
+                  "fade", "old", "Mary", "sandy", "race", "racial", "racism",
+                  "colorblind", "disabled", "marginalized", "poor", "rich", "wealthy",
+                  "middle-class", "working-class", "consumers", "shopping", "read",
+                  "misread", "reread", "reconsider", "confuse", "wrong", "mistaken",
+                  "regret", "mute", "voiceless", "women", "age", "bird", "time", "scene",
+                  "setting", "Hendrix ", "universal", "binary", "deconstruct",
+                  "question", "wrong", "right", "incorrect", "false", "claims", "true",
+                  "truth", "unknown", "ambiguous", "unclear"]
+
+STOPWORDS = ['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're",
+             "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he',
+             'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's",
+             'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which',
+             'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are',
+             'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does',
+             'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until',
+             'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into',
+             'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down',
+             'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here',
+             'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more',
+             'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so',
+             'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should',
+             "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't",
+             'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn',
+             "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn',
+             "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn',
+             "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"]
+
+
 
 def description_has_relevant_words(story_meaning_description, relevant_words):
     """
@@ -133,15 +177,177 @@ def remove_outliers(data):
     return data_no_outliers
 
 
+class WordMatcher:
+    """
+    Finds any of a list of words in a text, case-insensitively, in a single pass however
+    many words there are: the words are compiled into one alternation regex.
+
+    By default a word matches anywhere it occurs as a substring (so 'read' matches in
+    'reread'); with word_boundary=True it only matches as a whole word, i.e. when it isn't
+    preceded or followed by a letter, digit or underscore.
+    """
+    def __init__(self, words, word_boundary=False):
+        """
+        :param words: iterable of str; duplicates (ignoring case) and empty strings are dropped
+        :param word_boundary: bool, whether words only match as whole words
+        """
+        # lowercased word -> the spelling it was first given in, in order
+        spellings = {}
+        for word in words:
+            if word:
+                spellings.setdefault(word.lower(), word)
+        self.words = list(spellings.values())
+        self.word_boundary = word_boundary
+
+        # longest first, so that the regex prefers 'love-hate' to 'love'
+        alternation = '|'.join(
+            re.escape(word) for word in sorted(spellings, key=len, reverse=True)
+        )
+        if word_boundary:
+            alternation = rf'(?<!\w)(?:{alternation})(?!\w)'
+        self._pattern = re.compile(alternation) if self.words else None
+
+    def contains_any(self, text):
+        """
+        :param text: str
+        :return: bool, whether any of the words occurs in text
+        """
+        if self._pattern is None:
+            return False
+        return self._pattern.search(text.lower()) is not None
+
+
+@lru_cache(maxsize=32)
+def get_word_matcher(words, word_boundary=False):
+    """
+    Returns a WordMatcher for words, building each one only once
+
+    :param words: tuple of str
+    :param word_boundary: bool, see WordMatcher
+    """
+    return WordMatcher(words, word_boundary=word_boundary)
+
+
+# matches RELEVANT_WORDS in responses (with string_contains_words' substring semantics)
+RELEVANT_WORDS_MATCHER = get_word_matcher(tuple(RELEVANT_WORDS))
+
+_RELEVANT_WORDS_SET = frozenset(RELEVANT_WORDS)
+_STOPWORDS_SET = frozenset(STOPWORDS)
+
+
 def string_contains_words(input_string, target_words):
     """ Checks if a given input_string contains any of the words in the list of target_words """
     if not target_words:
         return True
 
-    input_string_lowercase = input_string.lower()
+    return get_word_matcher(tuple(target_words)).contains_any(input_string)
 
-    for word in target_words:
-        if word.lower() in input_string_lowercase:
-            return True
 
-    return False
+def relevant_words_in(input_string, relevant_words):
+    """
+    Returns the whitespace-separated words of input_string that are (exactly, case-sensitively)
+    one of the relevant_words, in order
+    """
+    return [word for word in input_string.split() if word in relevant_words]
+
+
+def _is_content_word(word):
+    """ Whether a lowercased word is neither a stopword nor bare punctuation """
+    return word not in _STOPWORDS_SET and word not in string.punctuation
+
+
+def content_words(input_string):
+    """
+    Returns the lowercased, whitespace-separated words of input_string,
+    dropping stopwords and bare punctuation
+    """
+    return [word for word in input_string.lower().split() if _is_content_word(word)]
+
+
+def tokenize_response(input_string):
+    """
+    Splits a response into words once, and derives from them everything the text analyses
+    need, equal to what the functions above return separately.
+
+    :param input_string: str, a student's response
+    :return: tuple (string_contains_words(input_string, RELEVANT_WORDS),
+                    relevant_words_in(input_string, RELEVANT_WORDS),
+                    content_words(input_string))
+    """
+    tokens = input_string.split()
+    relevant_words = [token for token in tokens if token in _RELEVANT_WORDS_SET]
+    lowercase_words = [token.lower() for token in tokens]
+    return (
+        RELEVANT_WORDS_MATCHER.contains_any(input_string),
+        relevant_words,
+        [word for word in lowercase_words if _is_content_word(word)],
+    )
+
+
+def heat_map_buckets(scroll_data, bucket_size):
+    """
+    Counts scroll positions by the section of the segment they fall in, leaving out
+    negative positions (scrolling past the top)
+
+    :param scroll_data: iterable of int scroll positions
+    :param bucket_size: int, height of a section in pixels
+    :return: Counter mapping section numbers (from 0, at the top) to position counts,
+             in the order the sections were first scrolled to
+    """
+    return Counter(position // bucket_size for position in scroll_data if position >= 0)
+
+
+def heat_map_buckets_numpy(scroll_data_list, bucket_size):
+    """
+    heat_map_buckets() for all of the scroll positions in scroll_data_list, vectorized:
+    the arrays are concatenated into one NumPy array (without copying each one to a list
+    first), negative positions are masked out, and the sections counted with bincount().
+
+    :param scroll_data_list: list of array('i') of scroll positions
+    :param bucket_size: int, height of a section in pixels
+    :return: dict mapping section numbers to position counts, from the top section down
+             (the same counts as heat_map_buckets(), which lists them as first scrolled to)
+    """
+    positions = np.concatenate(
+        [np.frombuffer(scroll_data, dtype=np.intc)
+         for scroll_data in scroll_data_list if scroll_data]
+        or [np.empty(0, dtype=np.intc)]
+    )
+    counts = np.bincount(positions[positions >= 0] // bucket_size)
+    return {int(bucket): int(counts[bucket]) for bucket in np.flatnonzero(counts)}
+
+
+def count_heat_map_buckets(scroll_data_list, bucket_size):
+    """
+    Counts the scroll positions of several segment data rows by section, with NumPy
+    when it's installed
+
+    :param scroll_data_list: list of array('i') of scroll positions
+    :param bucket_size: int, height of a section in pixels
+    :return: dict mapping section numbers to position counts
+    """
+    if np is not None:
+        return heat_map_buckets_numpy(scroll_data_list, bucket_size)
+    return heat_map_buckets(chain.from_iterable(scroll_data_list), bucket_size)
+
+
+def heat_map_section(bucket, bucket_size):
+    """
+    :return: str, how the heat maps label a section, e.g. '500 — 1000'
+    """
+    return str(bucket * bucket_size) + " — " + str((bucket + 1) * bucket_size)
+
+
+def document_labels(documents):
+    """
+    Labels documents by their title, adding the document id to the titles that more than
+    one of them share
+
+    :param documents: list of (document id, title) pairs
+    :return: list of str labels, in the same order
+    """
+    title_counts = Counter(title for _, title in documents)
+    return [
+        title if title_counts[title] == 1 else f'{title} ({document_id})'
+        for document_id, title in documents
+    ]
@@ -0,0 +1,164 @@
+"""
+
+analysis_parallel.py - evaluates several RereadingAnalysis metrics concurrently
+
+The metrics are independent of each other, so instead of running them one after another
+we hand them to two pools:
+
+- the text metrics (relevant words, top words) are pure Python loops over the response
+  texts, so they run in a pool of worker processes. They all read the same snapshot and
+  the same pass over the texts (AnalysisSnapshot.text_stats), so one worker evaluates
+  all of them, on one RereadingAnalysis it builds for them
+- everything else mostly waits on the database, so it runs on threads sharing the
+  request's RereadingAnalysis
+
+The worker reads the database itself, so it checks that the data hasn't changed since
+the request started (see get_data_version()); if it has, the request evaluates the text
+metrics itself, so that they aren't computed from newer data than the rest.
+
+This is only done with settings.ANALYSIS_PARALLEL (or parallel=True); by default the
+metrics are evaluated one after another.
+
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+# CPU-bound metrics, worth the trip to another process when they scan the response texts
+TEXT_ANALYSES = (
+    'relevant_words_by_question',
+    'percent_using_relevant_words_by_question',
+    'relevant_words_percent_display_question',
+    'most_common_words_by_question',
+)
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _init_worker(database_name):
+    """
+    Sets up Django in a freshly spawned worker process, reading the same database as the
+    process that started it (e.g. the test database, while testing)
+    """
+    import django  # pylint: disable=import-outside-toplevel
+    settings.DATABASES['default']['NAME'] = database_name
+    django.setup()
+
+
+def _get_process_pool():
+    """
+    The worker processes are started once and reused by every request.
+    They are spawned rather than forked, so they never share a database connection
+    (or any other open socket) with the process that started them.
+
+    :return: ProcessPoolExecutor
+    """
+    global _process_pool  # pylint: disable=global-statement
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.ANALYSIS_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(connection.settings_dict['NAME'],),
+            )
+        return _process_pool
+
+
+def shutdown_process_pool():
+    """ Stops the worker processes; the next parallel evaluation starts new ones """
+    global _process_pool  # pylint: disable=global-statement
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown()
+            _process_pool = None
+
+
+def _evaluate_in_worker(analysis_kwargs, names, data_version):
+    """
+    Runs some metrics of one new RereadingAnalysis built from analysis_kwargs
+    (in a worker process, which can't be handed the request's analysis object),
+    so that they share its snapshot
+
+    :param data_version: str, the get_data_version() the request saw
+    :return: dict mapping each name to its result, or None if the data version changed
+             (the version only grows, so if it's the same once the metrics are done,
+             they read the data the request did)
+    """
+    # pylint: disable=import-outside-toplevel
+    from .analysis import RereadingAnalysis
+    from .analysis_cache import get_data_version
+    analysis = RereadingAnalysis(**analysis_kwargs)
+    results = {name: getattr(analysis, name)() for name in names}
+    if get_data_version() != data_version:
+        return None
+    return results
+
+
+def _evaluate_in_thread(analysis, name):
+    """ Runs one metric of analysis, then closes the db connection this thread opened """
+    try:
+        return getattr(analysis, name)()
+    finally:
+        connection.close()
+
+
+def _runs_in_process(analysis, name):
+    """
+    Whether a metric goes to the process pool: only the text metrics, and only when they
+    have to scan the responses rather than read the running aggregates
+    """
+    return name in TEXT_ANALYSES and not analysis.use_aggregates
+
+
+def evaluate_analyses(analysis, names, parallel=None):
+    """
+    Evaluates the named metrics of a RereadingAnalysis
+
+    The results are the same as calling the metrics one by one. If the calling thread is
+    inside a transaction we also do just that, since other connections can't see the
+    transaction's uncommitted rows.
+
+    :param analysis: RereadingAnalysis
+    :param names: iterable of metric (method) names
+    :param parallel: bool, defaults to settings.ANALYSIS_PARALLEL
+    :return: dict mapping each name to its result, in the order given
+    """
+    names = list(names)
+    if parallel is None:
+        parallel = settings.ANALYSIS_PARALLEL
+    if not parallel or len(names) < 2 or connection.in_atomic_block:
+        return {name: getattr(analysis, name)() for name in names}
+
+    # the worker processes import this module before Django is set up, so the models
+    # can only be imported here
+    from .analysis_cache import get_data_version  # pylint: disable=import-outside-toplevel
+
+    futures = {}
+    process_names = [name for name in names if _runs_in_process(analysis, name)]
+    thread_names = [name for name in names if name not in process_names]
+
+    process_results = None
+    if process_names:
+        process_results = _get_process_pool().submit(
+            _evaluate_in_worker, analysis.get_init_kwargs(), process_names, get_data_version()
+        )
+
+    if thread_names:
+        with ThreadPoolExecutor(max_workers=len(thread_names),
+                                thread_name_prefix='analysis') as thread_pool:
+            for name in thread_names:
+                futures[name] = thread_pool.submit(_evaluate_in_thread, analysis, name)
+
+    results = {name: future.result() for name, future in futures.items()}
+    if process_results is not None:
+        worker_results = process_results.result()
+        if worker_results is None:
+            # the data changed under the worker
+            worker_results = {name: getattr(analysis, name)() for name in process_names}
+        results.update(worker_results)
+    return {name: results[name] for name in names}
@@ -0,0 +1,107 @@
+"""
+
+analysis_queries.py - RereadingAnalysis aggregates computed inside the database
+
+Each function here takes the querysets RereadingAnalysis already holds and lets the
+database do the summing, grouping and counting, so only one row per group comes back
+to Python. Everything sticks to SQL that SQLite and Postgres both understand.
+
+"""
+import math
+
+from django.db.models import Count, Q, Sum
+
+
+def percentile(queryset, field, fraction):
+    """
+    Computes a percentile of one column of a (possibly grouped) queryset, interpolating
+    linearly between the two closest ranks, like Postgres' percentile_cont.
+    Only the one or two rows around the requested rank are fetched, using ORDER BY
+    with LIMIT/OFFSET, which keeps this portable across SQLite and Postgres.
+
+    :param queryset: QuerySet whose rows contain field (e.g. an annotated GROUP BY)
+    :param field: str, name of the column or annotation to take the percentile of
+    :param fraction: float between 0 and 1 (0.5 for the median)
+    :return: float, or None if the queryset is empty
+    """
+    row_count = queryset.count()
+    if not row_count:
+        return None
+
+    position = fraction * (row_count - 1)
+    lower_rank = math.floor(position)
+    upper_rank = math.ceil(position)
+    values = list(
+        queryset.order_by(field).values_list(field, flat=True)[lower_rank:upper_rank + 1]
+    )
+    if len(values) == 1:
+        return values[0]
+    return values[0] + (values[1] - values[0]) * (position - lower_rank)
+
+
+def median(queryset, field):
+    """
+    The median of one column of a queryset, see percentile()
+    :return: float, or None if the queryset is empty
+    """
+    return percentile(queryset, field, 0.5)
+
+
+def total_and_median_view_time(segments):
+    """
+    SQL version of RereadingAnalysis.total_and_median_view_time:
+    SUM(view_time) overall, and the median of SUM(view_time) ... GROUP BY reading_data_id
+
+    :param segments: StudentSegmentData queryset
+    :return: a tuple containing (total view time, median view time per student)
+    """
+    total_time = segments.aggregate(total=Sum('view_time'))['total'] or 0
+    reading_totals = (
+        segments.order_by()
+        .values('reading_data_id')
+        .annotate(reading_total=Sum('view_time'))
+    )
+    median_view_time = median(reading_totals, 'reading_total') or 0
+    return round(total_time), round(median_view_time)
+
+
+def mean_reading_vs_rereading_time(segments, reading_count):
+    """
+    SQL version of RereadingAnalysis.mean_reading_vs_rereading_time, using a conditional
+    SUM on is_rereading
+
+    :param segments: StudentSegmentData queryset
+    :param reading_count: int, number of readings to average over
+    :return: a tuple with (mean reading time, mean rereading time)
+    """
+    if reading_count == 0:
+        return 0.0, 0.0
+
+    totals = segments.aggregate(
+        reading_time=Sum('view_time', filter=Q(is_rereading=False)),
+        rereading_time=Sum('view_time', filter=Q(is_rereading=True)),
+    )
+    reading_time = totals['reading_time'] or 0
+    rereading_time = totals['rereading_time'] or 0
+    return round(reading_time / reading_count), round(rereading_time / reading_count)
+
+
+def compute_reread_counts(segments, reading_count):
+    """
+    SQL version of RereadingAnalysis.compute_reread_counts:
+    COUNT(*) of rereads longer than a second, GROUP BY segment__sequence
+
+    :param segments: StudentSegmentData queryset
+    :param reading_count: int, number of readings to average over
+    :return: list of [segment sequence, rereads per reading]
+    """
+    reread_counts = (
+        segments.filter(is_rereading=True, view_time__gt=1.0)
+        .order_by('segment__sequence')
+        .values_list('segment__sequence')
+        .annotate(reread_count=Count('id'))
+    )
+    return [
+        [sequence, round(reread_count / reading_count, 2)]
+        for sequence, reread_count in reread_counts
+    ]
@@ -0,0 +1,306 @@
+"""
+
+analysis_snapshot.py - columnar, in-memory snapshot of the data RereadingAnalysis reads
+
+"""
+import threading
+from array import array
+from collections import Counter
+
+from .analysis_helpers import tokenize_response
+from .models import Document
+
+
+class Interner:
+    """
+    Maps arbitrary hashable keys (usually primary keys) to dense, 0-indexed ints,
+    so that rows can refer to them through a compact array('i') column.
+    """
+    def __init__(self):
+        self.index = {}
+        self.keys = []
+
+    def intern(self, key):
+        """
+        Returns the dense index for key, assigning the next free one if it is new
+        :param key: any hashable value
+        :return: int
+        """
+        position = self.index.get(key)
+        if position is None:
+            position = len(self.keys)
+            self.index[key] = position
+            self.keys.append(key)
+        return position
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class ResponseTextStats:  # pylint: disable=too-few-public-methods
+    """
+    Everything the text analyses read from the responses' words, gathered in a single pass
+    that tokenizes each response once (see tokenize_response).
+    Per-question lists are indexed by the snapshot's interned question indices.
+    """
+    def __init__(self, snapshot):
+        """
+        :param snapshot: AnalysisSnapshot
+        """
+        question_count = len(snapshot.segment_questions.ids)
+        responses = snapshot.segment_responses
+        doc_responses = snapshot.doc_responses
+
+        # segment question indices, in the order they were first answered
+        self.question_order = []
+        self.response_counts = [0] * question_count
+        # number of responses with a relevant word anywhere in them
+        self.relevant_response_counts = [0] * question_count
+        # relevant word -> occurrences (as whole words)
+        self.relevant_word_counts = [Counter() for _ in range(question_count)]
+        # non-stopword -> occurrences, for the top words
+        self.word_counts = [Counter() for _ in range(question_count)]
+        self.doc_word_counts = [Counter() for _ in range(len(snapshot.doc_questions.ids))]
+
+        for question_index, response in zip(responses.question_indices, responses.texts):
+            has_relevant_words, relevant_words, content_words = tokenize_response(response)
+            if not self.response_counts[question_index]:
+                self.question_order.append(question_index)
+            self.response_counts[question_index] += 1
+            if has_relevant_words:
+                self.relevant_response_counts[question_index] += 1
+            self.relevant_word_counts[question_index].update(relevant_words)
+            self.word_counts[question_index].update(content_words)
+
+        for question_index, response in zip(doc_responses.question_indices,
+                                            doc_responses.texts):
+            self.doc_word_counts[question_index].update(tokenize_response(response)[2])
+
+
+class SegmentQuestionColumns:  # pylint: disable=too-few-public-methods
+    """ The SegmentQuestion table, in pk order; row i is the question interned as i """
+    def __init__(self, queryset):
+        self.ids = Interner()
+        self.texts = []
+        self.sequences = array('i')
+        self.segment_sequences = array('i')
+        for question_id, text, sequence, segment_sequence in queryset.values_list(
+                'id', 'text', 'sequence', 'segment__sequence'):
+            self.ids.intern(question_id)
+            self.texts.append(text)
+            self.sequences.append(sequence)
+            self.segment_sequences.append(segment_sequence)
+
+
+class DocumentQuestionColumns:  # pylint: disable=too-few-public-methods
+    """ The DocumentQuestion table, in pk order; row i is the question interned as i """
+    def __init__(self, queryset):
+        self.ids = Interner()
+        self.texts = []
+        self.sequences = array('i')
+        for question_id, text, sequence in queryset.values_list('id', 'text', 'sequence'):
+            self.ids.intern(question_id)
+            self.texts.append(text)
+            self.sequences.append(sequence)
+
+
+class SegmentDataColumns:  # pylint: disable=too-few-public-methods
+    """
+    The StudentSegmentData table (without its scroll data, see AnalysisSnapshot.scroll_data);
+    documents are interned, like questions
+    """
+    def __init__(self, queryset):
+        self.ids = array('q')
+        self.reading_ids = array('q')
+        self.view_times = array('d')
+        self.is_rereading = array('b')
+        self.segment_sequences = array('i')
+        self.document_indices = array('i')
+        self.document_ids = Interner()
+        for (segment_data_id, reading_id, view_time, is_rereading, sequence,
+             document_id) in queryset.values_list(
+                 'id', 'reading_data_id', 'view_time', 'is_rereading',
+                 'segment__sequence', 'reading_data__document_id'):
+            self.ids.append(segment_data_id)
+            self.reading_ids.append(reading_id)
+            self.view_times.append(view_time)
+            self.is_rereading.append(is_rereading)
+            self.segment_sequences.append(sequence)
+            self.document_indices.append(self.document_ids.intern(document_id))
+
+
+class SegmentResponseColumns:  # pylint: disable=too-few-public-methods
+    """
+    The SegmentQuestionResponse table. The question tables are the ones to interpret
+    responses against, so a response to a question outside of them (another document's)
+    is left out.
+    """
+    def __init__(self, queryset, question_ids):
+        """
+        :param queryset: SegmentQuestionResponse queryset
+        :param question_ids: Interner of the SegmentQuestion ids
+        """
+        self.question_indices = array('i')
+        self.segment_sequences = array('i')
+        self.texts = []
+        self.evidence = []
+        for question_id, text, segment_sequence, evidence in queryset.values_list(
+                'question_id', 'response', 'student_segment_data__segment__sequence',
+                'evidence'):
+            question_index = question_ids.index.get(question_id)
+            if question_index is None:
+                continue
+            self.question_indices.append(question_index)
+            self.segment_sequences.append(segment_sequence)
+            self.texts.append(text)
+            self.evidence.append(evidence)
+
+
+class DocumentResponseColumns:  # pylint: disable=too-few-public-methods
+    """ The DocumentQuestionResponse table, left out like SegmentResponseColumns """
+    def __init__(self, queryset, question_ids):
+        """
+        :param queryset: DocumentQuestionResponse queryset
+        :param question_ids: Interner of the DocumentQuestion ids
+        """
+        self.question_indices = array('i')
+        self.texts = []
+        for question_id, text in queryset.values_list('question_id', 'response'):
+            question_index = question_ids.index.get(question_id)
+            if question_index is None:
+                continue
+            self.question_indices.append(question_index)
+            self.texts.append(text)
+
+
+class AnalysisSnapshot:
+    """
+    Reads StudentReadingData, StudentSegmentData, SegmentQuestionResponse and
+    DocumentQuestionResponse rows using values_list() so that no model instances are built,
+    and stores each table as parallel columns: row i of the segment data is
+    (segment_data.reading_ids[i], segment_data.view_times[i], ...).
+
+    Each table is only read the first time an analysis asks for it, so a metric that only
+    needs the readings (e.g. the number of unique students) doesn't read the responses.
+
+    Question ids are interned: responses store a dense index into the question tables
+    rather than a pk, so grouping by question is a plain list lookup.
+    """
+
+    def __init__(self, readings, segments, responses, doc_responses,  # pylint: disable=R0913
+                 segment_questions, doc_questions):
+        """
+        :param readings: StudentReadingData queryset
+        :param segments: StudentSegmentData queryset
+        :param responses: SegmentQuestionResponse queryset
+        :param doc_responses: DocumentQuestionResponse queryset
+        :param segment_questions: SegmentQuestion queryset
+        :param doc_questions: DocumentQuestion queryset
+        """
+        self._readings_queryset = readings
+        self._segments_queryset = segments
+        self._responses_queryset = responses
+        self._doc_responses_queryset = doc_responses
+        self._segment_questions_queryset = segment_questions
+        self._doc_questions_queryset = doc_questions
+        self._tables = {}
+        # Metrics may run on several threads at once (see analysis_parallel.py), so loading
+        # is locked to make sure each table is only read once; loading one table can load
+        # another (the responses need the questions), hence an RLock
+        self._lock = threading.RLock()
+
+    def _load(self, name, load):
+        """
+        :param name: str, the table's name
+        :param load: callable reading the table
+        :return: the table, read on first use
+        """
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = load()
+            return self._tables[name]
+
+    def is_loaded(self, name):
+        """ Whether the table name (e.g. 'segment_data') has been read already """
+        return name in self._tables
+
+    @property
+    def student_names(self):
+        """ :return: list of str, the student name of each reading """
+        return self._load('readings', lambda: [
+            name for (name,) in self._readings_queryset.values_list('student__name')
+        ])
+
+    @property
+    def reading_count(self):
+        """ :return: int """
+        return len(self.student_names)
+
+    @property
+    def segment_questions(self):
+        """ :return: SegmentQuestionColumns """
+        return self._load('segment_questions',
+                          lambda: SegmentQuestionColumns(self._segment_questions_queryset))
+
+    @property
+    def doc_questions(self):
+        """ :return: DocumentQuestionColumns """
+        return self._load('doc_questions',
+                          lambda: DocumentQuestionColumns(self._doc_questions_queryset))
+
+    @property
+    def segment_data(self):
+        """ :return: SegmentDataColumns """
+        return self._load('segment_data', lambda: SegmentDataColumns(self._segments_queryset))
+
+    @property
+    def segment_responses(self):
+        """ :return: SegmentResponseColumns """
+        return self._load('segment_responses', lambda: SegmentResponseColumns(
+            self._responses_queryset, self.segment_questions.ids,
+        ))
+
+    @property
+    def doc_responses(self):
+        """ :return: DocumentResponseColumns """
+        return self._load('doc_responses', lambda: DocumentResponseColumns(
+            self._doc_responses_queryset, self.doc_questions.ids,
+        ))
+
+    @property
+    def document_titles(self):
+        """
+        Titles of the documents referenced by the segment data, indexed like
+        segment_data.document_indices
+        :return: list of str
+        """
+        def load():
+            document_ids = self.segment_data.document_ids.keys
+            titles = dict(
+                Document.objects.filter(pk__in=document_ids).values_list('id', 'title')
+            )
+            return [titles[document_id] for document_id in document_ids]
+        return self._load('document_titles', load)
+
+    @property
+    def scroll_data(self):
+        """
+        Scroll positions for each segment data row. These are by far the largest
+        column, so they are only loaded when an analysis (i.e. the heat map) asks for them.
+        :return: list of array('i') of scroll positions
+        """
+        def load():
+            scroll_data = dict(self._segments_queryset.values_list('id', 'scroll_data'))
+            return [
+                scroll_data.get(segment_data_id, array('i'))
+                for segment_data_id in self.segment_data.ids
+            ]
+        return self._load('scroll_data', load)
+
+    @property
+    def text_stats(self):
+        """
+        Word counts and relevant word hits of the responses, computed on first use
+        :return: ResponseTextStats
+        """
+        return self._load('text_stats', lambda: ResponseTextStats(self))
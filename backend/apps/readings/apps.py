@@ -5,6 +5,11 @@ Configuration for the Readings app.
 from django.apps import AppConfig
 
 
-class StoryConfig(AppConfig):
-    # noinspection PyUnresolvedReferences
-    name = 'readings'
+class ReadingsConfig(AppConfig):
+    """ Connects the app's signal receivers once the models are loaded """
+    name = 'apps.readings'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel,unused-import
+        # importing these registers their receivers
+        from . import aggregates, counters, document_cache  # noqa: F401
@@ -0,0 +1,121 @@
+"""
+
+counters.py - counts stored on Document, Segment and StudentReadingData
+
+Document.segment_count, Segment.word_count and StudentReadingData.segment_data_count and
+total_view_time are stored so that len(), __str__() and get_total_view_time() -- and so the
+admin's list pages -- don't make a query (or split a segment's text) for every object.
+
+A segment's word count is computed as it is saved. Saving or deleting a Segment recounts
+its document's segments, and saving or deleting a StudentSegmentData recounts its
+reading's segment data (see the receivers below, connected in apps.py). Recounting with a
+single UPDATE, rather than adding to the stored counts, means a row saved twice is never
+counted twice.
+
+bulk_create() and QuerySet.update() don't send those signals, so
+StudentReadingDataSerializer.update() calls recount_readings() itself, once per
+submission; where it has to insert segment data row by row, it does so inside
+aggregates.recording_submission(), which the receivers ignore too. loaddata's raw saves
+are left to rebuild() (the rebuild_aggregates command runs it).
+
+"""
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .aggregates import is_recording_submission
+from .models import Document, Segment, StudentReadingData, StudentSegmentData
+
+
+def count_words(text):
+    """ The word count of a segment's text (just split by whitespace) """
+    return len(text.split())
+
+
+def aggregate_per_parent(queryset, parent_field, aggregate, output_field):
+    """
+    :return: Subquery of aggregate over the rows of queryset belonging to the outer row,
+             0 if there are none
+    """
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{parent_field: OuterRef('pk')})
+            .order_by()
+            .values(parent_field)
+            .annotate(value=aggregate)
+            .values('value'),
+            output_field=output_field,
+        ),
+        0,
+        output_field=output_field,
+    )
+
+
+def recount_documents(document_ids=None):
+    """
+    Recounts the segments of some documents
+
+    :param document_ids: iterable of Document ids (by default, every document)
+    """
+    documents = Document.objects.all()
+    if document_ids is not None:
+        documents = documents.filter(pk__in=document_ids)
+    documents.update(segment_count=aggregate_per_parent(
+        Segment.objects.all(), 'document', Count('pk'), IntegerField(),
+    ))
+
+
+def recount_readings(reading_ids=None):
+    """
+    Recounts the segment data, and totals its view time, of some readings
+
+    :param reading_ids: iterable of StudentReadingData ids (by default, every reading)
+    """
+    readings = StudentReadingData.objects.all()
+    if reading_ids is not None:
+        readings = readings.filter(pk__in=reading_ids)
+    segment_data = StudentSegmentData.objects.all()
+    readings.update(
+        segment_data_count=aggregate_per_parent(
+            segment_data, 'reading_data', Count('pk'), IntegerField(),
+        ),
+        total_view_time=aggregate_per_parent(
+            segment_data, 'reading_data', Sum('view_time'), FloatField(),
+        ),
+    )
+
+
+def recount_words(batch_size=500):
+    """ Recomputes the word count of every segment """
+    segments = list(Segment.objects.only('pk', 'text'))
+    for segment in segments:
+        segment.word_count = count_words(segment.text)
+    Segment.objects.bulk_update(segments, ['word_count'], batch_size=batch_size)
+
+
+def rebuild():
+    """ Recomputes all of the stored counts from the raw data """
+    recount_words()
+    recount_documents()
+    recount_readings()
+
+
+@receiver(pre_save, sender=Segment)
+def count_segment_words(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """ Counts the words of a segment about to be saved """
+    instance.word_count = count_words(instance.text)
+
+
+@receiver([post_save, post_delete], sender=Segment)
+def segment_changed(sender, instance, raw=False, **kwargs):  # pylint: disable=unused-argument
+    """ Recounts the segments of the document an added or deleted segment belongs to """
+    if not raw:
+        recount_documents([instance.document_id])
+
+
+@receiver([post_save, post_delete], sender=StudentSegmentData)
+def segment_data_changed(sender, instance, raw=False, **kwargs):  # pylint: disable=unused-argument
+    """ Recounts the segment data of the reading an edited segment data belongs to """
+    if not raw and not is_recording_submission():
+        recount_readings([instance.reading_data_id])
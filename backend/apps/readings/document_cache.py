@@ -0,0 +1,99 @@
+"""
+
+document_cache.py - cache of the serialized documents the reading view loads
+
+A document's text and questions only change when someone edits them in the admin, so
+reading_view serializes each document once and caches the result under the hash of its
+JSON (which is also its ETag). A second key maps the document's id to that hash, so a
+request can be answered -- with a 304 if the client already has that version -- without
+touching the database.
+
+Saving or deleting a Document, Segment, DocumentQuestion or SegmentQuestion drops the id's
+key (see the receivers below, connected in apps.py), and the next request re-serializes
+the document. Note that QuerySet.update() doesn't send those signals.
+
+"""
+import hashlib
+
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.renderers import JSONRenderer
+
+from .models import Document, DocumentQuestion, Segment, SegmentQuestion
+from .serializers import DocumentSerializer
+
+DOCUMENT_CACHE_ALIAS = 'documents'
+HASH_KEY = 'document:hash:{}'
+PAYLOAD_KEY = 'document:payload:{}'
+
+
+def get_document_cache():
+    """ The Django cache backend holding serialized documents """
+    return caches[DOCUMENT_CACHE_ALIAS]
+
+
+def _serialize(pk):
+    """
+    Serializes a document and caches it
+
+    :param pk: int, the Document's id
+    :return: (str, bytes), the content hash of the document and its JSON
+    :raises Document.DoesNotExist: if there's no such document
+    """
+    document = DocumentSerializer.setup_eager_loading(Document.objects).get(pk=pk)
+    data = JSONRenderer().render(DocumentSerializer(document).data)
+    content_hash = hashlib.sha256(data).hexdigest()
+    payload = {'hash': content_hash, 'data': data}
+
+    cache = get_document_cache()
+    cache.set(PAYLOAD_KEY.format(content_hash), payload, timeout=None)
+    cache.set(HASH_KEY.format(pk), content_hash, timeout=None)
+    return content_hash, data
+
+
+def get_document_payload(pk):
+    """
+    Returns a serialized document, serializing it only if it isn't cached
+
+    :param pk: int, the Document's id
+    :return: (str, bytes), the content hash of the document and its JSON
+    :raises Document.DoesNotExist: if there's no such document
+    """
+    cache = get_document_cache()
+    content_hash = cache.get(HASH_KEY.format(pk))
+    if content_hash is not None:
+        payload = cache.get(PAYLOAD_KEY.format(content_hash))
+        if payload is not None:
+            return payload['hash'], payload['data']
+    return _serialize(pk)
+
+
+def invalidate_document(pk):
+    """ Drops a document's cached serialization (the next request re-serializes it) """
+    get_document_cache().delete(HASH_KEY.format(pk))
+
+
+@receiver([post_save, post_delete], sender=Document)
+def document_changed(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """ Invalidates an edited document """
+    invalidate_document(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Segment)
+@receiver([post_save, post_delete], sender=DocumentQuestion)
+def document_part_changed(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """ Invalidates the document an edited segment or document question belongs to """
+    invalidate_document(instance.document_id)
+
+
+@receiver([post_save, post_delete], sender=SegmentQuestion)
+def segment_question_changed(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """ Invalidates the document an edited segment question belongs to """
+    # If the segment was deleted along with its questions, its own signal invalidates
+    # the document
+    document_id = (Segment.objects.filter(pk=instance.segment_id)
+                   .values_list('document_id', flat=True)
+                   .first())
+    if document_id is not None:
+        invalidate_document(document_id)
@@ -0,0 +1,275 @@
+"""
+
+export.py - columnar export of the reading data, for research
+
+The export_reading_data command writes each table below into a directory of its own,
+in parts of up to part_size rows, as CSV and/or as .rcol files (see below), along with
+a manifest.json listing the tables, their typed columns and their parts:
+
+    <export>/manifest.json
+    <export>/segment_data/part-00000.csv
+    <export>/segment_data/part-00000.rcol
+    ...
+
+analysis/analysis.py's load_export() and iter_export() read them back. CSV is the
+format to use with other tools (pandas, R, a spreadsheet). .rcol keeps each column's type
+and lets a reader load just the columns it needs, using only the standard library on
+both sides; Parquet would do the same, but it would add pyarrow to the backend and to
+the analysis toolkit.
+
+An .rcol file holds one part of a table column by column, little-endian:
+
+    b'RCOL\\x01'      the magic bytes; the last one is the version of the format
+    uint32            the length in bytes of the header
+    the header        UTF-8 JSON: {"rows": <number of rows>, "columns": [
+                          {"name": ..., "type": ..., "size": <bytes>}, ...]}
+    the columns       each column's bytes, in the order of the header, with nothing in
+                      between: a column starts at 9 + the header's length + the sizes of
+                      the columns before it, so a reader can seek to it
+
+where each column type is encoded as
+
+    int, datetime   rows int64s (datetimes as microseconds since the Unix epoch, UTC)
+    float           rows float64s
+    bool            rows int8s (0 or 1)
+    str, json, uuid rows + 1 int64 byte offsets, then the UTF-8 text: row i is the text
+                    from offsets[i] to offsets[i + 1] (json columns hold JSON text,
+                    uuids their 32 hex digits, and missing uuids are empty)
+    int_list        rows + 1 int64 offsets, then the int32 values: row i is the values
+                    from offsets[i] to offsets[i + 1]
+
+A part is encoded in memory before it is written (the header needs the columns' sizes),
+so --part-size bounds the memory that takes.
+
+"""
+import csv
+import datetime
+import json
+import struct
+import sys
+from array import array
+
+from .models import DocumentQuestionResponse, SegmentQuestionResponse, StudentSegmentData
+
+RCOL_MAGIC = b'RCOL\x01'
+EXPORT_FORMAT_VERSION = 1
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# The tables we export: the model, and the (name, type, field lookup) of each column
+EXPORT_TABLES = {
+    'segment_data': (StudentSegmentData, [
+        ('id', 'int', 'id'),
+        ('reading_data_id', 'int', 'reading_data_id'),
+        ('student_id', 'int', 'reading_data__student_id'),
+        ('document_id', 'int', 'reading_data__document_id'),
+        ('segment_id', 'int', 'segment_id'),
+        ('segment_sequence', 'int', 'segment__sequence'),
+        ('is_rereading', 'bool', 'is_rereading'),
+        ('view_time', 'float', 'view_time'),
+        ('scroll_data', 'int_list', 'scroll_data'),
+        ('submission_time', 'datetime', 'submission_time'),
+        ('event_id', 'uuid', 'event_id'),
+    ]),
+    'segment_responses': (SegmentQuestionResponse, [
+        ('id', 'int', 'id'),
+        ('segment_data_id', 'int', 'student_segment_data_id'),
+        ('reading_data_id', 'int', 'student_segment_data__reading_data_id'),
+        ('question_id', 'int', 'question_id'),
+        ('response', 'str', 'response'),
+        ('evidence', 'json', 'evidence'),
+        ('submission_time', 'datetime', 'submission_time'),
+    ]),
+    'document_responses': (DocumentQuestionResponse, [
+        ('id', 'int', 'id'),
+        ('reading_data_id', 'int', 'student_reading_data_id'),
+        ('question_id', 'int', 'question_id'),
+        ('response_segment', 'int', 'response_segment'),
+        ('response', 'str', 'response'),
+        ('evidence', 'json', 'evidence'),
+        ('submission_time', 'datetime', 'submission_time'),
+        ('event_id', 'uuid', 'event_id'),
+    ]),
+}
+
+
+def _to_text(column_type, value):
+    """ The text a str, json or uuid value is stored as """
+    if column_type == 'json':
+        return json.dumps(value)
+    if column_type == 'uuid':
+        return value.hex if value is not None else ''
+    return value
+
+
+def _to_microseconds(moment):
+    """ :return: int, microseconds since the Unix epoch """
+    return (moment - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _little_endian(values):
+    """ :return: bytes of an array, little-endian """
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_column(column_type, values):
+    """
+    Encodes one column of an .rcol file (see the module docstring)
+
+    :param column_type: str, one of the types of EXPORT_TABLES
+    :param values: list of the column's values
+    :return: bytes
+    """
+    if column_type == 'int':
+        return _little_endian(array('q', values))
+    if column_type == 'datetime':
+        return _little_endian(array('q', (_to_microseconds(value) for value in values)))
+    if column_type == 'float':
+        return _little_endian(array('d', values))
+    if column_type == 'bool':
+        return _little_endian(array('b', values))
+
+    offsets = array('q', [0])
+    if column_type == 'int_list':
+        data = array('i')
+        for value in values:
+            data.extend(value)
+            offsets.append(len(data))
+        return _little_endian(offsets) + _little_endian(data)
+
+    text = bytearray()
+    for value in values:
+        text += _to_text(column_type, value).encode('utf-8')
+        offsets.append(len(text))
+    return _little_endian(offsets) + bytes(text)
+
+
+def write_rcol(path, columns, rows):
+    """
+    Writes rows to an .rcol file
+
+    :param path: Path to write
+    :param columns: list of (name, type) pairs
+    :param rows: list of tuples of values, in the order of columns
+    """
+    blocks = [
+        encode_column(column_type, [row[i] for row in rows])
+        for i, (_, column_type) in enumerate(columns)
+    ]
+    header = json.dumps({
+        'rows': len(rows),
+        'columns': [
+            {'name': name, 'type': column_type, 'size': len(block)}
+            for (name, column_type), block in zip(columns, blocks)
+        ],
+    }).encode('utf-8')
+    with open(path, 'wb') as rcol_file:
+        rcol_file.write(RCOL_MAGIC)
+        rcol_file.write(struct.pack('<I', len(header)))
+        rcol_file.write(header)
+        for block in blocks:
+            rcol_file.write(block)
+
+
+def write_csv(path, columns, rows):
+    """
+    Writes rows to a CSV file, with a header row (lists and json as JSON text,
+    datetimes in ISO 8601, missing uuids empty)
+
+    :param path: Path to write
+    :param columns: list of (name, type) pairs
+    :param rows: list of tuples of values, in the order of columns
+    """
+    def to_csv(column_type, value):
+        if column_type == 'int_list':
+            return json.dumps(value.tolist())
+        if column_type == 'datetime':
+            return value.isoformat()
+        if column_type in ('str', 'json', 'uuid'):
+            return _to_text(column_type, value)
+        return value
+
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(name for name, _ in columns)
+        for row in rows:
+            writer.writerow(
+                to_csv(column_type, value) for (_, column_type), value in zip(columns, row)
+            )
+
+
+WRITERS = {
+    'csv': write_csv,
+    'rcol': write_rcol,
+}
+
+
+def export_table(table, directory, formats,  # pylint: disable=too-many-arguments
+                 since=None, part_size=50_000, chunk_size=2000):
+    """
+    Exports one of EXPORT_TABLES, in id order, to directory / table, streaming the rows
+    from the database chunk_size at a time and writing them part_size at a time
+
+    :param table: str, a key of EXPORT_TABLES
+    :param directory: Path of the export
+    :param formats: list of keys of WRITERS
+    :param since: datetime, if given only rows submitted (or edited) after it are exported
+    :param part_size: int, the most rows a part holds
+    :param chunk_size: int, how many rows to fetch from the database at a time
+    :return: dict, the table's manifest entry
+    """
+    model, column_specs = EXPORT_TABLES[table]
+    columns = [(name, column_type) for name, column_type, _ in column_specs]
+    queryset = model.objects.order_by('id')
+    if since is not None:
+        queryset = queryset.filter(submission_time__gt=since)
+    rows = queryset.values_list(*(lookup for _, _, lookup in column_specs))
+
+    table_directory = directory / table
+    table_directory.mkdir(parents=True, exist_ok=True)
+    parts = []
+    row_count = 0
+
+    def write_part(part_rows):
+        part = f'part-{len(parts):05d}'
+        for file_format in formats:
+            WRITERS[file_format](table_directory / f'{part}.{file_format}', columns, part_rows)
+        parts.append(part)
+
+    part_rows = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        part_rows.append(row)
+        if len(part_rows) == part_size:
+            write_part(part_rows)
+            row_count += len(part_rows)
+            part_rows = []
+    if part_rows or not parts:
+        write_part(part_rows)
+        row_count += len(part_rows)
+
+    return {'rows': row_count, 'columns': columns, 'parts': parts}
+
+
+def export_reading_data(directory, formats, since=None, part_size=50_000, chunk_size=2000):
+    """
+    Exports all of EXPORT_TABLES to directory (see export_table), and writes the manifest
+
+    :return: dict, the manifest
+    """
+    exported_at = datetime.datetime.now(datetime.timezone.utc)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'format_version': EXPORT_FORMAT_VERSION,
+        'exported_at': exported_at.isoformat(),
+        'since': since.isoformat() if since is not None else None,
+        'formats': formats,
+        'tables': {
+            table: export_table(table, directory, formats, since, part_size, chunk_size)
+            for table in EXPORT_TABLES
+        },
+    }
+    with open(directory / 'manifest.json', 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    return manifest
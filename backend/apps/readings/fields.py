@@ -0,0 +1,107 @@
+"""
+Custom model fields for the Rereading app.
+"""
+import json
+import math
+import sys
+from array import array
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+
+
+def pack_scroll_data(scroll_data):
+    """
+    :param scroll_data: array('i') of scroll positions
+    :return: bytes, the positions as 32-bit little-endian ints
+    """
+    if sys.byteorder == 'big':
+        scroll_data = array('i', scroll_data)
+        scroll_data.byteswap()
+    return scroll_data.tobytes()
+
+
+def unpack_scroll_data(packed):
+    """
+    :param packed: bytes (or memoryview) as returned by pack_scroll_data
+    :return: array('i') of scroll positions
+    """
+    scroll_data = array('i')
+    scroll_data.frombytes(packed)
+    if sys.byteorder == 'big':
+        scroll_data.byteswap()
+    return scroll_data
+
+
+class ScrollDataFormField(forms.CharField):
+    """ Edits scroll data as JSON text (the model field parses it) """
+    widget = forms.Textarea
+
+    def prepare_value(self, value):
+        if isinstance(value, array):
+            return json.dumps(value.tolist())
+        return value
+
+
+class ScrollDataField(models.BinaryField):
+    """
+    A list of scroll positions (in whole pixels), stored as a packed array of 32-bit ints:
+    4 bytes per position, decoded straight into an array('i') rather than parsed as text.
+
+    The frontend posts scroll data as JSON text, and fixtures hold it the same way, so
+    to_python() accepts JSON text, lists and packed bytes alike. Positions are rounded down,
+    which keeps them in the same heat map section.
+    """
+    description = 'Scroll positions, packed as 32-bit ints'
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        kwargs.setdefault('default', b'')
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('editable', None)
+        if kwargs.get('default') == b'':
+            del kwargs['default']
+        return name, path, args, kwargs
+
+    def get_default(self):
+        return self.to_python(super().get_default())
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return unpack_scroll_data(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, array):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return unpack_scroll_data(value)
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise ValidationError('Scroll data must be a JSON list of numbers',
+                                      code='invalid') from None
+        try:
+            return array('i', (math.floor(position) for position in value))
+        except (TypeError, ValueError, OverflowError):
+            raise ValidationError('Scroll data must be a list of numbers',
+                                  code='invalid') from None
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return value
+        return pack_scroll_data(self.to_python(value))
+
+    def value_to_string(self, obj):
+        """ Serializes to JSON text, as the frontend sent it, rather than base64 """
+        return json.dumps(self.to_python(self.value_from_object(obj)).tolist())
+
+    def formfield(self, form_class=None, choices_form_class=None, **kwargs):
+        return super().formfield(form_class=form_class or ScrollDataFormField,
+                                 choices_form_class=choices_form_class, **kwargs)
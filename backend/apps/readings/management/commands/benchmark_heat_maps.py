@@ -0,0 +1,83 @@
+"""
+
+Management command to compare the Python and NumPy heat map counting
+
+"""
+import random
+import timeit
+from array import array
+from functools import partial
+from itertools import chain
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.readings.analysis_helpers import heat_map_buckets, heat_map_buckets_numpy, np
+
+# About as many scroll positions as one segment data row holds in the sample data
+SAMPLES_PER_ROW = 500
+
+
+def make_scroll_data(sample_count, seed=0):
+    """
+    Random scroll data with sample_count positions in all, split into rows like the ones
+    StudentSegmentData holds, including some negative positions (scrolling past the top)
+
+    :return: list of array('i')
+    """
+    rng = random.Random(seed)
+    positions = [rng.randint(-100, 8000) for _ in range(sample_count)]
+    return [
+        array('i', positions[start:start + SAMPLES_PER_ROW])
+        for start in range(0, sample_count, SAMPLES_PER_ROW)
+    ]
+
+
+class Command(BaseCommand):
+    """ Implements a Django management command to benchmark heat map counting """
+    help = ('Times counting scroll positions into heat map sections in Python and with NumPy, '
+            'on random scroll data of increasing size')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--samples',
+            type=int,
+            nargs='+',
+            default=[10_000, 100_000, 1_000_000],
+            help='Numbers of scroll positions to benchmark with',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='How many times to time each implementation (the best time is reported)',
+        )
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('NumPy is not installed')
+
+        bucket_size = settings.ANALYSIS_HEAT_MAP_BUCKET_SIZE
+        implementations = {
+            'python': lambda scroll_data: heat_map_buckets(chain.from_iterable(scroll_data),
+                                                           bucket_size),
+            'numpy': lambda scroll_data: heat_map_buckets_numpy(scroll_data, bucket_size),
+        }
+
+        self.stdout.write(f'{"samples":>10} {"python (ms)":>12} {"numpy (ms)":>12} '
+                          f'{"speedup":>8}')
+        for sample_count in options['samples']:
+            scroll_data = make_scroll_data(sample_count)
+            results = {name: dict(count(scroll_data)) for name, count in implementations.items()}
+            if results['python'] != results['numpy']:
+                raise CommandError(f'The implementations disagree for {sample_count} samples')
+
+            times = {
+                name: min(timeit.repeat(partial(count, scroll_data),
+                                        number=1, repeat=options['repeat'])) * 1000
+                for name, count in implementations.items()
+            }
+            self.stdout.write(
+                f'{sample_count:>10} {times["python"]:>12.2f} {times["numpy"]:>12.2f} '
+                f'{times["python"] / times["numpy"]:>7.1f}x'
+            )
@@ -0,0 +1,36 @@
+"""
+
+Management command to check that the analysis and reading view queries use indexes
+
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.readings.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    """ Implements a Django management command to check query plans """
+    help = ('Asks the database how it would run the queries of each analysis (restricted to '
+            'one document) and of the reading view, and fails if any reads a whole table')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--document',
+            type=int,
+            help='The id of the document to check with (default: the first one)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            results = check_query_plans(options['document'])
+        except ImproperlyConfigured as error:
+            raise CommandError(str(error)) from None
+
+        for description, scans in results.items():
+            self.stdout.write(self.style.WARNING(description))
+            for sql, tables in scans.items():
+                self.stdout.write(f'    reads all of {", ".join(tables)}: {sql}')
+        if results:
+            raise CommandError(f'{len(results)} access path(s) read whole tables')
+        self.stdout.write(self.style.SUCCESS('Every query uses an index'))
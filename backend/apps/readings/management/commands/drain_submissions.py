@@ -0,0 +1,44 @@
+"""
+
+Management command to save the reading data queued in write-behind mode
+
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.readings import submission_queue
+
+
+class Command(BaseCommand):
+    """ Implements a Django management command to drain the submission queue """
+    help = ('Saves the reading data submissions queued by /api/add-response/ '
+            'when settings.READING_DATA_WRITE_BEHIND is on')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=submission_queue.DEFAULT_BATCH_SIZE,
+            help='How many submissions to save per transaction',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, polling the queue, instead of exiting once it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='With --loop, seconds to wait when the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed_count = submission_queue.drain_all(options['batch_size'])
+            if processed_count:
+                self.stdout.write(f'Saved {processed_count} submissions')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
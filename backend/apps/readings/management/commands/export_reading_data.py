@@ -0,0 +1,82 @@
+"""
+
+Management command to export the reading data for research
+
+"""
+import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from apps.readings.export import WRITERS, export_reading_data
+
+
+def parse_since(value):
+    """
+    Parses --since: an ISO 8601 date or datetime, in UTC unless it says otherwise
+    (an export's manifest.json records when it was made, in this format)
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Not a date or datetime: {value}')
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, datetime.timezone.utc)
+    return moment
+
+
+class Command(BaseCommand):
+    """ Implements a Django management command to export the reading data """
+    help = ('Exports the segment data, segment responses and document responses as typed '
+            'columnar files (CSV and/or .rcol, see apps/readings/export.py), which '
+            'analysis/analysis.py can load with load_export()')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', type=Path, help='Directory to write the export to')
+        parser.add_argument(
+            '--format',
+            dest='formats',
+            nargs='+',
+            choices=sorted(WRITERS),
+            default=sorted(WRITERS),
+            help='File formats to write (default: all of them)',
+        )
+        parser.add_argument(
+            '--since',
+            type=parse_since,
+            help='Only export rows submitted or edited after this date or datetime, e.g. '
+                 'the exported_at of the last export',
+        )
+        parser.add_argument(
+            '--part-size',
+            type=int,
+            default=50_000,
+            help='The most rows to write to one file',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='How many rows to fetch from the database at a time',
+        )
+
+    def handle(self, *args, **options):
+        if options['part_size'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--part-size and --chunk-size must be positive')
+
+        manifest = export_reading_data(
+            options['output_dir'],
+            options['formats'],
+            since=options['since'],
+            part_size=options['part_size'],
+            chunk_size=options['chunk_size'],
+        )
+        for table, entry in manifest['tables'].items():
+            self.stdout.write(f'{table}: {entry["rows"]} rows in {len(entry["parts"])} part(s)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported to {options["output_dir"]} at {manifest["exported_at"]}'
+        ))
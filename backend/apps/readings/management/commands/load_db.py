@@ -32,6 +32,9 @@ class Command(BaseCommand):
         call_command('loaddata', db_json_path)
         print('Done!')
 
+        print('')
+        call_command('rebuild_aggregates')
+
         self.stdout.write(
             self.style.SUCCESS(f'\nSuccessfully reloaded the database from {DB_PATH}')
         )
@@ -0,0 +1,81 @@
+"""
+
+Management command to rebuild the running analysis aggregates
+
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.readings import aggregates, counters
+from apps.readings.analysis import RereadingAnalysis
+
+# The RereadingAnalysis methods that can be served from the aggregates
+AGGREGATED_ANALYSES = (
+    'total_and_median_view_time',
+    'mean_reading_vs_rereading_time',
+    'compute_reread_counts',
+    'relevant_words_by_question',
+    'percent_using_relevant_words_by_question',
+    'relevant_words_percent_display_question',
+    'most_common_words_by_question',
+    'get_all_heat_maps',
+)
+
+
+def normalize(result):
+    """
+    Puts every list in an analysis result into a canonical order, since the aggregates
+    don't promise to list questions in the same order as a full scan does
+    """
+    if isinstance(result, (list, tuple)):
+        return sorted((normalize(item) for item in result), key=repr)
+    if isinstance(result, dict):
+        return {key: normalize(value) for key, value in result.items()}
+    return result
+
+
+class Command(BaseCommand):
+    """ Implements a Django management command to rebuild the analysis aggregates """
+    help = ('Recomputes the running analysis aggregates from the raw reading data, '
+            'then checks them against a full scan of that data')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check-only',
+            action='store_true',
+            help="Don't rebuild, just check the current aggregates against a full scan",
+        )
+
+    def handle(self, *args, **options):
+        if not options['check_only']:
+            self.stdout.write('Rebuilding analysis aggregates...')
+            with transaction.atomic():
+                aggregates.rebuild()
+            self.stdout.write('Done!')
+
+            self.stdout.write('Recounting the stored segment and view time counts...')
+            with transaction.atomic():
+                counters.rebuild()
+            self.stdout.write('Done!')
+
+        self.stdout.write('Checking aggregates against a full scan...')
+        from_aggregates = RereadingAnalysis(use_aggregates=True)
+        full_scan = RereadingAnalysis(use_sql=False, use_aggregates=False)
+
+        mismatches = []
+        for analysis_name in AGGREGATED_ANALYSES:
+            expected = getattr(full_scan, analysis_name)()
+            actual = getattr(from_aggregates, analysis_name)()
+            if normalize(expected) != normalize(actual):
+                mismatches.append(analysis_name)
+                self.stderr.write(
+                    f'{analysis_name} differs:\n'
+                    f'  full scan:  {expected}\n'
+                    f'  aggregates: {actual}'
+                )
+
+        if mismatches:
+            raise CommandError(
+                f'Aggregates do not match the raw data for: {", ".join(mismatches)}'
+            )
+        self.stdout.write(self.style.SUCCESS('The aggregates match the raw data'))
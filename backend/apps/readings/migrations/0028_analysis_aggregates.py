@@ -0,0 +1,192 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:03
+
+from collections import Counter, defaultdict
+import string
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+# The words and rules the analyses used when this migration was written (see
+# analysis_helpers.py), copied so that later changes to them don't change what it does
+RELEVANT_WORDS = ["stereotypes", "bias", "assumptions", "assume", "narrator", "memory",
+                  "forget", "Twyla", "Maggie", "Roberta", "black", "white", "prejudice",
+                  "mothers", "segregation", "hate", "hatred", "love", "love-hate",
+                  "remember", "children", "recall", "kick", "truth", "dance", "sick",
+                  "fade", "old", "Mary", "sandy", "race", "racial", "racism",
+                  "colorblind", "disabled", "marginalized", "poor", "rich", "wealthy",
+                  "middle-class", "working-class", "consumers", "shopping", "read",
+                  "misread", "reread", "reconsider", "confuse", "wrong", "mistaken",
+                  "regret", "mute", "voiceless", "women", "age", "bird", "time", "scene",
+                  "setting", "Hendrix ", "universal", "binary", "deconstruct",
+                  "question", "wrong", "right", "incorrect", "false", "claims", "true",
+                  "truth", "unknown", "ambiguous", "unclear"]
+
+STOPWORDS = ['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're",
+             "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he',
+             'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's",
+             'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which',
+             'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are',
+             'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does',
+             'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until',
+             'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into',
+             'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down',
+             'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here',
+             'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more',
+             'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so',
+             'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should',
+             "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't",
+             'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn',
+             "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn',
+             "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn',
+             "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"]
+
+RELEVANT_WORDS_KIND = 'relevant'
+ALL_WORDS_KIND = 'all'
+
+
+def string_contains_words(input_string, target_words):
+    """ Checks if a given input_string contains any of the words in the list of target_words """
+    input_string_lowercase = input_string.lower()
+    return any(word.lower() in input_string_lowercase for word in target_words)
+
+
+def relevant_words_in(input_string, relevant_words):
+    """ The whitespace-separated words of input_string that are one of the relevant_words """
+    return [word for word in input_string.split() if word in relevant_words]
+
+
+def content_words(input_string):
+    """ The lowercased words of input_string, without stopwords and bare punctuation """
+    return [
+        word for word in input_string.lower().split()
+        if word not in STOPWORDS and word not in string.punctuation
+    ]
+
+
+def build_aggregates(apps, schema_editor):
+    """ Fill the new aggregate tables from the reading data collected so far """
+    student_segment_data = apps.get_model('readings', 'StudentSegmentData')
+    reading_aggregate = apps.get_model('readings', 'ReadingAggregate')
+    segment_aggregate = apps.get_model('readings', 'SegmentAggregate')
+    question_aggregate = apps.get_model('readings', 'SegmentQuestionAggregate')
+    segment_word_count = apps.get_model('readings', 'SegmentQuestionWordCount')
+    document_word_count = apps.get_model('readings', 'DocumentQuestionWordCount')
+
+    reading_aggregate.objects.bulk_create(
+        reading_aggregate(
+            reading_data_id=totals['reading_data_id'],
+            reading_view_time=totals['reading_view_time'] or 0,
+            rereading_view_time=totals['rereading_view_time'] or 0,
+        )
+        for totals in student_segment_data.objects.order_by('reading_data_id')
+        .values('reading_data_id')
+        .annotate(
+            reading_view_time=Sum('view_time', filter=Q(is_rereading=False)),
+            rereading_view_time=Sum('view_time', filter=Q(is_rereading=True)),
+        )
+    )
+
+    segment_aggregate.objects.bulk_create(
+        segment_aggregate(segment_id=segment_id, reread_count=reread_count)
+        for segment_id, reread_count in student_segment_data.objects
+        .filter(is_rereading=True, view_time__gt=1.0)
+        .order_by('segment_id')
+        .values_list('segment_id')
+        .annotate(reread_count=Count('id'))
+    )
+
+    response_counts = defaultdict(Counter)
+    relevant_words = defaultdict(Counter)
+    all_words = defaultdict(Counter)
+    for question_id, response in apps.get_model('readings', 'SegmentQuestionResponse') \
+            .objects.order_by('pk').values_list('question_id', 'response'):
+        response_counts[question_id]['response_count'] += 1
+        if string_contains_words(response, RELEVANT_WORDS):
+            response_counts[question_id]['relevant_response_count'] += 1
+        relevant_words[question_id].update(relevant_words_in(response, RELEVANT_WORDS))
+        all_words[question_id].update(content_words(response))
+
+    question_aggregate.objects.bulk_create(
+        question_aggregate(question_id=question_id, **counts)
+        for question_id, counts in response_counts.items()
+    )
+    segment_word_count.objects.bulk_create(
+        segment_word_count(question_id=question_id, kind=kind, word=word, count=count)
+        for kind, counters in ((RELEVANT_WORDS_KIND, relevant_words),
+                               (ALL_WORDS_KIND, all_words))
+        for question_id, word_counts in counters.items()
+        for word, count in word_counts.items()
+    )
+
+    document_words = defaultdict(Counter)
+    for question_id, response in apps.get_model('readings', 'DocumentQuestionResponse') \
+            .objects.order_by('pk').values_list('question_id', 'response'):
+        document_words[question_id].update(content_words(response))
+    document_word_count.objects.bulk_create(
+        document_word_count(question_id=question_id, word=word, count=count)
+        for question_id, word_counts in document_words.items()
+        for word, count in word_counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0027_auto_20191206_2042'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentQuestionAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('response_count', models.IntegerField(default=0)),
+                ('relevant_response_count', models.IntegerField(default=0)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='aggregate', to='readings.segmentquestion')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SegmentAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reread_count', models.IntegerField(default=0)),
+                ('segment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='aggregate', to='readings.segment')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReadingAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reading_view_time', models.FloatField(default=0)),
+                ('rereading_view_time', models.FloatField(default=0)),
+                ('reading_data', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='aggregate', to='readings.studentreadingdata')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SegmentQuestionWordCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('relevant', 'Relevant words'), ('all', 'All words')], max_length=8)),
+                ('word', models.TextField()),
+                ('count', models.IntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='word_counts', to='readings.segmentquestion')),
+            ],
+            options={
+                'unique_together': {('question', 'kind', 'word')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentQuestionWordCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.TextField()),
+                ('count', models.IntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='word_counts', to='readings.documentquestion')),
+            ],
+            options={
+                'unique_together': {('question', 'word')},
+            },
+        ),
+        migrations.RunPython(build_aggregates, migrations.RunPython.noop),
+    ]
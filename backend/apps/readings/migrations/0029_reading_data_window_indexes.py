@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0028_analysis_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentreadingdata',
+            index=models.Index(fields=['document', 'start_time'], name='readings_st_documen_eb31a2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentreadingdata',
+            index=models.Index(fields=['document', 'last_updated_time'], name='readings_st_documen_ca6c7e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentreadingdata',
+            index=models.Index(fields=['start_time'], name='readings_st_start_t_ac3eca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentreadingdata',
+            index=models.Index(fields=['last_updated_time'], name='readings_st_last_up_a29533_idx'),
+        ),
+    ]
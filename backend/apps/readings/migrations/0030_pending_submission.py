@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0029_reading_data_window_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSubmission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('payload', models.TextField()),
+                ('received_time', models.DateTimeField(auto_now_add=True)),
+                ('processed_time', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('reading_data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_submissions', to='readings.studentreadingdata')),
+            ],
+        ),
+    ]
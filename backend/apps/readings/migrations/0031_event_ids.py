@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0030_pending_submission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentquestionresponse',
+            name='event_id',
+            field=models.UUIDField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='studentsegmentdata',
+            name='event_id',
+            field=models.UUIDField(blank=True, null=True, unique=True),
+        ),
+    ]
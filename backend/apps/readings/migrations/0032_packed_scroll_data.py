@@ -0,0 +1,64 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:21
+
+from ast import literal_eval
+import json
+
+from django.db import migrations
+
+import apps.readings.fields
+
+BATCH_SIZE = 500
+
+
+def pack_scroll_data(apps, schema_editor):
+    """ Convert the scroll data text of every segment data row to the packed format """
+    student_segment_data = apps.get_model('readings', 'StudentSegmentData')
+    field = student_segment_data._meta.get_field('packed_scroll_data')
+    batch = []
+    for segment_data in student_segment_data.objects.only('id', 'scroll_data').iterator():
+        segment_data.packed_scroll_data = field.to_python(
+            literal_eval(segment_data.scroll_data or '[]')
+        )
+        batch.append(segment_data)
+        if len(batch) == BATCH_SIZE:
+            student_segment_data.objects.bulk_update(batch, ['packed_scroll_data'])
+            batch = []
+    student_segment_data.objects.bulk_update(batch, ['packed_scroll_data'])
+
+
+def unpack_scroll_data(apps, schema_editor):
+    """ Convert the packed scroll data back to JSON text """
+    student_segment_data = apps.get_model('readings', 'StudentSegmentData')
+    batch = []
+    for segment_data in student_segment_data.objects.only('id', 'packed_scroll_data').iterator():
+        segment_data.scroll_data = json.dumps(segment_data.packed_scroll_data.tolist())
+        batch.append(segment_data)
+        if len(batch) == BATCH_SIZE:
+            student_segment_data.objects.bulk_update(batch, ['scroll_data'])
+            batch = []
+    student_segment_data.objects.bulk_update(batch, ['scroll_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0031_event_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentsegmentdata',
+            name='packed_scroll_data',
+            field=apps.readings.fields.ScrollDataField(),
+        ),
+        migrations.RunPython(pack_scroll_data, unpack_scroll_data),
+        migrations.RemoveField(
+            model_name='studentsegmentdata',
+            name='scroll_data',
+        ),
+        migrations.RenameField(
+            model_name='studentsegmentdata',
+            old_name='packed_scroll_data',
+            new_name='scroll_data',
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:24
+
+from ast import literal_eval
+import json
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+# (model, field) pairs that move from JSON-in-text to a JSONField
+JSON_FIELDS = (
+    ('SegmentQuestionResponse', 'evidence'),
+    ('DocumentQuestionResponse', 'evidence'),
+    ('StudentResponsePrototype', 'views'),
+)
+
+
+def parse_text(text):
+    """
+    The old columns hold JSON, or the repr() of a Python list (which is what saving
+    a list to a TextField stored), or nothing at all
+    """
+    if not text:
+        return []
+    try:
+        return json.loads(text)
+    except ValueError:
+        return literal_eval(text)
+
+
+def convert(apps, model_name, from_field, to_field, conversion):
+    """ Copies from_field to to_field for every row of a model, through conversion """
+    model = apps.get_model('readings', model_name)
+    batch = []
+    for row in model.objects.only('id', from_field).iterator():
+        setattr(row, to_field, conversion(getattr(row, from_field)))
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_update(batch, [to_field])
+            batch = []
+    model.objects.bulk_update(batch, [to_field])
+
+
+def text_to_json(apps, schema_editor):
+    for model_name, field_name in JSON_FIELDS:
+        convert(apps, model_name, field_name, f'json_{field_name}', parse_text)
+
+
+def json_to_text(apps, schema_editor):
+    for model_name, field_name in JSON_FIELDS:
+        convert(apps, model_name, f'json_{field_name}', field_name, json.dumps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0032_packed_scroll_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='segmentquestionresponse',
+            name='json_evidence',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='documentquestionresponse',
+            name='json_evidence',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='studentresponseprototype',
+            name='json_views',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(text_to_json, json_to_text),
+        migrations.RemoveField(
+            model_name='segmentquestionresponse',
+            name='evidence',
+        ),
+        migrations.RemoveField(
+            model_name='documentquestionresponse',
+            name='evidence',
+        ),
+        migrations.RemoveField(
+            model_name='studentresponseprototype',
+            name='views',
+        ),
+        migrations.RenameField(
+            model_name='segmentquestionresponse',
+            old_name='json_evidence',
+            new_name='evidence',
+        ),
+        migrations.RenameField(
+            model_name='documentquestionresponse',
+            old_name='json_evidence',
+            new_name='evidence',
+        ),
+        migrations.RenameField(
+            model_name='studentresponseprototype',
+            old_name='json_views',
+            new_name='views',
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:27
+
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_heat_maps(apps, schema_editor):
+    """
+    Count the scroll data collected so far into the new heat map buckets: the
+    non-negative scroll positions, by the section of the segment they fall in
+    """
+    bucket_size = getattr(settings, 'ANALYSIS_HEAT_MAP_BUCKET_SIZE', 500)
+    heat_map_bucket = apps.get_model('readings', 'HeatMapBucket')
+
+    buckets = defaultdict(Counter)
+    for segment_id, is_rereading, scroll_data in apps.get_model('readings', 'StudentSegmentData') \
+            .objects.order_by('pk').values_list('segment_id', 'is_rereading', 'scroll_data') \
+            .iterator():
+        buckets[segment_id, is_rereading].update(
+            position // bucket_size for position in scroll_data if position >= 0
+        )
+    heat_map_bucket.objects.bulk_create(
+        (
+            heat_map_bucket(segment_id=segment_id, is_rereading=is_rereading,
+                            bucket_size=bucket_size, bucket=bucket, count=count)
+            for (segment_id, is_rereading), bucket_counts in buckets.items()
+            for bucket, count in bucket_counts.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0033_json_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeatMapBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_rereading', models.BooleanField()),
+                ('bucket_size', models.IntegerField()),
+                ('bucket', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heat_map_buckets', to='readings.segment')),
+            ],
+            options={
+                'unique_together': {('segment', 'is_rereading', 'bucket_size', 'bucket')},
+            },
+        ),
+        migrations.RunPython(build_heat_maps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0034_heat_map_buckets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documentquestion',
+            index=models.Index(fields=['document', 'is_overview_question', 'sequence'], name='readings_do_documen_fb1fe1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='segmentquestionresponse',
+            index=models.Index(fields=['question', 'student_segment_data'], name='readings_se_questio_acde0b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentsegmentdata',
+            index=models.Index(fields=['segment', 'is_rereading'], name='readings_st_segment_6d1d00_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentsegmentdata',
+            index=models.Index(fields=['reading_data', 'submission_time'], name='readings_st_reading_3a6760_idx'),
+        ),
+    ]
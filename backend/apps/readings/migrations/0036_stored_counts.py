@@ -0,0 +1,81 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 500
+
+
+def per_parent(queryset, parent_field, aggregate, output_field):
+    """ Subquery of aggregate over the rows of queryset belonging to the outer row, or 0 """
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{parent_field: OuterRef('pk')})
+            .order_by()
+            .values(parent_field)
+            .annotate(value=aggregate)
+            .values('value'),
+            output_field=output_field,
+        ),
+        0,
+        output_field=output_field,
+    )
+
+
+def count(apps, schema_editor):
+    """ Fill in the new counts for the data collected so far """
+    segment = apps.get_model('readings', 'Segment')
+    batch = []
+    for this_segment in segment.objects.only('id', 'text').iterator():
+        this_segment.word_count = len(this_segment.text.split())
+        batch.append(this_segment)
+        if len(batch) == BATCH_SIZE:
+            segment.objects.bulk_update(batch, ['word_count'])
+            batch = []
+    segment.objects.bulk_update(batch, ['word_count'])
+
+    apps.get_model('readings', 'Document').objects.update(segment_count=per_parent(
+        segment.objects.all(), 'document', Count('pk'), models.IntegerField(),
+    ))
+
+    segment_data = apps.get_model('readings', 'StudentSegmentData').objects.all()
+    apps.get_model('readings', 'StudentReadingData').objects.update(
+        segment_data_count=per_parent(
+            segment_data, 'reading_data', Count('pk'), models.IntegerField(),
+        ),
+        total_view_time=per_parent(
+            segment_data, 'reading_data', Sum('view_time'), models.FloatField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0035_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='segment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='segment',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studentreadingdata',
+            name='segment_data_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studentreadingdata',
+            name='total_view_time',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(count, migrations.RunPython.noop),
+    ]
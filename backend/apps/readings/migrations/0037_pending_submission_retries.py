@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0036_stored_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingsubmission',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pendingsubmission',
+            name='next_attempt_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:02
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Q
+
+
+def count_reads(apps, schema_editor):
+    """
+    Recreate the segment aggregates with the new read counts, for every segment read
+    so far, in the order the segments were first read
+    """
+    segment_aggregate = apps.get_model('readings', 'SegmentAggregate')
+    segment_aggregate.objects.all().delete()
+    segment_aggregate.objects.bulk_create(
+        segment_aggregate(segment_id=segment_id, read_count=read_count,
+                          reread_count=reread_count)
+        for segment_id, read_count, reread_count, _ in apps.get_model(
+            'readings', 'StudentSegmentData').objects
+        .values_list('segment_id')
+        .annotate(
+            read_count=Count('id'),
+            reread_count=Count('id', filter=Q(is_rereading=True, view_time__gt=1.0)),
+            first_id=Min('id'),
+        )
+        .order_by('first_id')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0037_pending_submission_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='segmentaggregate',
+            name='read_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_reads, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,12 @@
 """
 Models for the Rereading app.
 """
-from ast import literal_eval
+import uuid
 
 from django.db import models
 
+from .fields import ScrollDataField
+
 
 class Document(models.Model):
     """
@@ -22,12 +24,15 @@ class Document(models.Model):
         max_length=255,
     )
 
+    # kept up to date as segments are saved and deleted (see counters.py)
+    segment_count = models.PositiveIntegerField(default=0, editable=False)
+
     def __len__(self):
         """
         The length of a document is the number of segments
         ... maybe this should be total wordcount instead?
         """
-        return self.segments.count()
+        return int(self.segment_count)  # unnecessary cast makes Pylint happy
 
     def __str__(self):
         """ string representation of this class """
@@ -50,11 +55,14 @@ class Segment(models.Model):
         related_name='segments',
     )
 
+    # computed from the text as the segment is saved (see counters.py)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+
     def __len__(self):
         """ Length of a segment is the word count
             (Just split by whitespace -- not doing anything fancy...)
         """
-        return len(self.text.split())
+        return int(self.word_count)  # unnecessary cast makes Pylint happy
 
     def __str__(self):
         segment_count = len(self.document)
@@ -109,6 +117,12 @@ class DocumentQuestion(Question):
         related_name='questions'
     )
 
+    class Meta:
+        # the reading view shows a document's questions and its overview questions apart
+        indexes = [
+            models.Index(fields=['document', 'is_overview_question', 'sequence']),
+        ]
+
     def __str__(self):
         return str(self.text)  # unnecessary cast makes Pylint happy.
 
@@ -148,19 +162,29 @@ class StudentReadingData(models.Model):
     start_time = models.DateTimeField(auto_now_add=True)
     last_updated_time = models.DateTimeField(auto_now=True)
 
+    # kept up to date as segment data is saved and deleted (see counters.py)
+    segment_data_count = models.PositiveIntegerField(default=0, editable=False)
+    total_view_time = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        # RereadingAnalysis selects readings by document and time window
+        indexes = [
+            models.Index(fields=['document', 'start_time']),
+            models.Index(fields=['document', 'last_updated_time']),
+            models.Index(fields=['start_time']),
+            models.Index(fields=['last_updated_time']),
+        ]
+
     def get_total_view_time(self):
         """
         Returns sum of view_times for all associated StudentSegmentData instances,
         rounding to the nearest second
         """
-        total_view_time = 0
-        for seg in self.segment_data.all():
-            total_view_time += seg.view_time
-        return round(total_view_time)
+        return round(self.total_view_time)
 
     def __str__(self):
         return (
-            f'{self.student} - {self.segment_data.count()} segments completed - '
+            f'{self.student} - {self.segment_data_count} segments completed - '
             + f'{self.get_total_view_time()} seconds'
         )
 
@@ -182,17 +206,27 @@ class StudentSegmentData(models.Model):
         on_delete=models.CASCADE,
         related_name='segment_data'
     )
-    scroll_data = models.TextField(default='[]')
+    scroll_data = ScrollDataField()
     view_time = models.FloatField(default=0)
     is_rereading = models.BooleanField(default=None)
     submission_time = models.DateTimeField(auto_now_add=True)
+    # chosen by the client for each segment visit, so that resubmitting it records nothing new
+    event_id = models.UUIDField(null=True, blank=True, unique=True)
+
+    class Meta:
+        # the analyses split each segment's data into readings and rereadings, and the
+        # exports and submissions go through a reading's segment data by submission time
+        indexes = [
+            models.Index(fields=['segment', 'is_rereading']),
+            models.Index(fields=['reading_data', 'submission_time']),
+        ]
 
     def get_parsed_scroll_data(self):
         """
-        Scroll data is stored as a string representing JSON data, so it needs to be converted
-        into a Python object before much can be done with it.
+        Scroll data is stored packed, and loaded as an array('i') of scroll positions;
+        this also converts the JSON text or list it may have been assigned since.
         """
-        return literal_eval(self.scroll_data)
+        return self._meta.get_field('scroll_data').to_python(self.scroll_data)
 
 
 class SegmentQuestionResponse(models.Model):
@@ -211,16 +245,22 @@ class SegmentQuestionResponse(models.Model):
     )
     response = models.TextField()
     submission_time = models.DateTimeField(auto_now=True)
-    evidence = models.TextField(default='[]')
+    evidence = models.JSONField(default=list)
+
+    class Meta:
+        # the analyses gather the responses to each question
+        indexes = [
+            models.Index(fields=['question', 'student_segment_data']),
+        ]
 
     def parse_evidence(self):
         """
-        Returns the Python representation of the JSON string stored as the reader's
-        evidence for a response
+        Returns the reader's evidence for a response (decoded from JSON once, when the
+        row is loaded)
 
         :return: List object
         """
-        return literal_eval(self.evidence)
+        return self.evidence
 
 
 class DocumentQuestionResponse(models.Model):
@@ -232,7 +272,9 @@ class DocumentQuestionResponse(models.Model):
     response = models.TextField()
     response_segment = models.IntegerField(default=1)
     submission_time = models.DateTimeField(auto_now=True)
-    evidence = models.TextField(default='[]')
+    evidence = models.JSONField(default=list)
+    # chosen by the client for each response; resubmitting it updates the response
+    event_id = models.UUIDField(null=True, blank=True, unique=True)
 
     question = models.ForeignKey(
         DocumentQuestion,
@@ -247,12 +289,158 @@ class DocumentQuestionResponse(models.Model):
 
     def parse_evidence(self):
         """
-        Returns the Python representation of the JSON string stored as the reader's
-        evidence for a response
+        Returns the reader's evidence for a response (decoded from JSON once, when the
+        row is loaded)
 
         :return: List object
         """
-        return literal_eval(self.evidence)
+        return self.evidence
+
+
+################################################################################
+# SUBMISSION QUEUE
+# In write-behind mode (settings.READING_DATA_WRITE_BEHIND), add_response only
+# validates the reading data a student submits and queues it here; it is saved by
+# `python manage.py drain_submissions` (see submission_queue.py).
+################################################################################
+class PendingSubmission(models.Model):
+    """
+    A validated /api/add-response/ payload waiting to be saved
+    """
+    # returned to the client, which may also choose it, so that a retried POST isn't queued twice
+    receipt_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    reading_data = models.ForeignKey(
+        StudentReadingData,
+        on_delete=models.CASCADE,
+        related_name='pending_submissions'
+    )
+    payload = models.TextField()  # the submitted data, as JSON
+    received_time = models.DateTimeField(auto_now_add=True)
+
+    # set once the payload has been saved (or has failed to, see error)
+    processed_time = models.DateTimeField(null=True, blank=True, db_index=True)
+    error = models.TextField(blank=True, default='')
+    # saves that failed for a reason that may go away (e.g. a locked database), and when
+    # the submission may be tried again
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_time = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        status = 'pending' if self.processed_time is None else 'processed'
+        return f'Submission {self.receipt_id} ({status})'
+
+
+################################################################################
+# ANALYSIS AGGREGATES
+# Running totals maintained as reading data is submitted (see aggregates.py), so
+# that RereadingAnalysis can read one row per group instead of rescanning history.
+# Rebuild them with `python manage.py rebuild_aggregates`.
+################################################################################
+class ReadingAggregate(models.Model):
+    """
+    Total view times of all segment data for a single StudentReadingData
+    """
+    reading_data = models.OneToOneField(
+        StudentReadingData,
+        on_delete=models.CASCADE,
+        related_name='aggregate',
+    )
+    reading_view_time = models.FloatField(default=0)
+    rereading_view_time = models.FloatField(default=0)
+
+
+class SegmentAggregate(models.Model):
+    """
+    Number of times a Segment was read, and reread (for longer than a second).
+    The rows are created in the order the segments were first read.
+    """
+    segment = models.OneToOneField(
+        Segment,
+        on_delete=models.CASCADE,
+        related_name='aggregate',
+    )
+    read_count = models.IntegerField(default=0)
+    reread_count = models.IntegerField(default=0)
+
+
+class HeatMapBucket(models.Model):
+    """
+    Number of scroll positions recorded in one section of a Segment, while reading or
+    rereading it. A section is bucket_size pixels tall, and bucket counts them from the top.
+    """
+    segment = models.ForeignKey(
+        Segment,
+        on_delete=models.CASCADE,
+        related_name='heat_map_buckets',
+    )
+    is_rereading = models.BooleanField()
+    bucket_size = models.IntegerField()
+    bucket = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [
+            ['segment', 'is_rereading', 'bucket_size', 'bucket'],
+        ]
+
+
+class SegmentQuestionAggregate(models.Model):
+    """
+    Number of responses to a SegmentQuestion, and how many of them use relevant words
+    """
+    question = models.OneToOneField(
+        SegmentQuestion,
+        on_delete=models.CASCADE,
+        related_name='aggregate',
+    )
+    response_count = models.IntegerField(default=0)
+    relevant_response_count = models.IntegerField(default=0)
+
+
+class SegmentQuestionWordCount(models.Model):
+    """
+    How often a word is used in responses to a SegmentQuestion.
+    Two tallies are kept: RELEVANT counts the relevant words exactly as written,
+    ALL counts every lowercased word except stopwords.
+    """
+    RELEVANT = 'relevant'
+    ALL = 'all'
+    KIND_CHOICES = [
+        (RELEVANT, 'Relevant words'),
+        (ALL, 'All words'),
+    ]
+
+    question = models.ForeignKey(
+        SegmentQuestion,
+        on_delete=models.CASCADE,
+        related_name='word_counts',
+    )
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    word = models.TextField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [
+            ['question', 'kind', 'word'],
+        ]
+
+
+class DocumentQuestionWordCount(models.Model):
+    """
+    How often a (lowercased, non-stopword) word is used in responses to a DocumentQuestion
+    """
+    question = models.ForeignKey(
+        DocumentQuestion,
+        on_delete=models.CASCADE,
+        related_name='word_counts',
+    )
+    word = models.TextField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [
+            ['question', 'word'],
+        ]
 
 
 class Writeup(models.Model):
@@ -351,7 +539,7 @@ class StudentResponsePrototype(models.Model):
     )
 
     response = models.TextField(default='')
-    views = models.TextField(default='')  # do not use me directly! see get_parsed_views()
+    views = models.JSONField(default=list)  # list of view times, in seconds
     scroll_ups = models.IntegerField(default=0)
     student = models.ForeignKey(
         StudentPrototype,
@@ -361,9 +549,7 @@ class StudentResponsePrototype(models.Model):
 
     def get_parsed_views(self):
         """
-        Since views are stored as a TextField directly as the JSON representation
-        of a list of floats, we need to convert this to a Python object in order
-        to use it in our analyses.
+        Views are stored as a JSON list of floats, which is decoded once, when the row
+        is loaded, so this just returns it.
         """
-
-        return literal_eval(self.views)
+        return self.views
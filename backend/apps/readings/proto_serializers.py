@@ -15,6 +15,9 @@ class StudentResponsePrototypeSerializer(serializers.ModelSerializer):
     A serializer makes it possible to view a database Django model
     on the web, such as React
     """
+    # The prototype frontend sends and displays views as JSON text
+    views = serializers.JSONField(binary=True, required=False)
+
     class Meta:
         model = StudentResponsePrototype
 
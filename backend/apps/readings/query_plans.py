@@ -0,0 +1,125 @@
+"""
+
+query_plans.py - checks that the analysis and reading view queries use indexes
+
+We run the queries an access path makes (capturing them as the test runner does), ask the
+database how it would execute each one, and report the tables it would read in full.
+Analyses of all of the readings read whole tables by design, so we check the analyses
+restricted to one document, which should only read that document's rows.
+
+The check_query_plans command runs this against a database; the tests run it too. Only
+SQLite's and PostgreSQL's plans are read (see FULL_SCAN_PATTERNS).
+
+"""
+import re
+
+from django.apps import apps as django_apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .analysis import RereadingAnalysis
+from .document_cache import get_document_payload, invalidate_document
+from .models import Document
+from .views import SegmentWindow
+
+# How each database says it reads a whole table, in EXPLAIN (QUERY PLAN) output
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?(\w+)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+# The metrics of RereadingAnalysis that the /api/analysis/ endpoints serve
+ANALYSIS_METRICS = (
+    'total_and_median_view_time',
+    'mean_reading_vs_rereading_time',
+    'get_number_of_unique_students',
+    'compute_reread_counts',
+    'relevant_words_by_question',
+    'percent_using_relevant_words_by_question',
+    'relevant_words_percent_display_question',
+    'all_responses',
+    'get_all_heat_maps',
+    'most_common_words_by_question',
+    'get_number_of_segments',
+)
+
+
+def explain(sql):
+    """
+    :param sql: str, a query with its parameters filled in
+    :return: list of str, the lines of the database's plan for it
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+def full_scans(sql):
+    """
+    :param sql: str, a query with its parameters filled in
+    :return: list of str, the tables of our models the query would read in full
+    :raises ImproperlyConfigured: if we can't read the plans of this database
+    """
+    pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise ImproperlyConfigured(f'Query plans are not checked on {connection.vendor}')
+    tables = {model._meta.db_table for model in django_apps.get_app_config('readings').get_models()}
+    scanned = (pattern.search(line) for line in explain(sql))
+    return [match.group(1) for match in scanned if match and match.group(1) in tables]
+
+
+def find_full_scans(access_path):
+    """
+    Runs access_path(), and checks the plan of every query it made
+
+    :param access_path: callable making queries
+    :return: dict mapping the SQL of each query that reads a table in full to the tables
+    """
+    with CaptureQueriesContext(connection) as queries:
+        access_path()
+
+    scans = {}
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if sql not in scans and sql.lstrip().upper().startswith('SELECT'):
+            scans[sql] = full_scans(sql)
+    return {sql: tables for sql, tables in scans.items() if tables}
+
+
+def access_paths(document_id):
+    """
+    The queries we expect to use indexes, for one document
+
+    :return: dict mapping a description of each access path to a callable making its queries
+    """
+    def metric(name):
+        def evaluate():
+            return getattr(RereadingAnalysis(document_id=document_id), name)()
+        return evaluate
+
+    def reading_view():
+        invalidate_document(document_id)
+        get_document_payload(document_id)
+
+    paths = {f'RereadingAnalysis.{name}': metric(name) for name in ANALYSIS_METRICS}
+    paths['reading view'] = reading_view
+    paths['segment window'] = lambda: SegmentWindow(document_id, from_sequence=2, count=1)
+    return paths
+
+
+def check_query_plans(document_id=None):
+    """
+    Checks the plans of the queries of every access path, for a document (by default,
+    the first one)
+
+    :return: dict mapping the description of each access path that reads a table in full
+             to what find_full_scans() found
+    """
+    if document_id is None:
+        document_id = Document.objects.order_by('id').values_list('id', flat=True).first()
+    results = {
+        description: find_full_scans(access_path)
+        for description, access_path in access_paths(document_id).items()
+    }
+    return {description: scans for description, scans in results.items() if scans}
@@ -4,11 +4,14 @@ in ways that can be transported across the backend/frontend divide, or
 allow the frontend to suggest changes to the backend/database.
 """
 from datetime import datetime
-from ast import literal_eval
-import json
+from copy import copy
 
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework import serializers
 
+from . import aggregates, counters
 from .models import (
     Document, Segment, Student,
     SegmentQuestion, SegmentQuestionResponse,
@@ -24,6 +27,8 @@ class DocumentQuestionResponseSerializer(serializers.ModelSerializer):
     """
     id = serializers.ModelField(model_field=DocumentQuestionResponse()._meta.get_field('id'))
     evidence = serializers.ListField(child=serializers.CharField(), required=False)
+    # Declared explicitly, so that resubmitting an event_id isn't rejected as a duplicate
+    event_id = serializers.UUIDField(required=False, allow_null=True)
 
     class Meta:
         model = DocumentQuestionResponse
@@ -34,6 +39,7 @@ class DocumentQuestionResponseSerializer(serializers.ModelSerializer):
             'response_segment',
             'submission_time',
             'evidence',
+            'event_id',
         )
 
 
@@ -73,9 +79,18 @@ class SegmentSerializer(serializers.ModelSerializer):
     """
     questions = serializers.SerializerMethodField()
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Orders the segments in queryset and prefetches their questions, in order
+        """
+        return queryset.order_by('sequence').prefetch_related(
+            Prefetch('questions', queryset=SegmentQuestion.objects.order_by('sequence', 'id'))
+        )
+
     def get_questions(self, instance):
-        queryset = instance.questions.all().order_by('sequence')
-        return SegmentQuestionSerializer(queryset, many=True).data
+        # Prefetched in sequence order by setup_eager_loading()
+        return SegmentQuestionSerializer(instance.questions.all(), many=True).data
 
     class Meta:
         model = Segment
@@ -94,11 +109,8 @@ class SegmentQuestionResponseSerializer(serializers.ModelSerializer):
     """
     id = serializers.ModelField(model_field=SegmentQuestionResponse()._meta.get_field('id'))
     reading_evidence = serializers.SerializerMethodField(read_only=True)
-    evidence = serializers.ModelField(
-        model_field=SegmentQuestionResponse()._meta.get_field('evidence'),
-        write_only=True,
-        required=False,
-    )
+    evidence = serializers.ListField(child=serializers.CharField(), write_only=True,
+                                     required=False)
     question = serializers.ModelField(
         model_field=SegmentQuestionResponse()._meta.get_field('question'),
         required=False,
@@ -117,7 +129,7 @@ class SegmentQuestionResponseSerializer(serializers.ModelSerializer):
         )
 
     def get_reading_evidence(self, obj):
-        return literal_eval(obj.evidence)
+        return obj.evidence
 
 
 class StudentSegmentDataSerializer(serializers.ModelSerializer):
@@ -127,6 +139,8 @@ class StudentSegmentDataSerializer(serializers.ModelSerializer):
     # To get the 'id' key to show up in validated_data in the create method
     id = serializers.ModelField(model_field=StudentSegmentData()._meta.get_field('id'))
     segment_responses = SegmentQuestionResponseSerializer(many=True)
+    # Declared explicitly, so that resubmitting an event_id isn't rejected as a duplicate
+    event_id = serializers.UUIDField(required=False, allow_null=True)
 
     class Meta:
         model = StudentSegmentData
@@ -138,6 +152,7 @@ class StudentSegmentDataSerializer(serializers.ModelSerializer):
             'is_rereading',
             'submission_time',
             'segment_responses',
+            'event_id',
         )
 
 
@@ -150,58 +165,213 @@ class StudentReadingDataSerializer(serializers.ModelSerializer):
     document_responses = DocumentQuestionResponseSerializer(many=True)
     reading_data_id = serializers.IntegerField(write_only=True)
 
-    def update(self, instance, validated_data):
-        """ Updates a StudentReadingData instance """
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Prefetches the segment data, responses and document responses of the reading data
+        in queryset, so that serializing a page of it takes the same 4 queries however
+        many readings, segments and responses it holds
+        """
+        return queryset.prefetch_related(
+            'segment_data__segment_responses',
+            'document_responses',
+        )
 
-        # Separate out the responses
-        segment_data = validated_data.pop("segment_data")
-        document_responses = validated_data.pop("document_responses")
-        reading_data = instance
-        reading_data.last_updated_time = datetime.now()
-        reading_data.save()
+    @staticmethod
+    def _check_ids_exist(model, ids, field_name):
+        """
+        Checks, in one query, that rows with all of the given primary keys exist
+
+        :param model: the model class
+        :param ids: iterable of primary keys
+        :param field_name: str, the submitted field the ids came from, for the error message
+        :raises ValidationError: if any of the ids doesn't exist
+        """
+        ids = set(ids)
+        missing_ids = ids - set(model.objects.only('id').in_bulk(ids))
+        if missing_ids:
+            raise serializers.ValidationError({
+                field_name: f'Unknown {model.__name__} ids: '
+                            + ', '.join(str(pk) for pk in sorted(missing_ids))
+            })
+
+    @staticmethod
+    def _dedupe_events(items):
+        """
+        Drops all but the last of the submitted items that share an event_id
+        (items without an event_id are all kept)
+
+        :param items: list of validated dicts
+        :return: list of validated dicts, in the order submitted
+        """
+        last_index_by_event = {
+            item['event_id']: index for index, item in enumerate(items) if item.get('event_id')
+        }
+        return [
+            item for index, item in enumerate(items)
+            if not item.get('event_id') or last_index_by_event[item['event_id']] == index
+        ]
+
+    def _save_document_responses(self, reading_data, document_responses):
+        """
+        Inserts the submitted document responses, or updates the ones whose event_id
+        we've already saved
+
+        :return: (list of new responses, list of (old, updated) response pairs)
+        """
+        document_responses = self._dedupe_events(document_responses)
+        existing_responses = DocumentQuestionResponse.objects.filter(
+            student_reading_data=reading_data,
+        ).in_bulk(
+            [data['event_id'] for data in document_responses if data.get('event_id')],
+            field_name='event_id',
+        )
 
-        # Link each document response to the reading data
+        new_responses = []
+        updated_responses = []
         for data in document_responses:
-            document_question = DocumentQuestion.objects.get(id=data['id'])
-            response = DocumentQuestionResponse.objects.create(
-                student_reading_data=reading_data,
-                question=document_question,
-                response=data['response'],
-                response_segment=data['response_segment'],
+            evidence = data.get('evidence')
+            response = existing_responses.get(data.get('event_id'))
+            if response is None:
+                response = DocumentQuestionResponse(
+                    student_reading_data=reading_data,
+                    question_id=data['id'],
+                    response=data['response'],
+                    response_segment=data['response_segment'],
+                    event_id=data.get('event_id'),
+                )
+                if evidence is not None:
+                    response.evidence = evidence
+                new_responses.append(response)
+            elif (response.response, response.response_segment) != \
+                    (data['response'], data['response_segment']) \
+                    or evidence not in (None, response.evidence):
+                old_response = copy(response)
+                response.response = data['response']
+                response.response_segment = data['response_segment']
+                if evidence is not None:
+                    response.evidence = evidence
+                response.submission_time = timezone.now()
+                updated_responses.append((old_response, response))
+
+        DocumentQuestionResponse.objects.bulk_create(new_responses)
+        if updated_responses:
+            DocumentQuestionResponse.objects.bulk_update(
+                [response for _, response in updated_responses],
+                ['response', 'response_segment', 'evidence', 'submission_time'],
             )
+        return new_responses, updated_responses
 
-            if 'evidence' in data:
-                evidence_list = data.pop('evidence')
-                evidence_json = json.dumps(evidence_list)
-                response.evidence = evidence_json
-                response.save()
-
-        # Save student segment data
-        for this_segment_data in segment_data:
-            segment = Segment.objects.get(id=this_segment_data['id'])
-            segment_data = StudentSegmentData.objects.create(
-                segment=segment,
+    def _save_events(self, reading_data, segment_data, document_responses):
+        """
+        Inserts the submitted segment data and responses, leaving out (or, for document
+        responses, updating) the events this reading has already recorded
+
+        :raises IntegrityError: if another request recorded one of the event ids after we
+                                looked it up, or it was recorded for another reading
+        """
+        # Link each document response to the reading data
+        new_document_responses, updated_document_responses = \
+            self._save_document_responses(reading_data, document_responses)
+
+        # Save student segment data, leaving out the events we've already recorded
+        segment_data = self._dedupe_events(segment_data)
+        recorded_event_ids = set(
+            StudentSegmentData.objects.filter(
+                reading_data=reading_data,
+                event_id__in=[data['event_id'] for data in segment_data if data.get('event_id')]
+            ).values_list('event_id', flat=True)
+        )
+        segment_data = [
+            data for data in segment_data if data.get('event_id') not in recorded_event_ids
+        ]
+        new_segment_data = [
+            StudentSegmentData(
+                segment_id=this_segment_data['id'],
                 reading_data=reading_data,
                 scroll_data=this_segment_data['scroll_data'],
                 view_time=this_segment_data['view_time'],
-                is_rereading=this_segment_data['is_rereading']
+                is_rereading=this_segment_data['is_rereading'],
+                event_id=this_segment_data.get('event_id'),
             )
-
-            # Save responses for this segment
-            segment_question_responses = this_segment_data.pop('segment_responses')
-            for response in segment_question_responses:
+            for this_segment_data in segment_data
+        ]
+        if connection.features.can_return_rows_from_bulk_insert:
+            StudentSegmentData.objects.bulk_create(new_segment_data)
+        else:
+            # the responses below need the new primary keys, which bulk_create() can't
+            # give us on this database (e.g. SQLite), so insert one by one (we record
+            # them below, so the aggregates' receivers can ignore them)
+            with aggregates.recording_submission():
+                for new_data in new_segment_data:
+                    new_data.save(force_insert=True)
+
+        # Save responses for each segment
+        new_segment_responses = []
+        for this_segment_data, new_data in zip(segment_data, new_segment_data):
+            for response in this_segment_data['segment_responses']:
+                response = dict(response)  # left as submitted, in case we have to retry
                 question_id = response.pop('id')
-                question = SegmentQuestion.objects.get(pk=question_id)
-                response = SegmentQuestionResponse.objects.create(
-                    student_segment_data=segment_data,
-                    question=question,
+                new_segment_responses.append(SegmentQuestionResponse(
+                    student_segment_data=new_data,
+                    question_id=question_id,
                     **response,
-                )
-                if 'evidence' in this_segment_data:
-                    evidence_list = this_segment_data.pop('evidence')
-                    evidence_json = json.dumps(evidence_list)
-                    response.evidence = evidence_json
-                    response.save()
+                ))
+        SegmentQuestionResponse.objects.bulk_create(new_segment_responses)
+
+        aggregates.record_document_responses(new_document_responses, updated_document_responses)
+        aggregates.record_segment_data(new_segment_data)
+        aggregates.record_segment_responses(new_segment_responses)
+        if new_segment_data:
+            counters.recount_readings([reading_data.pk])
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        """
+        Updates a StudentReadingData instance
+
+        Everything is written in a single transaction, with a fixed number of queries per
+        request: the submitted question and segment ids are each checked with one in_bulk(),
+        and the new rows are inserted with bulk_create().
+
+        Submissions are idempotent for items that carry an event_id: segment data whose
+        event_id this reading saved before is skipped (with its responses), and a document
+        response whose event_id it saved before is updated in place. Event ids recorded for
+        another reading are rejected.
+        """
+
+        # Separate out the responses
+        segment_data = validated_data.pop("segment_data")
+        document_responses = validated_data.pop("document_responses")
+        reading_data = instance
+        reading_data.last_updated_time = datetime.now()
+        # only this field: the stored counts are recounted below, by the database
+        reading_data.save(update_fields=['last_updated_time'])
+
+        self._check_ids_exist(
+            DocumentQuestion, (data['id'] for data in document_responses), 'document_responses'
+        )
+        self._check_ids_exist(
+            Segment, (data['id'] for data in segment_data), 'segment_data'
+        )
+        self._check_ids_exist(
+            SegmentQuestion,
+            (response['id'] for data in segment_data for response in data['segment_responses']),
+            'segment_data',
+        )
+
+        try:
+            with transaction.atomic():
+                self._save_events(reading_data, segment_data, document_responses)
+        except IntegrityError:
+            # A concurrent replay of the same events saved them between our lookups and our
+            # inserts: looking them up again finds them now, and skips or updates them
+            try:
+                self._save_events(reading_data, segment_data, document_responses)
+            except IntegrityError as error:
+                raise serializers.ValidationError({
+                    'event_id': 'These events were recorded for another reading',
+                }) from error
 
         return reading_data
 
@@ -242,14 +412,31 @@ class DocumentSerializer(serializers.ModelSerializer):
     document_questions = serializers.SerializerMethodField(read_only=True)
     overview_questions = serializers.SerializerMethodField(read_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Prefetches the segments and questions of the documents in queryset, in the order
+        they're serialized, so that serializing a document takes the same number of queries
+        however many segments it has
+        """
+        segments = SegmentSerializer.setup_eager_loading(Segment.objects.all())
+        return queryset.prefetch_related(
+            Prefetch('segments', queryset=segments),
+            Prefetch('questions', queryset=DocumentQuestion.objects.order_by('id')),
+        )
+
     def get_document_questions(self, obj):
-        queryset = obj.questions.filter(is_overview_question=False)
-        serializer = DocumentQuestionSerializer(queryset, many=True)
+        """ Filtered in Python, since filter() would skip the prefetched questions """
+        questions = [question for question in obj.questions.all()
+                     if not question.is_overview_question]
+        serializer = DocumentQuestionSerializer(questions, many=True)
         return serializer.data
 
     def get_overview_questions(self, obj):
-        queryset = obj.questions.filter(is_overview_question=True)
-        serializer = DocumentQuestionSerializer(queryset, many=True)
+        """ Filtered in Python, like get_document_questions() """
+        questions = [question for question in obj.questions.all()
+                     if question.is_overview_question]
+        serializer = DocumentQuestionSerializer(questions, many=True)
         return serializer.data
 
     class Meta:
@@ -265,6 +452,40 @@ class DocumentSerializer(serializers.ModelSerializer):
         )
 
 
+class DocumentOutlineSerializer(DocumentSerializer):
+    """
+    Serializes Document metadata and questions, leaving the segments to be
+    fetched a window at a time (see SegmentWindowSerializer)
+    """
+    segments = None
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """ Prefetches the document questions of the documents in queryset """
+        return queryset.prefetch_related(
+            Prefetch('questions', queryset=DocumentQuestion.objects.order_by('id')),
+        )
+
+    class Meta(DocumentSerializer.Meta):
+        fields = tuple(field for field in DocumentSerializer.Meta.fields if field != 'segments')
+
+
+class SegmentWindowSerializer(serializers.Serializer):
+    """
+    Serializes a run of consecutive segments of a document (see views.SegmentWindow),
+    with how many segments the document has and where the next run starts
+    """
+    segment_count = serializers.IntegerField()
+    segments = SegmentSerializer(many=True)
+    next_from_sequence = serializers.IntegerField(allow_null=True)
+
+    def create(self, validated_data):
+        """ We will not create new objects using this serializer """
+
+    def update(self, instance, validated_data):
+        """ We will not update data using this serializer """
+
+
 class ReadingSerializer(serializers.Serializer):
     """ Serializer for main reading view """
     document = DocumentSerializer()
@@ -277,8 +498,20 @@ class ReadingSerializer(serializers.Serializer):
         """ We will not update data using this serializer """
 
 
+class WindowedReadingSerializer(ReadingSerializer):
+    """
+    Serializer for the reading view when it loads the document's segments a window at a
+    time: the document comes without its segments, and the first window of them alongside
+    """
+    document = DocumentOutlineSerializer()
+    segment_window = SegmentWindowSerializer()
+
+
 class AnalysisSerializer(serializers.Serializer):
-    """ Serializes analysis class """
+    """
+    Serializes analysis class
+    Pass fields=[...] to serialize (and so compute) only some of the analyses.
+    """
     total_and_median_view_time = serializers.ReadOnlyField()
     mean_reading_vs_rereading_time = serializers.ReadOnlyField()
     get_number_of_unique_students = serializers.ReadOnlyField()
@@ -291,6 +524,15 @@ class AnalysisSerializer(serializers.Serializer):
     relevant_words_percent_display_question = serializers.ReadOnlyField()
     get_number_of_segments = serializers.ReadOnlyField()
 
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        # Drop the fields we weren't asked for, so their analyses never run
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
     def create(self, validated_data):
         """ We will not create new objects using this serializer """
 
@@ -0,0 +1,163 @@
+"""
+
+submission_queue.py - write-behind queue for the reading data students submit
+
+With settings.READING_DATA_WRITE_BEHIND on, add_response validates a submission, stores it
+as a PendingSubmission and responds straight away with its receipt id. The rows are written
+later, in batches, by drain() (run by `python manage.py drain_submissions`).
+
+Draining is idempotent: a submission is claimed (marked processed) and saved in the same
+transaction, so a drain that dies half way leaves it pending, and a submission that another
+drain already claimed is skipped rather than saved twice. A submission whose save fails for
+a reason other than its data stays pending, and is retried with a growing delay.
+
+"""
+import datetime
+import json
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import PendingSubmission
+from .serializers import StudentReadingDataSerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+
+# A submission that fails to save for a reason that may go away is tried again after
+# RETRY_DELAY, then twice that, and so on, up to MAX_ATTEMPTS times
+RETRY_DELAY = datetime.timedelta(seconds=30)
+MAX_ATTEMPTS = 8
+
+
+def enqueue(reading_data, data, receipt_id=None):
+    """
+    Queues a validated submission
+
+    :param reading_data: the StudentReadingData it's for
+    :param data: the submitted data (what StudentReadingDataSerializer validated)
+    :param receipt_id: UUID chosen by the client, or None to generate one. Queueing a
+                       receipt_id that is already queued does nothing.
+    :return: the PendingSubmission
+    """
+    if receipt_id is not None:
+        existing = PendingSubmission.objects.filter(receipt_id=receipt_id).first()
+        if existing is not None:
+            return existing
+
+    submission = PendingSubmission(reading_data=reading_data, payload=json.dumps(data))
+    if receipt_id is not None:
+        submission.receipt_id = receipt_id
+    try:
+        with transaction.atomic():
+            submission.save()
+    except IntegrityError:
+        # the same receipt_id was queued concurrently
+        return PendingSubmission.objects.get(receipt_id=receipt_id)
+    return submission
+
+
+def _save_submission(submission):
+    """ Saves a claimed submission's data, as add_response would have """
+    serializer = StudentReadingDataSerializer(
+        instance=submission.reading_data,
+        data=json.loads(submission.payload),
+    )
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+
+
+def _retry_later(submission, error):
+    """
+    Puts a claimed submission whose save failed for a reason that may go away back in
+    the queue, to be tried again after a delay that doubles with every attempt; after
+    MAX_ATTEMPTS it is set aside with its error instead
+    """
+    attempts = submission.attempts + 1
+    message = json.dumps(f'{type(error).__name__}: {error}')
+    if attempts >= MAX_ATTEMPTS:
+        logger.error('Giving up on submission %s after %d attempts: %s',
+                     submission.receipt_id, attempts, error)
+        PendingSubmission.objects.filter(pk=submission.pk).update(
+            attempts=attempts, error=message,
+        )
+        return
+    logger.warning('Could not save submission %s (attempt %d), will retry: %s',
+                   submission.receipt_id, attempts, error)
+    PendingSubmission.objects.filter(pk=submission.pk).update(
+        processed_time=None,
+        attempts=attempts,
+        next_attempt_time=timezone.now() + RETRY_DELAY * 2 ** (attempts - 1),
+        error=message,
+    )
+
+
+def drain(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Saves up to batch_size pending submissions, oldest first, in one transaction
+
+    A submission whose data is invalid (e.g. its questions were deleted since, or its
+    payload isn't JSON) is marked as processed with its error, so that it doesn't block
+    the rest of the queue. Any other error (e.g. a lock timeout) may go away, so the
+    submission stays pending and is tried again later (see _retry_later).
+
+    :return: int, the number of submissions processed (or put back to retry)
+    """
+    processed_count = 0
+    with transaction.atomic():
+        now = timezone.now()
+        pending = (
+            PendingSubmission.objects
+            .filter(processed_time__isnull=True)
+            .filter(Q(next_attempt_time__isnull=True) | Q(next_attempt_time__lte=now))
+            .select_related('reading_data')
+            .order_by('id')[:batch_size]
+        )
+        for submission in pending:
+            # claim it: if another drain got there first, this updates nothing
+            claimed = PendingSubmission.objects.filter(
+                pk=submission.pk, processed_time__isnull=True,
+            ).update(processed_time=now)
+            if not claimed:
+                continue
+            processed_count += 1
+
+            try:
+                with transaction.atomic():
+                    _save_submission(submission)
+            except ValidationError as error:
+                logger.warning('Could not save submission %s: %s', submission.receipt_id,
+                               error.detail)
+                PendingSubmission.objects.filter(pk=submission.pk).update(
+                    error=json.dumps(error.detail)
+                )
+            except json.JSONDecodeError as error:
+                # the payload isn't JSON: it never will be
+                logger.warning('Could not read submission %s: %s', submission.receipt_id,
+                               error)
+                PendingSubmission.objects.filter(pk=submission.pk).update(
+                    error=json.dumps(f'{type(error).__name__}: {error}')
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                # anything else would roll back the whole batch, leaving this submission
+                # at the head of the queue
+                _retry_later(submission, error)
+    return processed_count
+
+
+def drain_all(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Drains batches until the queue is empty
+
+    :return: int, the number of submissions processed
+    """
+    total = 0
+    while True:
+        processed_count = drain(batch_size)
+        total += processed_count
+        if processed_count == 0:
+            return total
@@ -2,10 +2,1285 @@
 Tests for the Rereading app.
 """
 
-from django.test import TestCase
+import datetime
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from unittest import mock, skipIf
 
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    Document, Segment, Student,
+    SegmentQuestion, SegmentQuestionResponse,
+    StudentReadingData, StudentSegmentData,
+    DocumentQuestion, DocumentQuestionResponse,
+    PendingSubmission, ReadingAggregate,
+)
+from . import (
+    aggregates, analysis_cache, analysis_helpers, analysis_parallel, counters,
+    submission_queue, views,
+)
+from .analysis import RereadingAnalysis
+from .analysis_queries import percentile
+from .analysis_cache import get_analysis_cache, get_cached_analysis
+from .analysis_parallel import evaluate_analyses
+from .document_cache import get_document_cache
+from .serializers import (
+    AnalysisSerializer,
+    StudentReadingDataSerializer,
+    StudentSegmentDataSerializer,
+)
 from .proto_analysis import PrototypeRereadingAnalysis
-from .analysis_helpers import remove_outliers
+from .query_plans import FULL_SCAN_PATTERNS, check_query_plans, find_full_scans
+from .analysis_helpers import (
+    RELEVANT_WORDS,
+    WordMatcher,
+    content_words,
+    heat_map_buckets,
+    heat_map_buckets_numpy,
+    relevant_words_in,
+    remove_outliers,
+    string_contains_words,
+    tokenize_response,
+)
+
+
+def create_test_readings(title='Recitatif'):
+    """
+    Creates a small document with two segments and two students' readings of it,
+    for the RereadingAnalysis tests.
+
+    :return: the Document
+    """
+    document = Document.objects.create(title=title, author='Toni Morrison')
+    segment_1 = Segment.objects.create(document=document, sequence=1, text='one two three')
+    segment_2 = Segment.objects.create(document=document, sequence=2, text='four five')
+    segment_question = SegmentQuestion.objects.create(segment=segment_1, text='Who is Twyla?')
+    document_question = DocumentQuestion.objects.create(document=document,
+                                                        text='What is this about?')
+
+    reading_1 = StudentReadingData.objects.create(
+        student=Student.objects.create(name='Alice'),
+        document=document,
+    )
+    reading_2 = StudentReadingData.objects.create(
+        student=Student.objects.create(name=''),
+        document=document,
+    )
+
+    segment_data = [
+        (reading_1, segment_1, 10, False, '[0, 600, -5]'),
+        (reading_1, segment_1, 5, True, '[100]'),
+        (reading_1, segment_2, 20, False, '[]'),
+        (reading_2, segment_1, 30, False, '[]'),
+        (reading_2, segment_2, 0.5, True, '[]'),
+    ]
+    for reading, segment, view_time, is_rereading, scroll_data in segment_data:
+        StudentSegmentData.objects.create(
+            reading_data=reading,
+            segment=segment,
+            view_time=view_time,
+            is_rereading=is_rereading,
+            scroll_data=scroll_data,
+        )
+
+    first_reads = StudentSegmentData.objects.filter(segment=segment_1, is_rereading=False)
+    SegmentQuestionResponse.objects.create(
+        question=segment_question,
+        student_segment_data=first_reads.get(reading_data=reading_1),
+        response='The narrator has a bad memory',
+    )
+    SegmentQuestionResponse.objects.create(
+        question=segment_question,
+        student_segment_data=first_reads.get(reading_data=reading_2),
+        response='Nothing here',
+    )
+    DocumentQuestionResponse.objects.create(
+        question=document_question,
+        student_reading_data=reading_1,
+        response='Memory and memory',
+    )
+    return document
+
+
+def create_test_submission(reading, response_count, question_id=None):
+    """
+    Returns the data the frontend would post to /api/add-response/ after reading the first
+    segment of create_test_readings()'s document, with response_count responses
+    """
+    question_id = question_id or SegmentQuestion.objects.get().id
+    return {
+        'reading_data_id': reading.id,
+        'segment_data': [{
+            'id': Segment.objects.get(sequence=1).id,
+            'scroll_data': '[10, 20]',
+            'view_time': 12.5,
+            'is_rereading': True,
+            'segment_responses': [
+                {'id': question_id, 'response': 'A response'}
+                for _ in range(response_count)
+            ],
+        }],
+        'document_responses': [{
+            'id': DocumentQuestion.objects.get().id,
+            'response': 'Memory, race and class',
+            'response_segment': 1,
+        }],
+    }
+
+
+class RereadingAnalysisTests(TestCase):
+    """
+    Tests for the RereadingAnalysis metrics, run against a small hand-built data set
+    """
+    @classmethod
+    def setUpTestData(cls):
+        create_test_readings()
+
+    def setUp(self):
+        self.analyzer = RereadingAnalysis(use_aggregates=False)
+
+    def test_total_and_median_view_time(self):
+        """ per-reading totals are 35 and 30.5 seconds """
+        self.assertEqual((66, 33), self.analyzer.total_and_median_view_time())
+
+    def test_mean_reading_vs_rereading_time(self):
+        """ 60 seconds of reading and 5.5 of rereading, over two readings """
+        self.assertEqual((30, 3), self.analyzer.mean_reading_vs_rereading_time())
+
+    def test_compute_reread_counts(self):
+        """ rereads of a second or less are not counted """
+        self.assertEqual([[1, 0.5]], self.analyzer.compute_reread_counts())
+
+    def test_sql_and_python_aggregates_agree(self):
+        """ the database aggregates give the same results as the Python fallback """
+        python_analyzer = RereadingAnalysis(use_sql=False, use_aggregates=False)
+        for method in ('total_and_median_view_time',
+                       'mean_reading_vs_rereading_time',
+                       'compute_reread_counts'):
+            self.assertEqual(
+                getattr(python_analyzer, method)(),
+                getattr(self.analyzer, method)(),
+                method,
+            )
+
+    def test_unique_students(self):
+        """ counting the students reads the readings, and nothing else """
+        with self.assertNumQueries(1):
+            self.assertEqual(3, self.analyzer.get_number_of_unique_students())
+        self.assertFalse(self.analyzer.snapshot.is_loaded('segment_data'))
+
+    def test_percentile(self):
+        """ percentiles interpolate between ranks, like percentile_cont """
+        view_times = StudentSegmentData.objects.all()  # 0.5, 5, 10, 20, 30
+        self.assertEqual(10, percentile(view_times, 'view_time', 0.5))
+        self.assertEqual(5, percentile(view_times, 'view_time', 0.25))
+        self.assertEqual(25, percentile(view_times, 'view_time', 0.875))
+        self.assertIsNone(percentile(view_times.none(), 'view_time', 0.5))
+
+    def test_get_all_heat_maps(self):
+        """ negative scroll positions are dropped, the rest are bucketed by 500px """
+        expected = {
+            'Recitatif 1': {
+                'reading': {'0 — 500': 1, '500 — 1000': 1},
+                'rereading': {'0 — 500': 1},
+            },
+            'Recitatif 2': {'reading': {}, 'rereading': {}},
+        }
+        self.assertEqual(expected, self.analyzer.get_all_heat_maps())
+        with mock.patch.object(analysis_helpers, 'np', None):
+            self.assertEqual(expected, RereadingAnalysis(use_aggregates=False).get_all_heat_maps())
+
+    @skipIf(analysis_helpers.np is None, 'NumPy is not installed')
+    def test_heat_map_buckets_numpy(self):
+        """ the NumPy counts are the same as the Python ones """
+        scroll_data = [array('i', [0, 600, -5, 1200, 600]), array('i'), array('i', [499, 500])]
+        self.assertEqual(
+            heat_map_buckets(chain.from_iterable(scroll_data), 500),
+            heat_map_buckets_numpy(scroll_data, 500),
+        )
+        self.assertEqual({}, heat_map_buckets_numpy([array('i', [-1])], 500))
+
+    def test_relevant_words(self):
+        """ only the first response uses relevant words """
+        self.assertEqual([('Who is Twyla?', 3)], self.analyzer.relevant_words_by_question())
+        self.assertEqual(
+            [('Who is Twyla?', 0.5)],
+            self.analyzer.percent_using_relevant_words_by_question()[1],
+        )
+        self.assertEqual(
+            [['Who is Twyla?', '50.00%', 1, {'narrator': 1, 'memory': 1}]],
+            self.analyzer.relevant_words_percent_display_question(),
+        )
+
+    def test_relevant_word_frequencies(self):
+        """ words are ordered by frequency, cut off at results_to_show, for every question """
+        SegmentQuestionResponse.objects.create(
+            question=SegmentQuestion.objects.get(),
+            student_segment_data=StudentSegmentData.objects.first(),
+            response='memory memory Twyla',
+        )
+        SegmentQuestion.objects.create(segment=Segment.objects.get(sequence=2),
+                                       text='Who is Maggie?')
+        for use_aggregates in (False, True):
+            aggregates.rebuild()
+            analyzer = RereadingAnalysis(use_aggregates=use_aggregates)
+            rows = analyzer.relevant_words_percent_display_question(results_to_show=2)
+            self.assertEqual(
+                [
+                    ['Who is Twyla?', '100.00%', 2, {'memory': 3, 'narrator': 1}],
+                    ['Who is Maggie?', '0.00%', 0, {}],
+                ],
+                rows,
+            )
+            self.assertEqual(['memory', 'narrator'], list(rows[0][3]))
+
+    def test_most_common_words_by_question(self):
+        """ stopwords are dropped from the top words """
+        self.assertEqual(
+            [
+                ['Global', 1, 'What is this about?', 'memory'],
+                [1, 1, 'Who is Twyla?', 'narrator, bad, memory, nothing'],
+            ],
+            self.analyzer.most_common_words_by_question(),
+        )
+
+
+class AggregateAssertions:
+    """
+    Checks of the running analysis aggregates, for the aggregate test cases
+    """
+    aggregated_analyses = (
+        'total_and_median_view_time',
+        'mean_reading_vs_rereading_time',
+        'compute_reread_counts',
+        'relevant_words_by_question',
+        'percent_using_relevant_words_by_question',
+        'relevant_words_percent_display_question',
+        'most_common_words_by_question',
+        'get_all_heat_maps',
+    )
+
+    def assert_aggregates_match_full_scan(self):
+        """ every aggregated analysis gives the same result as scanning the raw rows """
+        from_aggregates = RereadingAnalysis(use_aggregates=True)
+        full_scan = RereadingAnalysis(use_sql=False, use_aggregates=False)
+        for analysis_name in self.aggregated_analyses:
+            self.assertEqual(
+                getattr(full_scan, analysis_name)(),
+                getattr(from_aggregates, analysis_name)(),
+                analysis_name,
+            )
+
+
+class AggregateTests(AggregateAssertions, TestCase):
+    """
+    Tests for the running analysis aggregates
+    """
+    def setUp(self):
+        create_test_readings()
+
+    def test_rebuild(self):
+        """ aggregates rebuilt from scratch match the raw data """
+        aggregates.rebuild()
+        self.assert_aggregates_match_full_scan()
+
+    def test_updated_on_submission(self):
+        """ submitting reading data through the API keeps the aggregates in sync """
+        aggregates.rebuild()
+        reading = StudentReadingData.objects.get(student__name='Alice')
+        segment = Segment.objects.get(sequence=1)
+        data = {
+            'reading_data_id': reading.id,
+            'segment_data': [{
+                'id': segment.id,
+                'scroll_data': '[10, 20]',
+                'view_time': 12.5,
+                'is_rereading': True,
+                'segment_responses': [{
+                    'id': SegmentQuestion.objects.get().id,
+                    'response': 'Twyla remembers it wrong, Twyla',
+                }],
+            }],
+            'document_responses': [{
+                'id': DocumentQuestion.objects.get().id,
+                'response': 'Memory, race and class',
+                'response_segment': 1,
+            }],
+        }
+        response = APIClient().post('/api/add-response/', data, format='json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, reading.segment_data.filter(is_rereading=True).count())
+        self.assert_aggregates_match_full_scan()
+
+    def test_heat_maps_read_from_buckets(self):
+        """ the heat maps are read from the buckets, without going through the segment data """
+        aggregates.rebuild()
+        with CaptureQueriesContext(connection) as queries:
+            heat_maps = RereadingAnalysis(use_aggregates=True).get_all_heat_maps()
+        self.assertEqual(['Recitatif 1', 'Recitatif 2'], list(heat_maps))
+        self.assertFalse(any('readings_studentsegmentdata' in query['sql']
+                             for query in queries.captured_queries))
+
+    def test_heat_map_bucket_size(self):
+        """ buckets of another size are recounted in the configured size before they are read """
+        aggregates.rebuild()
+        with override_settings(ANALYSIS_HEAT_MAP_BUCKET_SIZE=100):
+            heat_maps = RereadingAnalysis(use_aggregates=True).get_all_heat_maps()
+            self.assertEqual({'0 — 100': 1, '600 — 700': 1}, heat_maps['Recitatif 1']['reading'])
+            self.assertTrue(aggregates.heat_map_buckets_are_current(100))
+            self.assert_aggregates_match_full_scan()
+
+
+class CounterTests(TestCase):
+    """
+    Tests for the counts stored on Document, Segment and StudentReadingData
+    """
+    def setUp(self):
+        self.document = create_test_readings()
+        self.reading = StudentReadingData.objects.get(student__name='Alice')
+
+    def assert_counts(self, segment_count, segment_data_count, total_view_time):
+        """ the stored counts of the document and Alice's reading """
+        self.document.refresh_from_db()
+        self.reading.refresh_from_db()
+        self.assertEqual(segment_count, len(self.document))
+        self.assertEqual(segment_data_count, self.reading.segment_data_count)
+        self.assertEqual(total_view_time, self.reading.get_total_view_time())
+
+    def test_counted_on_save(self):
+        """ the counts are stored as segments and segment data are saved and deleted """
+        self.assert_counts(2, 3, 35)
+        segment = Segment.objects.get(sequence=1)
+        self.assertEqual(3, len(segment))
+        segment.text = 'one two three four'
+        segment.save()
+        self.assertEqual(4, Segment.objects.get(sequence=1).word_count)
+
+        Segment.objects.get(sequence=2).delete()
+        self.assert_counts(1, 2, 15)
+
+    def test_counted_on_submission(self):
+        """ segment data submitted through the API is counted """
+        response = APIClient().post('/api/add-response/',
+                                    create_test_submission(self.reading, 1), format='json')
+        self.assertEqual(200, response.status_code)
+        self.assert_counts(2, 4, round(35 + 12.5))
+
+    def test_recounted_once_per_submission(self):
+        """ a submission recounts its reading once, however many rows it inserts """
+        data = create_test_submission(self.reading, 1)
+        data['segment_data'] *= 3
+        serializer = StudentReadingDataSerializer(instance=self.reading, data=data)
+        self.assertTrue(serializer.is_valid())
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+        recounts = [query for query in queries.captured_queries
+                    if '"segment_data_count" = ' in query['sql']]
+        self.assertEqual(1, len(recounts))
+        self.assert_counts(2, 6, round(35 + 3 * 12.5))
+
+    def test_no_queries(self):
+        """ __len__, __str__ and get_total_view_time() read the stored counts """
+        reading = StudentReadingData.objects.select_related('student').get(pk=self.reading.pk)
+        segment = Segment.objects.select_related('document').get(sequence=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(f'{reading.student} - 3 segments completed - 35 seconds',
+                             str(reading))
+            self.assertEqual('Recitatif - Segment 1 of 2', str(segment))
+            self.assertEqual(3, len(segment))
+
+    def test_rebuild(self):
+        """ rebuild() recounts everything from the raw data """
+        Document.objects.update(segment_count=0)
+        Segment.objects.update(word_count=0)
+        StudentReadingData.objects.update(segment_data_count=0, total_view_time=0)
+        counters.rebuild()
+        self.assert_counts(2, 3, 35)
+        self.assertEqual(3, Segment.objects.get(sequence=1).word_count)
+
+
+class AggregateSyncTests(AggregateAssertions, TransactionTestCase):
+    """
+    Tests for applying writes outside of submissions to the aggregates. The analysis
+    cache is cleared when the transaction commits, hence TransactionTestCase.
+    """
+    def setUp(self):
+        create_test_readings()
+        self.reading = StudentReadingData.objects.get(student__name='Alice')
+
+    def test_edits_and_deletes(self):
+        """ editing or deleting raw data in the admin or the shell updates the aggregates """
+        self.assert_aggregates_match_full_scan()
+
+        segment_data = self.reading.segment_data.get(is_rereading=False, view_time=20)
+        segment_data.view_time = 1000
+        segment_data.scroll_data = '[1200, 1300]'
+        segment_data.save()
+        self.assert_aggregates_match_full_scan()
+
+        response = SegmentQuestionResponse.objects.get(response='Nothing here')
+        response.response = 'Twyla remembers'
+        response.save()
+        self.assert_aggregates_match_full_scan()
+
+        self.reading.segment_data.filter(is_rereading=True).get().delete()
+        self.assert_aggregates_match_full_scan()
+
+        self.reading.delete()
+        self.assert_aggregates_match_full_scan()
+
+    def test_applied_without_rebuilding(self):
+        """
+        edits are applied to the aggregates row by row, and the analysis cache is cleared
+        once per transaction
+        """
+        with mock.patch.object(aggregates, 'rebuild') as rebuild, \
+                mock.patch.object(aggregates, 'get_analysis_cache') as get_cache:
+            with transaction.atomic():
+                for segment_data in StudentSegmentData.objects.filter(reading_data=self.reading):
+                    segment_data.view_time += 1
+                    segment_data.save()
+                DocumentQuestionResponse.objects.filter(
+                    student_reading_data=self.reading).delete()
+            rebuild.assert_not_called()
+            get_cache().clear.assert_called_once_with()
+        self.assert_aggregates_match_full_scan()
+
+    @override_settings(ANALYSIS_USE_AGGREGATES=False)
+    def test_not_applied_when_disabled(self):
+        """ with the aggregates turned off, edits leave them alone """
+        view_times = list(ReadingAggregate.objects.values_list('reading_view_time', flat=True))
+        for segment_data in self.reading.segment_data.all():
+            segment_data.view_time += 1
+            segment_data.save()
+        self.assertEqual(view_times, list(
+            ReadingAggregate.objects.values_list('reading_view_time', flat=True)))
+
+    def test_not_rebuilt_on_submission(self):
+        """ submitted rows are recorded as they're saved, not rebuilt """
+        with mock.patch.object(aggregates, 'rebuild') as rebuild:
+            response = APIClient().post('/api/add-response/',
+                                        create_test_submission(self.reading, 1), format='json')
+        self.assertEqual(200, response.status_code)
+        rebuild.assert_not_called()
+        self.assert_aggregates_match_full_scan()
+
+
+class SubmissionTests(TestCase):
+    """
+    Tests for saving the reading data the frontend submits to /api/add-response/
+    """
+    def setUp(self):
+        create_test_readings()
+        self.reading = StudentReadingData.objects.get(student__name='Alice')
+        self.client = APIClient()
+
+    def submission(self, response_count, question_id=None):
+        """ a submission of one segment's data with response_count responses """
+        return create_test_submission(self.reading, response_count, question_id)
+
+    def save_submission(self, response_count):
+        """ saves a submission, returning how many queries that took """
+        serializer = StudentReadingDataSerializer(instance=self.reading,
+                                                  data=self.submission(response_count))
+        self.assertTrue(serializer.is_valid())
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+        return len(queries)
+
+    def test_bulk_inserts(self):
+        """ the number of queries doesn't grow with the number of responses """
+        self.save_submission(1)  # creates the aggregates' rows
+        self.assertEqual(self.save_submission(1), self.save_submission(5))
+        self.assertEqual(7, SegmentQuestionResponse.objects.filter(
+            student_segment_data__reading_data=self.reading, response='A response',
+        ).count())
+
+    def test_unknown_question(self):
+        """ a submission referring to a missing question is rejected as a whole """
+        segment_data_count = StudentSegmentData.objects.count()
+        response = self.client.post('/api/add-response/',
+                                    self.submission(1, question_id=999), format='json')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(segment_data_count, StudentSegmentData.objects.count())
+        self.assertFalse(DocumentQuestionResponse.objects.filter(
+            response='Memory, race and class').exists())
+
+    def test_packed_scroll_data(self):
+        """ scroll data posted as JSON text is stored as packed ints, and read back as JSON """
+        data = self.submission(0)
+        data['segment_data'][0]['scroll_data'] = '[10.7, 20, -0.5]'
+        self.assertEqual(200, self.client.post('/api/add-response/', data,
+                                               format='json').status_code)
+        segment_data = StudentSegmentData.objects.latest('id')
+        self.assertEqual(array('i', [10, 20, -1]), segment_data.get_parsed_scroll_data())
+        self.assertEqual('[10, 20, -1]',
+                         StudentSegmentDataSerializer(segment_data).data['scroll_data'])
+
+        data['segment_data'][0]['scroll_data'] = 'not a list'
+        self.client.post('/api/add-response/', data, format='json')
+        self.assertEqual(segment_data, StudentSegmentData.objects.latest('id'))
+
+    def test_evidence(self):
+        """ evidence is stored as a JSON list, and comes back out as one """
+        data = self.submission(1)
+        data['segment_data'][0]['segment_responses'][0]['evidence'] = ['salt and pepper']
+        data['document_responses'][0]['evidence'] = ["Twyla's mother"]
+        self.client.post('/api/add-response/', data, format='json')
+
+        segment_response = SegmentQuestionResponse.objects.get(response='A response')
+        self.assertEqual(['salt and pepper'], segment_response.evidence)
+        self.assertEqual(["Twyla's mother"], DocumentQuestionResponse.objects.get(
+            response='Memory, race and class').evidence)
+        self.assertIn(('A response', ['salt and pepper']),
+                      RereadingAnalysis().all_responses()[0][3])
+
+    def event_submission(self, response_count):
+        """ a submission whose segment data and document response carry event ids """
+        data = self.submission(response_count)
+        data['segment_data'][0]['event_id'] = '0b6f3c1e-8d2a-4f5e-9c7b-2a1d3e4f5a6b'
+        data['document_responses'][0]['event_id'] = '7c2e4a9d-1b3f-4e6a-8d5c-9f0a1b2c3d4e'
+        return data
+
+    def test_replayed_submission(self):
+        """ posting the same events again records nothing new """
+        aggregates.rebuild()
+        segment_data_count = StudentSegmentData.objects.count()
+        for _ in range(2):
+            response = self.client.post('/api/add-response/', self.event_submission(2),
+                                        format='json')
+            self.assertEqual(200, response.status_code)
+        self.assertEqual(segment_data_count + 1, StudentSegmentData.objects.count())
+        self.assertEqual(2, SegmentQuestionResponse.objects.filter(response='A response').count())
+        self.assertEqual(1, DocumentQuestionResponse.objects.filter(
+            response='Memory, race and class').count())
+        self.assertEqual(
+            RereadingAnalysis(use_aggregates=False).total_and_median_view_time(),
+            RereadingAnalysis(use_aggregates=True).total_and_median_view_time(),
+        )
+
+    def test_concurrent_replay(self):
+        """
+        a replay that misses the events a concurrent replay just saved still records
+        nothing new
+        """
+        self.client.post('/api/add-response/', self.event_submission(2), format='json')
+        segment_data_count = StudentSegmentData.objects.count()
+        manager = StudentSegmentData.objects
+        lookups = []
+
+        def filter_missing_once(*args, **kwargs):
+            """ the first lookup of recorded events finds none, as if not committed yet """
+            lookups.append(kwargs)
+            queryset = type(manager).filter(manager, *args, **kwargs)
+            return queryset.none() if len(lookups) == 1 else queryset
+
+        with mock.patch.object(manager, 'filter', side_effect=filter_missing_once):
+            response = self.client.post('/api/add-response/', self.event_submission(2),
+                                        format='json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(lookups))
+        self.assertEqual(segment_data_count, StudentSegmentData.objects.count())
+        self.assertEqual(2, SegmentQuestionResponse.objects.filter(response='A response').count())
+
+    def test_other_readings_events(self):
+        """ event ids recorded for another reading are rejected, leaving its data alone """
+        self.client.post('/api/add-response/', self.event_submission(1), format='json')
+        segment_data_count = StudentSegmentData.objects.count()
+        data = self.event_submission(1)
+        data['reading_data_id'] = StudentReadingData.objects.exclude(pk=self.reading.pk)[0].pk
+        data['document_responses'][0]['response'] = 'Race and memory'
+
+        response = self.client.post('/api/add-response/', data, format='json')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(segment_data_count, StudentSegmentData.objects.count())
+        self.assertEqual(self.reading, DocumentQuestionResponse.objects.get(
+            event_id=data['document_responses'][0]['event_id']).student_reading_data)
+        self.assertFalse(DocumentQuestionResponse.objects.filter(
+            response='Race and memory').exists())
+
+    def test_edited_document_response(self):
+        """ a document response resubmitted under its event id replaces the old one """
+        aggregates.rebuild()
+        self.client.post('/api/add-response/', self.event_submission(1), format='json')
+        data = self.event_submission(1)
+        data['document_responses'][0]['response'] = 'Race and memory'
+        self.client.post('/api/add-response/', data, format='json')
+
+        response = DocumentQuestionResponse.objects.get(
+            event_id=data['document_responses'][0]['event_id'])
+        self.assertEqual('Race and memory', response.response)
+        self.assertEqual(
+            RereadingAnalysis(use_aggregates=False).most_common_words_by_question(),
+            RereadingAnalysis(use_aggregates=True).most_common_words_by_question(),
+        )
+
+
+@override_settings(READING_DATA_WRITE_BEHIND=True)
+class SubmissionQueueTests(TestCase):
+    """
+    Tests for queueing submissions in write-behind mode and saving them later
+    """
+    def setUp(self):
+        create_test_readings()
+        self.reading = StudentReadingData.objects.get(student__name='Alice')
+        self.client = APIClient()
+
+    def submission(self, response_count, question_id=None):
+        """ a submission of one segment's data with response_count responses """
+        return create_test_submission(self.reading, response_count, question_id)
+
+    def test_queued_then_drained(self):
+        """ a queued submission is only saved by draining, and only once """
+        segment_data_count = StudentSegmentData.objects.count()
+        response = self.client.post('/api/add-response/', self.submission(2), format='json')
+        self.assertEqual(202, response.status_code)
+        receipt_id = response.data['receipt_id']
+        self.assertEqual(segment_data_count, StudentSegmentData.objects.count())
+
+        self.assertEqual(1, submission_queue.drain_all())
+        self.assertEqual(segment_data_count + 1, StudentSegmentData.objects.count())
+        self.assertEqual(0, submission_queue.drain_all())
+        self.assertEqual(segment_data_count + 1, StudentSegmentData.objects.count())
+        submission = PendingSubmission.objects.get(receipt_id=receipt_id)
+        self.assertIsNotNone(submission.processed_time)
+        self.assertEqual('', submission.error)
+
+    def test_retried_post(self):
+        """ posting again with the same receipt_id doesn't queue the data twice """
+        data = dict(self.submission(1), receipt_id='5f0e0b4c-5a9a-4c3e-9d55-1c2f3e4d5a6b')
+        for _ in range(2):
+            response = self.client.post('/api/add-response/', data, format='json')
+            self.assertEqual(202, response.status_code)
+            self.assertEqual(data['receipt_id'], str(response.data['receipt_id']))
+        self.assertEqual(1, PendingSubmission.objects.count())
+
+    def test_failed_submission(self):
+        """ a submission that can't be saved any more is set aside with its error """
+        self.client.post('/api/add-response/', self.submission(1), format='json')
+        self.client.post('/api/add-response/', self.submission(1), format='json')
+        PendingSubmission.objects.filter(pk=PendingSubmission.objects.first().pk).update(
+            payload=json.dumps(dict(self.submission(1, question_id=999)))
+        )
+        self.assertEqual(2, submission_queue.drain_all(batch_size=1))
+        failed, saved = PendingSubmission.objects.order_by('id')
+        self.assertIn('Unknown SegmentQuestion ids: 999', failed.error)
+        self.assertEqual('', saved.error)
+        self.assertEqual(1, StudentSegmentData.objects.filter(
+            segment_responses__response='A response').count())
+
+    def test_crashed_submission(self):
+        """ a submission whose payload can't be read is set aside with its error """
+        self.client.post('/api/add-response/', self.submission(1), format='json')
+        self.client.post('/api/add-response/', self.submission(1), format='json')
+        PendingSubmission.objects.filter(pk=PendingSubmission.objects.first().pk).update(
+            payload='{not json'
+        )
+        self.assertEqual(2, submission_queue.drain())
+        failed, saved = PendingSubmission.objects.order_by('id')
+        self.assertIn('JSONDecodeError', failed.error)
+        self.assertIsNotNone(failed.processed_time)
+        self.assertEqual('', saved.error)
+        self.assertEqual(1, StudentSegmentData.objects.filter(
+            segment_responses__response='A response').count())
+
+    def test_transient_failure(self):
+        """
+        a submission whose save fails for a reason that may go away stays queued, and is
+        retried later (and set aside after MAX_ATTEMPTS)
+        """
+        self.client.post('/api/add-response/', self.submission(1), format='json')
+        locked = mock.patch.object(StudentReadingDataSerializer, 'save',
+                                   side_effect=OperationalError('database is locked'))
+        with locked:
+            self.assertEqual(1, submission_queue.drain())
+        submission = PendingSubmission.objects.get()
+        self.assertIsNone(submission.processed_time)
+        self.assertEqual(1, submission.attempts)
+        self.assertGreater(submission.next_attempt_time, timezone.now())
+        self.assertIn('database is locked', submission.error)
+        self.assertEqual(0, submission_queue.drain())  # not yet
+
+        PendingSubmission.objects.update(next_attempt_time=timezone.now())
+        self.assertEqual(1, submission_queue.drain())
+        self.assertEqual(1, StudentSegmentData.objects.filter(
+            segment_responses__response='A response').count())
+        self.assertIsNotNone(PendingSubmission.objects.get().processed_time)
+
+        self.client.post('/api/add-response/', self.submission(1), format='json')
+        with locked:
+            for _ in range(submission_queue.MAX_ATTEMPTS):
+                PendingSubmission.objects.update(next_attempt_time=None)
+                submission_queue.drain()
+        submission = PendingSubmission.objects.latest('id')
+        self.assertIsNotNone(submission.processed_time)
+        self.assertEqual(submission_queue.MAX_ATTEMPTS, submission.attempts)
+
+
+class ReadingViewTests(TestCase):
+    """
+    Tests for the /api/documents/<pk>/ endpoint the reading view loads a document from
+    """
+    def setUp(self):
+        get_document_cache().clear()
+        self.document = create_test_readings()
+        self.client = APIClient()
+
+    def get_document(self, **headers):
+        """ gets the document, returning the response and how many queries that took """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/documents/{self.document.id}/', **headers)
+        return response, len(queries)
+
+    def test_constant_queries(self):
+        """ the number of queries doesn't grow with the number of segments """
+        _, query_count = self.get_document()
+        for sequence in range(5, 2, -1):
+            segment = Segment.objects.create(document=self.document, sequence=sequence,
+                                             text='six seven')
+            SegmentQuestion.objects.create(segment=segment, sequence=2, text='Why?')
+            SegmentQuestion.objects.create(segment=segment, sequence=1, text='Who?')
+        DocumentQuestion.objects.create(document=self.document, is_overview_question=True,
+                                        text='How did it end?')
+
+        response, more_segments_query_count = self.get_document()
+        self.assertEqual(query_count, more_segments_query_count)
+
+        data = response.json()
+        segments = data['segments']
+        self.assertEqual([1, 2, 3, 4, 5], [segment['sequence'] for segment in segments])
+        self.assertEqual(['Who?', 'Why?'],
+                         [question['text'] for question in segments[-1]['questions']])
+        self.assertEqual(['What is this about?'],
+                         [question['text'] for question in data['document_questions']])
+        self.assertEqual(['How did it end?'],
+                         [question['text'] for question in data['overview_questions']])
+
+    def test_cached(self):
+        """ a cached document is served without queries, or with a 304 if the client has it """
+        response, _ = self.get_document()
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+
+        cached_response, query_count = self.get_document()
+        self.assertEqual(0, query_count)
+        self.assertEqual(response.content, cached_response.content)
+
+        not_modified_response, query_count = self.get_document(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, not_modified_response.status_code)
+        self.assertEqual(0, query_count)
+
+    def test_invalidated(self):
+        """ editing any part of the document invalidates the cached one """
+        response, _ = self.get_document()
+        etags = [response['ETag']]
+        question = SegmentQuestion.objects.get()
+        edits = [
+            (self.document, 'title', 'Sula'),
+            (Segment.objects.get(sequence=2), 'text', 'six seven'),
+            (question, 'text', 'Who is Roberta?'),
+            (DocumentQuestion.objects.get(), 'is_overview_question', True),
+        ]
+        for instance, field, value in edits:
+            setattr(instance, field, value)
+            instance.save()
+            response, _ = self.get_document(HTTP_IF_NONE_MATCH=etags[-1])
+            self.assertEqual(200, response.status_code)
+            etags.append(response['ETag'])
+
+        question.delete()
+        response, _ = self.get_document(HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual([], response.json()['segments'][0]['questions'])
+        self.assertEqual(6, len(set(etags + [response['ETag']])))
+
+    def test_segment_window(self):
+        """ the segments can be fetched a window at a time """
+        url = f'/api/documents/{self.document.id}/segments/'
+        response = self.client.get(url, {'count': 1})
+        self.assertEqual(2, response.data['segment_count'])
+        self.assertEqual(['one two three'],
+                         [segment['text'] for segment in response.data['segments']])
+        self.assertEqual(2, response.data['next_from_sequence'])
+        self.assertEqual(f'<{url}?from_sequence=2&count=1>; rel="prefetch"', response['Link'])
+
+        response = self.client.get(url, {'from_sequence': 2, 'count': 5})
+        self.assertEqual([2], [segment['sequence'] for segment in response.data['segments']])
+        self.assertIsNone(response.data['next_from_sequence'])
+        self.assertFalse(response.has_header('Link'))
+
+        self.assertEqual(400, self.client.get(url, {'count': 0}).status_code)
+        self.assertEqual(400, self.client.get(url, {'from_sequence': 'one'}).status_code)
+
+    def test_windowed_reading(self):
+        """ starting a reading with ?count= sends only the first window of segments """
+        response = self.client.post(f'/api/documents/{self.document.id}/?count=1',
+                                    {'name': 'Carol'}, format='json')
+        self.assertNotIn('segments', response.data['document'])
+        self.assertEqual(['What is this about?'], [
+            question['text'] for question in response.data['document']['document_questions']
+        ])
+        window = response.data['segment_window']
+        self.assertEqual([1], [segment['sequence'] for segment in window['segments']])
+        self.assertEqual(2, window['segment_count'])
+        self.assertEqual(2, window['next_from_sequence'])
+        self.assertTrue(StudentReadingData.objects.filter(student__name='Carol').exists())
+
+
+class ResponsesViewTests(TestCase):
+    """
+    Tests for listing and exporting the reading data at /api/responses/
+    """
+    def setUp(self):
+        create_test_readings()
+        self.client = APIClient()
+
+    def list_responses(self, **params):
+        """ gets a page of reading data, returning the response and how many queries that took """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/responses/', params)
+        self.assertEqual(200, response.status_code)
+        return response, len(queries)
+
+    def test_cursor_pagination(self):
+        """ the pages follow each other, in the order the readings were created """
+        response, _ = self.list_responses(page_size=1)
+        first_page = response.data['results']
+        response = self.client.get(response.data['next'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            list(StudentReadingData.objects.order_by('id').values_list('id', flat=True)),
+            [reading['id'] for reading in first_page + response.data['results']],
+        )
+
+    def test_constant_queries(self):
+        """ the number of queries doesn't grow with the number of readings """
+        _, query_count = self.list_responses()
+        create_test_readings('Sula')
+        response, more_readings_query_count = self.list_responses()
+        self.assertEqual(4, len(response.data['results']))
+        self.assertEqual(query_count, more_readings_query_count)
+
+    @mock.patch('apps.readings.views.EXPORT_CHUNK_SIZE', 3)
+    def test_export(self):
+        """ the export streams every reading, one per line, as the list serializes them """
+        create_test_readings('Sula')
+        response = self.client.get('/api/responses/export/')
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        listed, _ = self.list_responses()
+        self.assertEqual(json.loads(json.dumps(listed.data['results'])),
+                         [json.loads(line) for line in lines])
+
+
+class ExportTests(TestCase):
+    """
+    Tests for the export_reading_data command, and for loading its exports with
+    analysis/analysis.py
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        spec = importlib.util.spec_from_file_location(
+            'analysis', os.path.join(settings.PROJECT_ROOT, 'analysis', 'analysis.py')
+        )
+        cls.analysis = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.analysis)
+
+    def setUp(self):
+        create_test_readings()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export(self, *args):
+        """ runs the command, returning the directory it exported to """
+        call_command('export_reading_data', self.directory, *args, stdout=mock.Mock())
+        return self.directory
+
+    def test_export(self):
+        """ both formats load back as the rows in the database """
+        export_path = self.export('--part-size', '2')
+        for file_format in ('rcol', 'csv'):
+            segment_data = self.analysis.load_export(export_path, 'segment_data', file_format)
+            self.assertEqual(5, len(segment_data))
+            row = next(row for row in segment_data if row['scroll_data'])
+            database_row = StudentSegmentData.objects.get(id=row['id'])
+            self.assertEqual(database_row.scroll_data.tolist(), row['scroll_data'])
+            self.assertEqual(database_row.submission_time, row['submission_time'])
+            self.assertEqual(database_row.reading_data.student_id, row['student_id'])
+            self.assertEqual(database_row.view_time, row['view_time'])
+            self.assertIs(database_row.is_rereading, row['is_rereading'])
+            self.assertIsNone(row['event_id'])
+
+            responses = self.analysis.load_export(export_path, 'segment_responses', file_format)
+            self.assertEqual(['Nothing here', 'The narrator has a bad memory'],
+                             sorted(row['response'] for row in responses))
+            document_responses = self.analysis.load_export(export_path, 'document_responses',
+                                                           file_format)
+            self.assertEqual([[]], [row['evidence'] for row in document_responses])
+
+    def test_columns(self):
+        """ just the columns asked for are loaded, from either format """
+        export_path = self.export('--part-size', '2')
+        expected = sorted(StudentSegmentData.objects.values_list('id', 'view_time'))
+        for file_format in ('rcol', 'csv'):
+            rows = list(self.analysis.iter_export(export_path, 'segment_data', file_format,
+                                                  columns=['view_time', 'id']))
+            self.assertEqual([{'id', 'view_time'}] * len(expected), [set(row) for row in rows])
+            self.assertEqual(expected, sorted((row['id'], row['view_time']) for row in rows))
+
+        part_path = os.path.join(export_path, 'segment_data', 'part-00000.rcol')
+        self.assertEqual(['scroll_data'], list(self.analysis.load_rcol(part_path,
+                                                                       ['scroll_data'])))
+        with self.assertRaises(ValueError):
+            self.analysis.load_export(export_path, 'segment_data', columns=['views'])
+
+    def test_since(self):
+        """ an incremental export only has the rows submitted after --since """
+        since = timezone.now()
+        DocumentQuestionResponse.objects.update(submission_time=since + datetime.timedelta(1))
+        export_path = self.export('--since', since.isoformat(), '--format', 'csv')
+        self.assertEqual([], self.analysis.load_export(export_path, 'segment_data', 'csv'))
+        self.assertEqual(1, len(self.analysis.load_export(export_path, 'document_responses',
+                                                          'csv')))
+
+
+@skipIf(connection.vendor not in FULL_SCAN_PATTERNS, 'Query plans are not checked here')
+class QueryPlanTests(TestCase):
+    """
+    Tests that the analyses of a document and the reading view don't read whole tables
+    """
+    def setUp(self):
+        self.document = create_test_readings()
+
+    def test_full_scans_found(self):
+        """ an analysis of all of the readings does read whole tables """
+        scans = find_full_scans(lambda: RereadingAnalysis(use_aggregates=False).all_responses())
+        self.assertIn('readings_segmentquestionresponse', chain.from_iterable(scans.values()))
+
+    def test_query_plans(self):
+        """ every query of the document's analyses and reading view uses an index """
+        self.assertEqual({}, check_query_plans(self.document.id))
+
+
+class AdminTests(TestCase):
+    """
+    Tests for the admin pages of the student data
+    """
+    def setUp(self):
+        self.document = create_test_readings()
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def get_page(self, url):
+        """ gets an admin page, returning how many queries that took """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return len(queries)
+
+    def test_constant_queries(self):
+        """ the number of queries of the list pages doesn't grow with the number of rows """
+        urls = ('/admin/readings/studentreadingdata/', '/admin/readings/studentsegmentdata/')
+        query_counts = [self.get_page(url) for url in urls]
+        create_test_readings(title='Sula')
+        self.assertEqual(query_counts, [self.get_page(url) for url in urls])
+
+    def test_paginated_inline(self):
+        """ the inlines show a page of rows at a time """
+        reading = StudentReadingData.objects.get(student__name='Alice')
+        segment = Segment.objects.get(sequence=1)
+        StudentSegmentData.objects.bulk_create(
+            StudentSegmentData(reading_data=reading, segment=segment, view_time=1,
+                               is_rereading=True, scroll_data='[]')
+            for _ in range(30)
+        )
+        url = f'/admin/readings/studentreadingdata/{reading.pk}/change/'
+        response = self.client.get(url)
+        page = response.context['inline_admin_formsets'][0].formset.page
+        self.assertEqual(20, len(page.object_list))
+        self.assertEqual(33, page.paginator.count)
+        self.assertContains(response, '?studentsegmentdata_page=2')
+
+        response = self.client.get(url, {'studentsegmentdata_page': 2})
+        self.assertEqual(13, len(response.context['inline_admin_formsets'][0].formset.page))
+
+
+class AnalysisViewTests(TestCase):
+    """
+    Tests for the /api/analysis/ endpoints
+    """
+    def setUp(self):
+        get_analysis_cache().clear()
+        create_test_readings()
+        aggregates.rebuild()
+        self.client = APIClient()
+
+    def test_all_analyses(self):
+        """ with no field selection, every analysis is returned """
+        response = self.client.get('/api/analysis/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(11, len(response.data))
+
+    def test_field_selection(self):
+        """ only the requested analyses are computed """
+        with mock.patch.object(RereadingAnalysis, 'get_all_heat_maps') as get_all_heat_maps:
+            response = self.client.get(
+                '/api/analysis/?fields=compute_reread_counts,total_and_median_view_time'
+            )
+        get_all_heat_maps.assert_not_called()
+        self.assertEqual(
+            {'compute_reread_counts': [[1, 0.5]], 'total_and_median_view_time': (66, 33)},
+            response.data,
+        )
+
+    def test_single_metric(self):
+        """ each analysis has its own endpoint """
+        response = self.client.get('/api/analysis/get_number_of_segments/')
+        self.assertEqual({'get_number_of_segments': 2}, response.data)
+
+    def test_unknown_metric(self):
+        """ asking for an analysis that doesn't exist is a client error """
+        response = self.client.get('/api/analysis/?fields=get_all_heat_maps,nonsense')
+        self.assertEqual(400, response.status_code)
+        response = self.client.get('/api/analysis/nonsense/')
+        self.assertEqual(400, response.status_code)
+
+
+class ScopedAnalysisTests(TestCase):
+    """
+    Tests for analyses restricted to one document or a time window
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.document = create_test_readings()
+        cls.other_document = create_test_readings(title='Sula')
+        # the other document was read a week later
+        StudentReadingData.objects.filter(document=cls.other_document).update(
+            start_time=datetime.datetime(2020, 3, 9, tzinfo=datetime.timezone.utc),
+            last_updated_time=datetime.datetime(2020, 3, 9, 1, tzinfo=datetime.timezone.utc),
+        )
+        StudentReadingData.objects.filter(document=cls.document).update(
+            start_time=datetime.datetime(2020, 3, 2, tzinfo=datetime.timezone.utc),
+            last_updated_time=datetime.datetime(2020, 3, 2, 1, tzinfo=datetime.timezone.utc),
+        )
+
+    def test_document_scope(self):
+        """ a document's analysis only sees that document's readings """
+        for use_sql in (True, False):
+            analyzer = RereadingAnalysis(document_id=self.document.id, use_sql=use_sql)
+            self.assertFalse(analyzer.use_aggregates)
+            self.assertEqual((66, 33), analyzer.total_and_median_view_time())
+            self.assertEqual([[1, 0.5]], analyzer.compute_reread_counts())
+            self.assertEqual(2, analyzer.get_number_of_segments())
+            self.assertEqual(3, analyzer.get_number_of_unique_students())
+            self.assertEqual(['Recitatif 1', 'Recitatif 2'], list(analyzer.get_all_heat_maps()))
+            self.assertEqual([('Who is Twyla?', 3)], analyzer.relevant_words_by_question())
+
+        everything = RereadingAnalysis(use_aggregates=False)
+        self.assertEqual((131, 33), everything.total_and_median_view_time())
+        self.assertEqual(4, everything.get_number_of_segments())
+
+    def test_time_window(self):
+        """ since/until select the readings active in the window """
+        week_2 = datetime.datetime(2020, 3, 8, tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            ['Sula 1', 'Sula 2'],
+            list(RereadingAnalysis(since=week_2).get_all_heat_maps()),
+        )
+        self.assertEqual(
+            ['Recitatif 1', 'Recitatif 2'],
+            list(RereadingAnalysis(until=week_2).get_all_heat_maps()),
+        )
+        self.assertEqual(
+            0, RereadingAnalysis(document_id=self.document.id, since=week_2).reading_count
+        )
+
+    def test_same_titles(self):
+        """ documents sharing a title get separate heat maps """
+        Document.objects.filter(pk=self.other_document.pk).update(title='Recitatif')
+        heat_maps = RereadingAnalysis().get_all_heat_maps()
+        self.assertEqual(4, len(heat_maps))
+        self.assertIn(f'Recitatif ({self.other_document.id}) 1', heat_maps)
+
+    def test_api(self):
+        """ the scope comes from query parameters """
+        client = APIClient()
+        response = client.get(
+            f'/api/analysis/get_number_of_unique_students/?document={self.document.id}'
+        )
+        self.assertEqual({'get_number_of_unique_students': 3}, response.data)
+        response = client.get('/api/analysis/get_number_of_unique_students/?since=2020-03-08')
+        self.assertEqual({'get_number_of_unique_students': 3}, response.data)
+        response = client.get('/api/analysis/get_number_of_unique_students/?since=last+week')
+        self.assertEqual(400, response.status_code)
+
+    def test_cache_name(self):
+        """ equivalent scopes share a cached result, whose name is a fixed-length hash """
+        urls = (
+            '/api/analysis/?fields=compute_reread_counts,get_number_of_segments&since=2020-03-08',
+            '/api/analysis/?fields=get_number_of_segments,compute_reread_counts'
+            '&since=2020-03-08T00:00:00',
+            '/api/analysis/?fields=get_number_of_segments,compute_reread_counts',
+        )
+        with mock.patch.object(views, 'get_cached_analysis', return_value={}) as cached:
+            for url in urls:
+                APIClient().get(url)
+        names = [call[0][0] for call in cached.call_args_list]
+        self.assertEqual(names[0], names[1])
+        self.assertNotEqual(names[0], names[2])
+        self.assertRegex(names[0], r'^[0-9a-f]{64}$')
+
+
+class ParallelAnalysisTests(TransactionTestCase):
+    """
+    Tests for evaluating the analyses concurrently. The rows have to be committed
+    for the worker threads to see them, hence TransactionTestCase.
+    """
+    def setUp(self):
+        create_test_readings()
+        aggregates.rebuild()
+
+    def test_same_as_serial(self):
+        """ parallel evaluation gives the serial results """
+        names = list(AnalysisSerializer().fields)
+        for use_aggregates in (True, False):
+            serial = evaluate_analyses(RereadingAnalysis(use_aggregates=use_aggregates),
+                                       names, parallel=False)
+            # the text analyses go to threads here as well, to keep this quick
+            # (test_process_pool starts the real processes)
+            with ThreadPoolExecutor() as pool, \
+                    mock.patch.object(analysis_parallel, '_get_process_pool',
+                                      return_value=pool):
+                parallel = evaluate_analyses(RereadingAnalysis(use_aggregates=use_aggregates),
+                                             names, parallel=True)
+            self.assertEqual(names, list(parallel))
+            self.assertEqual(serial, parallel)
+
+    def test_text_analyses_share_a_worker(self):
+        """ the text analyses go to one worker, which builds a single analysis for them """
+        names = list(AnalysisSerializer().fields)
+        with ThreadPoolExecutor() as pool, \
+                mock.patch.object(analysis_parallel, '_get_process_pool', return_value=pool), \
+                mock.patch.object(pool, 'submit', wraps=pool.submit) as submit:
+            evaluate_analyses(RereadingAnalysis(use_aggregates=False), names, parallel=True)
+        submit.assert_called_once()
+        self.assertEqual(sorted(analysis_parallel.TEXT_ANALYSES), sorted(submit.call_args[0][2]))
+
+    def test_process_pool(self):
+        """
+        the worker processes read the test database, and give the serial results unless
+        the data changed under them, in which case the request evaluates them itself
+        """
+        self.addCleanup(analysis_parallel.shutdown_process_pool)
+        names = list(AnalysisSerializer().fields)
+        serial = evaluate_analyses(RereadingAnalysis(use_aggregates=False), names,
+                                   parallel=False)
+
+        analysis = RereadingAnalysis(use_aggregates=False)
+        self.assertEqual(serial, evaluate_analyses(analysis, names, parallel=True))
+        self.assertFalse(analysis.snapshot.is_loaded('text_stats'))
+
+        analysis = RereadingAnalysis(use_aggregates=False)
+        with mock.patch.object(analysis_cache, 'get_data_version', return_value='0:'):
+            self.assertEqual(serial, evaluate_analyses(analysis, names, parallel=True))
+        self.assertTrue(analysis.snapshot.is_loaded('text_stats'))
+
+    def test_worker_analysis(self):
+        """ the worker processes rebuild the request's analysis from its arguments """
+        analysis = RereadingAnalysis(document_id=1, use_sql=False)
+        rebuilt = RereadingAnalysis(**analysis.get_init_kwargs())
+        self.assertEqual(analysis.get_init_kwargs(), rebuilt.get_init_kwargs())
+
+
+class WordMatcherTests(TestCase):
+    """
+    Tests for the multi-word matcher used to find relevant words
+    """
+    def test_substrings(self):
+        """ by default, words match anywhere, case-insensitively """
+        matcher = WordMatcher(['read', 'Reread', 'hate', 'love-hate', 'READ'])
+        self.assertEqual(['read', 'Reread', 'hate', 'love-hate'], matcher.words)
+        self.assertTrue(matcher.contains_any('I REREAD it'))
+        self.assertTrue(matcher.contains_any('hateful'))
+        self.assertFalse(matcher.contains_any('nothing to see'))
+
+    def test_word_boundary(self):
+        """ with word_boundary, words only match whole words """
+        matcher = WordMatcher(['read', 'hate', 'love-hate'], word_boundary=True)
+        self.assertFalse(matcher.contains_any('reread hateful'))
+        self.assertTrue(matcher.contains_any('Read the reread'))
+        self.assertTrue(matcher.contains_any('love-hate.'))
+
+    def test_string_contains_words(self):
+        """ the matcher agrees with the substring check string_contains_words always did """
+        responses = ['The narrator has a bad memory', 'Nothing here', 'HENDRIX ', 'ageless']
+        for response in responses:
+            self.assertEqual(
+                any(word.lower() in response.lower() for word in RELEVANT_WORDS),
+                string_contains_words(response, RELEVANT_WORDS),
+            )
+        self.assertTrue(string_contains_words('anything', []))
+
+    def test_tokenize_response(self):
+        """ the single tokenizing pass agrees with the separate helpers """
+        for response in ['The narrator has a bad memory , Twyla', 'Nothing here', '']:
+            self.assertEqual(
+                (string_contains_words(response, RELEVANT_WORDS),
+                 relevant_words_in(response, RELEVANT_WORDS),
+                 content_words(response)),
+                tokenize_response(response),
+            )
+
+
+class AnalysisCacheTests(TestCase):
+    """
+    Tests for the versioned cache of analysis results
+    """
+    def setUp(self):
+        get_analysis_cache().clear()
+        self.computations = []
+
+    def compute(self):
+        """ stands in for an expensive analysis, recording how often it runs """
+        self.computations.append(StudentReadingData.objects.count())
+        return len(self.computations)
+
+    @override_settings(ANALYSIS_CACHE_REFRESH_IN_BACKGROUND=False)
+    def test_result_reused_until_data_changes(self):
+        """ a write to the reading data invalidates the cached result """
+        self.assertEqual(1, get_cached_analysis('test', self.compute))
+        self.assertEqual(1, get_cached_analysis('test', self.compute))
+
+        create_test_readings()
+        self.assertEqual(2, get_cached_analysis('test', self.compute))
+        self.assertEqual([0, 2], self.computations)
+
+    def test_stale_result_served_while_refreshing(self):
+        """ with background refreshes on, a stale result is returned immediately """
+        self.assertEqual(1, get_cached_analysis('test', lambda: 1))
+
+        create_test_readings()
+        self.assertEqual(1, get_cached_analysis('test', lambda: 2))
+        for thread in threading.enumerate():
+            if thread.name == 'analysis-refresh-test':
+                thread.join()
+        self.assertEqual(2, get_cached_analysis('test', lambda: 3))
 
 
 class PrototypeAnalysisTests(TestCase):
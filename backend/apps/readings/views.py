@@ -2,59 +2,182 @@
 These classes describe one way of entering into the web site.
 """
 
+import datetime
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.decorators import api_view
+from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework import generics
+from rest_framework import generics, status
 
-from .models import Student, Document, StudentReadingData, Writeup
+from .models import Student, Document, Segment, StudentReadingData, Writeup
 from .analysis import RereadingAnalysis
+from .analysis_cache import get_cached_analysis
+from .document_cache import get_document_payload
+from .analysis_parallel import evaluate_analyses
+from . import submission_queue
 from .serializers import (
     AnalysisSerializer,
     ReadingSerializer,
+    SegmentSerializer,
+    SegmentWindowSerializer,
     StudentReadingDataSerializer,
+    WindowedReadingSerializer,
     WriteupSerializer,
     DocumentSerializer,
+    DocumentOutlineSerializer,
 )
 
+# The most segments a client can ask for at once (see SegmentWindow)
+MAX_SEGMENT_WINDOW = 20
+
+# How many readings the /api/responses/export/ stream fetches from the database at a time
+EXPORT_CHUNK_SIZE = 100
+
 
 class Reading:
     """ Class to aggregate all of the models we need to serialize for the reading view """
-    def __init__(self, document, reading_data):
+    def __init__(self, document, reading_data, segment_window=None):
         self.document = document
         self.reading_data = reading_data
+        self.segment_window = segment_window
+
+
+class SegmentWindow:
+    """
+    Up to count consecutive segments of a document, from the one numbered from_sequence
+    on, so that clients can load a long document a few segments at a time
+    """
+    def __init__(self, document_id, from_sequence=1, count=1):
+        segments = SegmentSerializer.setup_eager_loading(
+            Segment.objects.filter(document_id=document_id, sequence__gte=from_sequence)
+        )
+        # One more than we need tells us where the next window starts
+        segments = list(segments[:count + 1])
+        self.segments = segments[:count]
+        self.next_from_sequence = segments[count].sequence if len(segments) > count else None
+        self.segment_count = (Document.objects.filter(pk=document_id)
+                              .values_list('segment_count', flat=True)
+                              .first()) or 0
+
+
+def _segment_window_params(query_params):
+    """
+    Reads the ?from_sequence= (default 1) and ?count= (default 1) parameters
+    selecting a SegmentWindow
+
+    :return: (int, int), from_sequence and count
+    :raises ValueError: on malformed values
+    """
+    from_sequence = int(query_params.get('from_sequence', 1))
+    count = int(query_params.get('count', 1))
+    if not 1 <= count <= MAX_SEGMENT_WINDOW:
+        raise ValueError(f'count must be between 1 and {MAX_SEGMENT_WINDOW}')
+    return from_sequence, count
 
 
 @api_view(['GET', 'POST'])
 def reading_view(request, pk):
     """ Primary API endpoint for the reading view -- called with the student's name
         from the view (to be written) where we collect that
+
+        GETs are served from the document cache (see document_cache.py), with an ETag,
+        so a client sending If-None-Match gets a 304 if the document hasn't changed
+
+        A POST with ?count= (and optionally ?from_sequence=) sends just that window of
+        the document's segments; the client fetches the rest from segments_view
     """
     if request.method == "GET":
-        doc = Document.objects.get(pk=pk)
-        serializer = DocumentSerializer(doc)
-        return Response(serializer.data)
+        content_hash, data = get_document_payload(pk)
+        etag = quote_etag(content_hash)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(data, content_type='application/json')
+        response['ETag'] = etag
+        # Let browsers keep the document, but check with us before using it
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    windowed = 'count' in request.query_params
+    if windowed:
+        try:
+            from_sequence, count = _segment_window_params(request.query_params)
+        except ValueError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        doc = DocumentOutlineSerializer.setup_eager_loading(Document.objects).get(pk=pk)
+    else:
+        doc = DocumentSerializer.setup_eager_loading(Document.objects).get(pk=pk)
 
     student_name = request.data.get('name')
     student = Student(name=student_name)
     student.save()
-    doc = Document.objects.get(pk=pk)
     reading_data = StudentReadingData.objects.create(document=doc,
                                                      student=student)
     reading_data.save()
-    reading = Reading(doc, reading_data)
-    serializer = ReadingSerializer(reading)
+
+    if windowed:
+        reading = Reading(doc, reading_data,
+                          segment_window=SegmentWindow(doc.id, from_sequence, count))
+        serializer = WindowedReadingSerializer(reading)
+    else:
+        serializer = ReadingSerializer(Reading(doc, reading_data))
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+def segments_view(request, pk):
+    """
+    API endpoint for a window of a document's segments, for the reading view to load them
+    as the student reads: ?from_sequence= (default 1) and ?count= (default 1) select it.
+    The Link header hints that the client prefetch the window after it.
+    """
+    try:
+        from_sequence, count = _segment_window_params(request.query_params)
+    except ValueError as error:
+        return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    window = SegmentWindow(pk, from_sequence, count)
+    response = Response(SegmentWindowSerializer(window).data)
+    if window.next_from_sequence is not None:
+        next_url = f'{request.path}?from_sequence={window.next_from_sequence}&count={count}'
+        response['Link'] = f'<{next_url}>; rel="prefetch"'
+    return response
+
+
 @api_view(['POST'])
 def add_response(request):
-    """ API endpoint for updating student reading data as the student reads """
+    """
+    API endpoint for updating student reading data as the student reads
+
+    In write-behind mode (settings.READING_DATA_WRITE_BEHIND) the data is only validated and
+    queued, to be saved by the drain_submissions command; we respond 202 with a receipt_id
+    (the client may send its own receipt_id, so that retrying a POST doesn't queue it twice).
+    """
     data = request.data
     reading_data_id = data.get('reading_data_id')
     reading_data = StudentReadingData.objects.get(pk=reading_data_id)
     serializer = StudentReadingDataSerializer(instance=reading_data, data=data)
     is_valid = serializer.is_valid()
 
+    if is_valid and settings.READING_DATA_WRITE_BEHIND:
+        try:
+            receipt_id = uuid.UUID(data['receipt_id']) if data.get('receipt_id') else None
+        except ValueError:
+            return Response({'receipt_id': 'Not a UUID'}, status=status.HTTP_400_BAD_REQUEST)
+        submission = submission_queue.enqueue(reading_data, data, receipt_id=receipt_id)
+        return Response(
+            {'receipt_id': submission.receipt_id, 'reading_data_id': reading_data.id},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
     if is_valid:
         serializer.save()
         return Response(serializer.data)
@@ -64,23 +187,167 @@ def add_response(request):
         return Response({})
 
 
+# Query parameters restricting which readings an analysis covers
+ANALYSIS_SCOPE_PARAMS = ('document', 'since', 'until')
+
+
+def _parse_analysis_time(value):
+    """
+    Parses a ?since= / ?until= value: an ISO 8601 date or datetime, in the
+    site's timezone unless it says otherwise
+
+    :raises ValueError: if value is neither
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Not a date or datetime: {value}')
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _analysis_scope(query_params):
+    """
+    Reads the ?document=, ?since= and ?until= parameters restricting an analysis
+    (see RereadingAnalysis) into keyword arguments for it
+
+    :raises ValueError: on malformed values
+    """
+    scope = {}
+    if query_params.get('document'):
+        scope['document_id'] = int(query_params['document'])
+        if scope['document_id'] < 1:
+            raise ValueError('document must be a positive id')
+    for param in ('since', 'until'):
+        if query_params.get(param):
+            scope[param] = _parse_analysis_time(query_params[param])
+    return scope
+
+
+def _analysis_cache_name(fields, scope):
+    """
+    Names the cached result of some analyses over a scope: a hash of the parsed (not the
+    raw) parameters, so that equivalent requests share a result and the name is always a
+    valid cache key
+
+    :param fields: list of AnalysisSerializer field names, or None for all of them
+    :param scope: dict, from _analysis_scope()
+    :return: str
+    """
+    normalized = (
+        sorted(set(fields)) if fields is not None else None,
+        scope.get('document_id'),
+        *(scope[param].astimezone(datetime.timezone.utc).isoformat() if param in scope else None
+          for param in ('since', 'until')),
+    )
+    return hashlib.sha256(json.dumps(normalized).encode('utf-8')).hexdigest()
+
+
+def _analysis_response(request, fields):
+    """
+    Runs (or fetches from the cache) the requested analyses and serializes them.
+    Results are cached until new reading data comes in (see analysis_cache.py).
+
+    :param fields: list of AnalysisSerializer field names, or None for all of them
+    """
+    unknown_fields = set(fields or []) - set(AnalysisSerializer().fields)
+    if unknown_fields:
+        return Response(
+            {'detail': f'Unknown analyses: {", ".join(sorted(unknown_fields))}'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        scope = _analysis_scope(request.query_params)
+    except ValueError as error:
+        return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def compute():
+        analysis_obj = RereadingAnalysis(**scope)
+        serializer = AnalysisSerializer(fields=fields)
+        results = evaluate_analyses(analysis_obj, serializer.fields)
+        return AnalysisSerializer(instance=results, fields=fields).data
+
+    return Response(get_cached_analysis(_analysis_cache_name(fields, scope), compute))
+
 
 @api_view(['GET'])
 def analysis(request):
     """
     Init a RereadingAnalysis, and serialize it to send to the frontend.
+    ?fields=name1,name2 restricts the response to (and computes only) those analyses.
+    ?document=<id>, ?since=<date> and ?until=<date> restrict the readings analysed.
     """
-    analysis_obj = RereadingAnalysis()
-    serializer = AnalysisSerializer(instance=analysis_obj)
-    return Response(serializer.data)
+    fields = request.query_params.get('fields')
+    if fields is not None:
+        fields = [field for field in fields.split(',') if field]
+    return _analysis_response(request, fields)
+
+
+@api_view(['GET'])
+def analysis_metric(request, metric):
+    """
+    Computes and serializes a single analysis, e.g. /api/analysis/get_all_heat_maps/
+    """
+    return _analysis_response(request, [metric])
+
+
+class ReadingDataPagination(CursorPagination):
+    """ Pages through reading data in the order it was created: ?cursor=, ?page_size= """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
 
 
 class ListStudentReadingData(generics.ListAPIView):
     """
-    Lists all of the reading data acquired through the project
+    Lists all of the reading data acquired through the project, a page at a time
+    (follow the 'next' link); export_student_reading_data streams all of it
     """
-    queryset = StudentReadingData.objects.all()
+    queryset = StudentReadingDataSerializer.setup_eager_loading(StudentReadingData.objects.all())
     serializer_class = StudentReadingDataSerializer
+    pagination_class = ReadingDataPagination
+
+
+def _iter_in_chunks(queryset, chunk_size):
+    """
+    Yields the rows of queryset in id order, fetching chunk_size of them (and their
+    prefetched relations) at a time
+
+    QuerySet.iterator(chunk_size=...) would skip the prefetches, so we page by id instead.
+    """
+    last_id = None
+    while True:
+        chunk = queryset.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1].id
+
+
+@api_view(['GET'])
+def export_student_reading_data(request):  # pylint: disable=unused-argument
+    """
+    Streams all of the reading data as NDJSON: one StudentReadingDataSerializer object
+    per line, in the order the readings were created. Only a chunk of the readings is held
+    in memory at once, so this works for the whole dataset.
+    """
+    queryset = StudentReadingDataSerializer.setup_eager_loading(StudentReadingData.objects.all())
+    renderer = JSONRenderer()
+    lines = (
+        renderer.render(StudentReadingDataSerializer(reading_data).data) + b'\n'
+        for reading_data in _iter_in_chunks(queryset, EXPORT_CHUNK_SIZE)
+    )
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="responses.ndjson"'
+    return response
 
 
 class WriteupListView(generics.ListAPIView):
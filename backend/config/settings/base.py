@@ -41,7 +41,7 @@ INSTALLED_APPS = [
     'webpack_loader',
 
     # our apps
-    'apps.readings',
+    'apps.readings.apps.ReadingsConfig',
 ]
 
 MIDDLEWARE = [
@@ -86,6 +86,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': DB_PATH,
+        # a file rather than in memory, so that the analysis worker processes can open it
+        # too (see apps/readings/analysis_parallel.py)
+        'TEST': {
+            'NAME': os.path.join(BACKEND_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
@@ -150,6 +155,64 @@ CORS_ORIGIN_WHITELIST = [
 ]
 
 
+# Caching
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# The 'analysis' cache holds computed /api/analysis/ results (see apps/readings/analysis_cache.py).
+# By default it lives in each process' memory; to share it between gunicorn workers, point
+# ANALYSIS_CACHE_BACKEND and ANALYSIS_CACHE_LOCATION at a shared backend, e.g.
+# django.core.cache.backends.filebased.FileBasedCache or .memcached.PyMemcacheCache
+# The 'documents' cache holds serialized documents for the reading view (see
+# apps/readings/document_cache.py). Edits in the admin only invalidate it in the process that
+# saved them, so with several workers DOCUMENT_CACHE_BACKEND should point at a shared backend
+# (production.py shares both caches between the workers through files by default).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analysis': {
+        'BACKEND': os.environ.get('ANALYSIS_CACHE_BACKEND',
+                                  'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('ANALYSIS_CACHE_LOCATION', 'rereading-analysis'),
+        'TIMEOUT': None,
+    },
+    'documents': {
+        'BACKEND': os.environ.get('DOCUMENT_CACHE_BACKEND',
+                                  'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DOCUMENT_CACHE_LOCATION', 'rereading-documents'),
+        'TIMEOUT': None,
+    },
+}
+
+# Serve out-of-date analysis results while a background thread recomputes them
+ANALYSIS_CACHE_REFRESH_IN_BACKGROUND = True
+
+# Read analyses from the running aggregates maintained on write (apps/readings/aggregates.py)
+# rather than scanning all of the reading data
+ANALYSIS_USE_AGGREGATES = True
+
+# How many of each question's most frequent relevant words the analysis shows (None for all)
+ANALYSIS_RELEVANT_WORDS_TO_SHOW = 20
+
+# Height in pixels of the segment sections the scroll heat maps count positions in.
+# The heat map aggregates are kept per section, so run `manage.py rebuild_aggregates`
+# after changing it (until then the heat maps are computed from the raw scroll data).
+ANALYSIS_HEAT_MAP_BUCKET_SIZE = 500
+
+# Evaluate the analyses of a request concurrently (see apps/readings/analysis_parallel.py)
+# when the ANALYSIS_PARALLEL environment variable is 1. Off by default: every gunicorn
+# worker would start its own pool of processes, and the text analyses only gain from them
+# when they scan a large number of responses (with the running aggregates, they don't)
+ANALYSIS_PARALLEL = os.environ.get('ANALYSIS_PARALLEL', '0') == '1'
+
+# Number of worker processes each gunicorn worker starts for the text analyses
+ANALYSIS_PROCESSES = 2
+
+
+# Queue the reading data students submit, to be saved by `manage.py drain_submissions`,
+# instead of saving it before responding (see apps/readings/submission_queue.py)
+READING_DATA_WRITE_BEHIND = os.environ.get('READING_DATA_WRITE_BEHIND', '0') == '1'
+
+
 # Django webpack loader settings
 WEBPACK_LOADER = {
     'DEFAULT': {
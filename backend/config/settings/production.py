@@ -18,5 +18,20 @@ ALLOWED_HOSTS = [
     'rereading.dhmit.xyz',
 ]
 
-
-
+# Share analysis results between the gunicorn workers (see deploy/gunicorn_start)
+CACHES['analysis'] = {
+    'BACKEND': os.environ.get('ANALYSIS_CACHE_BACKEND',
+                              'django.core.cache.backends.filebased.FileBasedCache'),
+    'LOCATION': os.environ.get('ANALYSIS_CACHE_LOCATION',
+                               os.path.join(PROJECT_ROOT, 'cache', 'analysis')),
+    'TIMEOUT': None,
+}
+
+# ... and the serialized documents, so that an admin edit invalidates them in every worker
+CACHES['documents'] = {
+    'BACKEND': os.environ.get('DOCUMENT_CACHE_BACKEND',
+                              'django.core.cache.backends.filebased.FileBasedCache'),
+    'LOCATION': os.environ.get('DOCUMENT_CACHE_LOCATION',
+                               os.path.join(PROJECT_ROOT, 'cache', 'documents')),
+    'TIMEOUT': None,
+}
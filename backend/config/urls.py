@@ -30,8 +30,11 @@ urlpatterns = [
     # API endpoints
     path('api/add-response/', readings_views.add_response),
     path('api/documents/<int:pk>/', readings_views.reading_view),
+    path('api/documents/<int:pk>/segments/', readings_views.segments_view),
     path('api/analysis/', readings_views.analysis),
+    path('api/analysis/<str:metric>/', readings_views.analysis_metric),
     path('api/responses/', readings_views.ListStudentReadingData.as_view()),
+    path('api/responses/export/', readings_views.export_student_reading_data),
     path('api/writeups/', readings_views.WriteupListView.as_view()),
 
     # React views
@@ -25,6 +25,21 @@ export function getCookie(name) {
     return cookieValue;
 }
 
+/**
+ * Returns a random (version 4) UUID. We tag the data we submit with one, so that the backend
+ * can tell a resubmission of the same data from new data.
+ */
+export function makeEventId() {
+    const bytes = new Uint8Array(16);
+    window.crypto.getRandomValues(bytes);
+    bytes[6] = (bytes[6] & 0x0f) | 0x40;  // version 4
+    bytes[8] = (bytes[8] & 0x3f) | 0x80;  // RFC 4122 variant
+    const hex = Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+    return [
+        hex.slice(0, 8), hex.slice(8, 12), hex.slice(12, 16), hex.slice(16, 20), hex.slice(20),
+    ].join('-');
+}
+
 /**
  * This is used as a helper function for keeping track of
  * how long a user has been looking at a story
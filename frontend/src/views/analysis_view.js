@@ -130,6 +130,16 @@ TimeAnalysis.propTypes = {
     round_digits: PropTypes.number,
 };
 
+/**
+ * The height of a heat map section, e.g. 500 for "500 — 1000"
+ * (the backend's ANALYSIS_HEAT_MAP_BUCKET_SIZE).
+ * @param scroll_range: a scroll range
+ */
+const section_height = (scroll_range) => {
+    const [start, end] = scroll_range.split(" — ");
+    return parseInt(end) - parseInt(start);
+};
+
 const scroll_range_sort = (a, b) => {
     const a_ranges = a.split(" — ");
     const b_ranges = b.split(" — ");
@@ -149,7 +159,7 @@ const simplify_scroll_range = (scroll_ranges, heat_map) => {
     const simplified_scroll_ranges = [];
     for (let i = 0; i < scroll_ranges.length; i++){
         const scroll_end = parseInt(scroll_ranges[i].split(" — ")[1]);
-        if (scroll_end === prev_scroll + 500) {
+        if (scroll_end === prev_scroll + section_height(scroll_ranges[i])) {
             prev_scroll = scroll_end;
             simplified_scroll_ranges.push(scroll_ranges[i]);
         }
@@ -319,8 +329,8 @@ class HeatMapSegment extends React.Component {
         const scroll_ranges = Object.keys(heat_data);
         scroll_ranges.sort(scroll_range_sort);
         const max_scroll_range = scroll_ranges[scroll_ranges.length - 1];
-        const height = 500 - (parseInt(max_scroll_range.split(" — ")[1]) -
-            segment_height);
+        const height = section_height(max_scroll_range) -
+            (parseInt(max_scroll_range.split(" — ")[1]) - segment_height);
         if (this.state.finalHeight !== height) {
             this.setState({finalHeight: height});
         }
@@ -374,7 +384,7 @@ class HeatMapSegment extends React.Component {
                                     position: "absolute",
                                     height: heat.range === max_scroll_range ?
                                         this.state.finalHeight + "px" :
-                                        "500px",
+                                        section_height(heat.range) + "px",
                                     width: "593px",
                                     top: heat.start + "px",
                                     backgroundColor: "rgba(255, 0, 0," + heat.percentage + ")",
@@ -485,51 +495,227 @@ AllResponsesTable.propTypes = {
     title: PropTypes.string,
 };
 
+// The analyses each tab of the AnalysisView needs; a tab only asks the backend for these,
+// so opening one tab never computes another tab's analyses
+const TAB_ANALYSES = {
+    "Time Data": [
+        "total_and_median_view_time",
+        "mean_reading_vs_rereading_time",
+        "get_number_of_unique_students",
+        "compute_reread_counts",
+    ],
+    "Heat Map": ["get_all_heat_maps"],
+    "Relevant Words": [
+        "relevant_words_percent_display_question",
+        "percent_using_relevant_words_by_question",
+        "relevant_words_by_question",
+    ],
+    "Top Words": ["most_common_words_by_question"],
+    "student responses": ["all_responses"],
+};
+
 export class AnalysisView extends React.Component {
     constructor(props) {
         super(props);
         this.state = {
-            // we initialize analysis to null, so we can check in render() whether
-            // we've received a response from the server yet
-            analysis: null,
+            // analyses received from the server so far, keyed by name; we check in render()
+            // whether the current tab's analyses have arrived yet
+            analysis: {},
+            active_tab: "Time Data",
             document: null,
         };
+        this.selectTab = this.selectTab.bind(this);
     }
 
 
     /**
      * This function is fired once this component has loaded into the DOM.
-     * We send a request to the backend for the analysis data.
+     * We send a request to the backend for the first tab's analysis data.
      */
-    async componentDidMount() {
+    componentDidMount() {
+        this.loadTab(this.state.active_tab);
+    }
+
+    /**
+     * Requests the analyses the given tab needs, unless we already have them
+     */
+    async loadTab(tab) {
+        const fields = TAB_ANALYSES[tab].filter((field) => !(field in this.state.analysis));
+        if (fields.length === 0) {
+            return;
+        }
         try {
-            const response = await fetch('/api/analysis/');
+            const response = await fetch('/api/analysis/?fields=' + fields.join(','));
             const analysis = await response.json();
-            this.setState({analysis});
+            this.setState((state) => ({analysis: {...state.analysis, ...analysis}}));
         } catch (e) {
             // For now, just log errors to the console.
             console.log(e);
         }
     }
 
-    render() {
-        if (this.state.analysis === null) {
-            return <Spinner />;
-        }
+    selectTab(tab) {
+        this.setState({active_tab: tab});
+        this.loadTab(tab);
+    }
 
+    tabIsLoaded(tab) {
+        return TAB_ANALYSES[tab].every((field) => field in this.state.analysis);
+    }
+
+    renderTimeData() {
         const { // object destructuring:
             total_and_median_view_time,
             mean_reading_vs_rereading_time,
             get_number_of_unique_students,
             compute_reread_counts,
+        } = this.state.analysis;
+
+        return (
+            <>
+                <TimeAnalysis
+                    header={"Total view time"}
+                    time_in_seconds={total_and_median_view_time[0]}
+                />
+                <TimeAnalysis
+                    header={"Median view time"}
+                    time_in_seconds={total_and_median_view_time[1]}
+                />
+                <TimeAnalysis
+                    header={"Mean reading view time"}
+                    time_in_seconds={mean_reading_vs_rereading_time[0]}
+                />
+                <TimeAnalysis
+                    header={"Mean rereading view time"}
+                    time_in_seconds={mean_reading_vs_rereading_time[1]}
+                />
+                <SingleValueAnalysis
+                    header={"Number of Unique Students"}
+                    value={get_number_of_unique_students}
+                    unit={"students"}
+                />
+                <RereadCountTable
+                    compute_reread_counts={compute_reread_counts}
+                />
+            </>
+        );
+    }
+
+    renderHeatMap() {
+        return (
+            <HeatMapAnalysis
+                data={this.state.analysis.get_all_heat_maps}
+            />
+        );
+    }
+
+    renderRelevantWords() {
+        const {
             relevant_words_by_question,
             percent_using_relevant_words_by_question,
-            get_all_heat_maps,
-            all_responses,
-            most_common_words_by_question,
             relevant_words_percent_display_question
         } = this.state.analysis;
 
+        return (
+            <>
+                <TabularAnalysis
+                    title = {
+                        "Percentage and Frequency of Relevant Words per Question"
+                    }
+                    subtitle = {
+                        "The following table displays the percentage of the" +
+                        " responses that use the relevant words defined by" +
+                        " Professor Alexandre, the total number of responses" +
+                        " with at least one relevant word, and the frequencies" +
+                        " of the relevant words per question by occurrences." +
+                        "Here are the relevant words:\"stereotypes\", \"bias\", " +
+                        "\"assumptions\", \"assume\", \"narrator\", \"memory\",\n" +
+                        "\"forget\", \"Twyla\", \"Maggie\", \"Roberta\", " +
+                        "\"black\", " + "" + "\"white\", \"prejudice\",\n" +
+                        "\"mothers\", \"segregation\", \"hate\", \"hatred\", " +
+                        "\"love\", \"love-hate\",\n" +
+                        "\"remember\", \"children\", \"recall\", \"kick\", " +
+                        "\"truth\"," + " \"dance\", \"sick\",\n" +
+                        "\"fade\", \"old\", \"Mary\", \"sandy\", \"race\", " +
+                        "\"racial\", \"racism\",\n" +
+                        "\"colorblind\", \"disabled\", \"marginalized\", " +
+                        "\"poor\"," + "" + "\"rich\", \"wealthy\",\n" +
+                        "\"middle-class\", \"working-class\", \"consumers\", " +
+                        "\"shopping\", \"read\",\n" +
+                        "\"misread\", \"reread\", \"reconsider\", \"confuse\", " +
+                        "\"wrong\", \"mistaken\",\n" +
+                        "\"regret\", \"mute\", \"voiceless\", \"women\", \"age\"," +
+                        "" + "\"bird\", \"time\", \"scene\",\n" +
+                        "\"setting\", \"Hendrix \", \"universal\", \"binary\", " +
+                        "\"deconstruct\",\n" +
+                        "\"question\", \"wrong\", \"right\", \"incorrect\", " +
+                        "\"false\", \"claims\", \"true\",\n" +
+                        "\"truth\", \"unknown\", \"ambiguous\", \"unclear\""
+                    }
+                    headers={[
+                        "Question",
+                        "Percentage",
+                        "Total Number of Responses with At Least One Relevant" +
+                        " Word",
+                        "Relevant Word Frequency Per Question"
+                    ]}
+                    data={relevant_words_percent_display_question}
+                />
+                <RelevantWordPercentages
+                    words={percent_using_relevant_words_by_question[0]}
+                    entryData={percent_using_relevant_words_by_question[1]}
+                />
+                <RelevantWordsByQuestions
+                    relevant_words_by_question={relevant_words_by_question}
+                />
+            </>
+        );
+    }
+
+    renderTopWords() {
+        return (
+            <TabularAnalysis
+                title="Top Words by Question"
+                subtitle={
+                    "This function finds the most common words used in "
+                    + "student responses to a specific question."
+                }
+                headers={[
+                    "Segment Number",
+                    "Question Number",
+                    "Question Text",
+                    "Top Words"
+                ]}
+                data={this.state.analysis.most_common_words_by_question}
+            />
+        );
+    }
+
+    renderAllResponses() {
+        return (
+            <AllResponsesTable
+                title="All Student Responses"
+                headers={[
+                    "Question Number",
+                    "Question Text",
+                    "Response and Evidence",
+                ]}
+                data={this.state.analysis.all_responses}
+            />
+        );
+    }
+
+    renderTab(tab, render_contents) {
+        if (this.state.active_tab !== tab) {
+            return null;
+        }
+        if (!this.tabIsLoaded(tab)) {
+            return <Spinner />;
+        }
+        return render_contents();
+    }
+
+    render() {
         return (
             <>
                 <div className={"container"}>
@@ -539,116 +725,29 @@ export class AnalysisView extends React.Component {
                     >Analysis of Student Responses</h1>
                     <div className={"analysis-container"}>
 
-                        <Tabs defaultActiveKey="Time Data" className="tabs">
+                        <Tabs
+                            activeKey={this.state.active_tab}
+                            onSelect={this.selectTab}
+                            className="tabs"
+                        >
                             <Tab eventKey="Time Data" title="Time Data" className="tab">
-                                <TimeAnalysis
-                                    header={"Total view time"}
-                                    time_in_seconds={total_and_median_view_time[0]}
-                                />
-                                <TimeAnalysis
-                                    header={"Median view time"}
-                                    time_in_seconds={total_and_median_view_time[1]}
-                                />
-                                <TimeAnalysis
-                                    header={"Mean reading view time"}
-                                    time_in_seconds={mean_reading_vs_rereading_time[0]}
-                                />
-                                <TimeAnalysis
-                                    header={"Mean rereading view time"}
-                                    time_in_seconds={mean_reading_vs_rereading_time[1]}
-                                />
-                                <SingleValueAnalysis
-                                    header={"Number of Unique Students"}
-                                    value={get_number_of_unique_students}
-                                    unit={"students"}
-                                />
-                                <RereadCountTable
-                                    compute_reread_counts={compute_reread_counts}
-                                />
+                                {this.renderTab("Time Data", () => this.renderTimeData())}
                             </Tab>
                             <Tab eventKey="Heat Map" title="Heat Map">
-                                <HeatMapAnalysis
-                                    data={get_all_heat_maps}
-                                />
+                                {this.renderTab("Heat Map", () => this.renderHeatMap())}
                             </Tab>
                             <Tab eventKey="Relevant Words" title="Relevant Words">
-                                <TabularAnalysis
-                                    title = {
-                                        "Percentage and Frequency of Relevant Words per Question"
-                                    }
-                                    subtitle = {
-                                        "The following table displays the percentage of the" +
-                                        " responses that use the relevant words defined by" +
-                                        " Professor Alexandre, the total number of responses" +
-                                        " with at least one relevant word, and the frequencies" +
-                                        " of the relevant words per question by occurrences." +
-                                        "Here are the relevant words:\"stereotypes\", \"bias\", " +
-                                        "\"assumptions\", \"assume\", \"narrator\", \"memory\",\n" +
-                                        "\"forget\", \"Twyla\", \"Maggie\", \"Roberta\", " +
-                                        "\"black\", " + "" + "\"white\", \"prejudice\",\n" +
-                                        "\"mothers\", \"segregation\", \"hate\", \"hatred\", " +
-                                        "\"love\", \"love-hate\",\n" +
-                                        "\"remember\", \"children\", \"recall\", \"kick\", " +
-                                        "\"truth\"," + " \"dance\", \"sick\",\n" +
-                                        "\"fade\", \"old\", \"Mary\", \"sandy\", \"race\", " +
-                                        "\"racial\", \"racism\",\n" +
-                                        "\"colorblind\", \"disabled\", \"marginalized\", " +
-                                        "\"poor\"," + "" + "\"rich\", \"wealthy\",\n" +
-                                        "\"middle-class\", \"working-class\", \"consumers\", " +
-                                        "\"shopping\", \"read\",\n" +
-                                        "\"misread\", \"reread\", \"reconsider\", \"confuse\", " +
-                                        "\"wrong\", \"mistaken\",\n" +
-                                        "\"regret\", \"mute\", \"voiceless\", \"women\", \"age\"," +
-                                        "" + "\"bird\", \"time\", \"scene\",\n" +
-                                        "\"setting\", \"Hendrix \", \"universal\", \"binary\", " +
-                                        "\"deconstruct\",\n" +
-                                        "\"question\", \"wrong\", \"right\", \"incorrect\", " +
-                                        "\"false\", \"claims\", \"true\",\n" +
-                                        "\"truth\", \"unknown\", \"ambiguous\", \"unclear\""
-                                    }
-                                    headers={[
-                                        "Question",
-                                        "Percentage",
-                                        "Total Number of Responses with At Least One Relevant" +
-                                        " Word",
-                                        "Relevant Word Frequency Per Question"
-                                    ]}
-                                    data={relevant_words_percent_display_question}
-                                />
-                                <RelevantWordPercentages
-                                    words={percent_using_relevant_words_by_question[0]}
-                                    entryData={percent_using_relevant_words_by_question[1]}
-                                />
-                                <RelevantWordsByQuestions
-                                    relevant_words_by_question={relevant_words_by_question}
-                                />
+                                {this.renderTab(
+                                    "Relevant Words", () => this.renderRelevantWords()
+                                )}
                             </Tab>
                             <Tab eventKey="Top Words" title="Top Words">
-                                <TabularAnalysis
-                                    title="Top Words by Question"
-                                    subtitle={
-                                        "This function finds the most common words used in "
-                                        + "student responses to a specific question."
-                                    }
-                                    headers={[
-                                        "Segment Number",
-                                        "Question Number",
-                                        "Question Text",
-                                        "Top Words"
-                                    ]}
-                                    data={most_common_words_by_question}
-                                />
+                                {this.renderTab("Top Words", () => this.renderTopWords())}
                             </Tab>
                             <Tab eventKey="student responses" title="All Responses">
-                                <AllResponsesTable
-                                    title="All Student Responses"
-                                    headers={[
-                                        "Question Number",
-                                        "Question Text",
-                                        "Response and Evidence",
-                                    ]}
-                                    data={all_responses}
-                                />
+                                {this.renderTab(
+                                    "student responses", () => this.renderAllResponses()
+                                )}
                             </Tab>
                         </Tabs>
                     </div>
@@ -1,7 +1,7 @@
 import React from "react";
 import PropTypes from 'prop-types';
 
-import {getCookie, TimeIt} from "../common";
+import {getCookie, makeEventId, TimeIt} from "../common";
 
 // enum representing which view to show in reading view
 const VIEWS = {
@@ -10,6 +10,9 @@ const VIEWS = {
     OVERVIEW: 2,
 };
 
+// How many segments to fetch at a time: we keep one segment ahead of the student
+const SEGMENT_WINDOW = 1;
+
 /*
  * Represents the actual Segment window
  */
@@ -129,7 +132,7 @@ Question.propTypes = {
 class NavBar extends React.Component {
     render() {
         const on_last_segment_and_rereading =
-            this.props.segment_num === this.props.document_segments.length - 1
+            this.props.segment_num === this.props.segment_count - 1
             && this.props.rereading;
 
         return (
@@ -161,7 +164,7 @@ class NavBar extends React.Component {
     }
 }
 NavBar.propTypes = {
-    document_segments: PropTypes.array,
+    segment_count: PropTypes.number,
     segment_num: PropTypes.number,
     rereading: PropTypes.bool,
     prevSegment: PropTypes.func,
@@ -328,10 +331,13 @@ export class ReadingView extends React.Component {
             student_name: "",
             segment_num: 0,
             timer: null,
+            segment_event_id: null,
             scroll_top: 0,
             segments_viewed: [0],
             rereading: false,  // we alternate reading and rereading
             document: null,
+            segment_count: 0,
+            next_from_sequence: null,  // where the next window of segments starts, if any
             reading_data: null,
             interval_timer: null,
             segmentQuestionNum: 0,
@@ -345,6 +351,7 @@ export class ReadingView extends React.Component {
             current_selection: '',
         };
         this.scroll_data = [];
+        this.segments_loading = null;  // the fetch of the next window of segments, if any
         this.csrftoken = getCookie('csrftoken');
 
         this.segment_ref = React.createRef();
@@ -362,7 +369,8 @@ export class ReadingView extends React.Component {
     async startReading() {
         try {
             // Hard code the document we know exists for now -- generalize later...
-            const url = '/api/documents/1/';
+            // We only ask for the first segment here, and fetch the rest as the student reads
+            const url = `/api/documents/1/?count=${SEGMENT_WINDOW}`;
             const data = {
                 name: this.state.student_name,
             };
@@ -375,21 +383,57 @@ export class ReadingView extends React.Component {
                 }
             });
             const response_json = await response.json();
-            const document = response_json.document;
+            const segment_window = response_json.segment_window;
+            const document = {
+                ...response_json.document,
+                segments: segment_window.segments,
+            };
             const reading_data = response_json.reading_data;
             const interval_timer = setInterval(() => this.recordScroll(), 1000);
             this.setState({
                 document,
+                segment_count: segment_window.segment_count,
+                next_from_sequence: segment_window.next_from_sequence,
                 interval_timer,
                 reading_data,
                 current_view: VIEWS.READING,
             });
             this.sendData(true);
+            this.loadNextSegments();
         } catch (e) {
             console.log(e);
         }
     }
 
+    /**
+     * Fetches the next window of segments, if there is one we haven't fetched yet
+     * @returns {Promise} resolved once they're in this.state.document.segments
+     */
+    loadNextSegments() {
+        if (this.segments_loading) {
+            return this.segments_loading;
+        }
+        if (this.state.next_from_sequence === null) {
+            return Promise.resolve();
+        }
+        const url = '/api/documents/1/segments/'
+            + `?from_sequence=${this.state.next_from_sequence}&count=${SEGMENT_WINDOW}`;
+        this.segments_loading = fetch(url)
+            .then((response) => response.json())
+            .then((segment_window) => new Promise((resolve) => {
+                this.setState((state) => ({
+                    document: {
+                        ...state.document,
+                        segments: state.document.segments.concat(segment_window.segments),
+                    },
+                    next_from_sequence: segment_window.next_from_sequence,
+                }), resolve);
+            }))
+            .catch((e) => console.log(e))
+            .finally(() => { this.segments_loading = null; });
+        return this.segments_loading;
+    }
+
     async sendData(firstTime){
         if (!firstTime) {
             const time = this.state.timer.stop();
@@ -398,6 +442,7 @@ export class ReadingView extends React.Component {
                 reading_data_id: this.state.reading_data.id,
                 segment_data: [{
                     id: this.state.document.segments[this.state.segment_num].id,
+                    event_id: this.state.segment_event_id,
                     scroll_data: JSON.stringify(this.scroll_data),
                     view_time: time,
                     is_rereading: this.state.rereading,
@@ -413,12 +458,27 @@ export class ReadingView extends React.Component {
                     'X-CSRFToken': this.csrftoken,
                 }
             });
-            const new_reading_data = await response.json();
+            let new_reading_data = await response.json();
+            if (response.status === 202) {
+                // The server queued our data to save later (write-behind mode) and only sent
+                // back a receipt, so add what we sent to our own copy of the reading data
+                const queued_segment_data = reading_data.segment_data.map((datum) => ({
+                    ...datum,
+                    segment_responses: datum.segment_responses.map(
+                        (segment_response) => ({...segment_response, question: segment_response.id})
+                    ),
+                }));
+                new_reading_data = {
+                    ...this.state.reading_data,
+                    segment_data: this.state.reading_data.segment_data.concat(queued_segment_data),
+                };
+            }
             this.scroll_data = [];
             this.setState({reading_data: new_reading_data});
         }
+        // Each visit to a segment is one event: sending it again must not record another visit
         const timer = new TimeIt();
-        this.setState({timer});
+        this.setState({timer, segment_event_id: makeEventId()});
     }
 
     recordScroll() {
@@ -460,6 +520,11 @@ export class ReadingView extends React.Component {
         // Add a new response object if there isn't one already
         if (response === null) {
             response = {id: question_id};
+            if (is_document_question) {
+                // We resend all document responses with every segment, so the backend uses
+                // this to update the response it already has rather than add another one
+                response.event_id = makeEventId();
+            }
             responseArray.push(response);
         }
 
@@ -565,9 +630,18 @@ export class ReadingView extends React.Component {
         return true;
     }
 
-    gotoSegment(target_segment_num) {
+    async gotoSegment(target_segment_num) {
         if (!this.validateData()) { return; }
 
+        // Normally we've prefetched the segment already; if not, wait for it
+        if (target_segment_num >= this.state.document.segments.length) {
+            await this.loadNextSegments();
+            if (target_segment_num >= this.state.document.segments.length) {
+                alert('Sorry, the next segment could not be loaded. Please try again.');
+                return;
+            }
+        }
+
         this.sendData(false);
         this.segment_ref.current.scrollTo(0,0);
         const segments_viewed = this.state.segments_viewed.slice();
@@ -584,6 +658,11 @@ export class ReadingView extends React.Component {
             segment_num: target_segment_num,
             segmentQuestionNum: 0,
             segmentResponseArray,
+        }, () => {
+            // Stay a segment ahead of the student
+            if (target_segment_num + 1 >= this.state.document.segments.length) {
+                this.loadNextSegments();
+            }
         });
     }
 
@@ -752,7 +831,7 @@ export class ReadingView extends React.Component {
                                 {this.state.rereading && segment_response_fields}
                                 {this.state.rereading && document_response_fields}
                                 <NavBar
-                                    document_segments={doc.segments}
+                                    segment_count={this.state.segment_count}
                                     segment_num={this.state.segment_num}
                                     rereading={this.state.rereading}
                                     prevSegment={this.prevSegment}